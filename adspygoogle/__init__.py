@@ -24,5 +24,6 @@ except ImportError:
   pass
 try:
   from adspygoogle.dfp.DfpClient import DfpClient
+  from adspygoogle.dfp.DfpClientPool import DfpClientPool
 except ImportError:
   pass
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Non-blocking front-end for the operations of an API service."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import threading
+
+from adspygoogle.common.CallExecutor import CallExecutor
+from adspygoogle.common.CallExecutor import DEFAULT_MAX_WORKERS
+
+
+class AsyncApiService(object):
+
+  """Wraps an API service so that its operations return Future objects.
+
+  Operations are looked up on the wrapped service, so they are the same WSDL
+  operations, with the same arguments, as on the service itself. Instead of
+  blocking until the response arrives, each call is handed to a CallExecutor
+  and a Future is returned right away. Several AsyncApiService objects can
+  share an executor, so that a few threads serve the calls of many services.
+
+  Calls do not wait on the lock of the wrapped service's client, whatever the
+  'concurrent' config value, but at most max_workers of them run at the same
+  time.
+  """
+
+  def __init__(self, service, executor=None,
+               max_workers=DEFAULT_MAX_WORKERS):
+    """Inits AsyncApiService.
+
+    Args:
+      service: GenericApiService The service to make calls through.
+      [optional]
+      executor: CallExecutor The executor to run calls on. By default, this
+                object gets an executor of its own, shut down by Close().
+      max_workers: int Maximum number of this object's calls to run at the
+                   same time.
+    """
+    self._service = service.CopyWithLock(threading.Semaphore(max_workers))
+    self._owns_executor = executor is None
+    if executor is None:
+      executor = CallExecutor(max_workers)
+    self._executor = executor
+    self._method_proxies = {}
+
+  def __getattr__(self, name):
+    """Takes an attribute name and creates a non-blocking SOAP call proxy.
+
+    Args:
+      name: string The name of the attribute to fetch. This should be the name
+            of an operation/method in the SOAP service this object wraps.
+
+    Returns:
+      function A function which takes the same arguments as the operation and
+      returns a Future holding its response.
+
+    Raises:
+      AttributeError: if the given attribute name cannot be found in the
+      wrapped SOAP service.
+    """
+    if name.startswith('_'):
+      raise AttributeError(name)
+    if name not in self._method_proxies:
+      method = getattr(self._service, name)
+
+      def CallMethodAsync(*args):
+        """Start a SOAP call and return a Future holding its response."""
+        return self._executor.Submit(method, *args)
+      self._method_proxies[name] = CallMethodAsync
+    return self._method_proxies[name]
+
+  def Close(self, wait=True):
+    """Stops accepting calls, if this object owns its executor.
+
+    Args:
+      [optional]
+      wait: bool Whether to wait for the calls already started to complete.
+    """
+    if self._owns_executor:
+      self._executor.Shutdown(wait)
@@ -0,0 +1,234 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Writes log messages to their files from a background thread."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import atexit
+import itertools
+import Queue
+import threading
+import time
+import traceback
+import weakref
+
+from adspygoogle.common.Errors import InvalidInputError
+from adspygoogle.common.Logger import Logger
+
+
+# Default maximum number of messages waiting to be written.
+DEFAULT_MAX_QUEUE_SIZE = 1000
+# Default maximum number of messages written to a file at once.
+DEFAULT_MAX_BATCH_SIZE = 100
+
+# What Log does when the queue is full: wait for room, or drop the message.
+BLOCK = 'block'
+DROP = 'drop'
+
+# Writers whose pending messages are written out when the process exits.
+_WRITERS = weakref.WeakKeyDictionary()
+
+
+class AsyncLogWriter(object):
+
+  """Queues log messages and writes them to their files from another thread.
+
+  Has the same Log method as Logger, which it wraps. A message logged to a
+  file only is put on a bounded queue, as a function returning its text if
+  it is one, and Log returns right away. A writer thread builds the text of
+  each message, for example pretty-printing the SOAP XML of a call, and
+  writes the messages waiting for the same log in one batch, flushing the
+  file once. Messages also logged to the console are written right away, so
+  that debugging output is not delayed.
+
+  When the queue is full, Log either waits for room or drops the message,
+  depending on the policy.
+  """
+
+  def __init__(self, logger, max_queue_size=DEFAULT_MAX_QUEUE_SIZE,
+               policy=BLOCK, max_batch_size=DEFAULT_MAX_BATCH_SIZE):
+    """Inits AsyncLogWriter.
+
+    Args:
+      logger: Logger Logger to write the messages with.
+      [optional]
+      max_queue_size: int Maximum number of messages waiting to be written.
+      policy: str What to do with a message when the queue is full, either
+              BLOCK or DROP.
+      max_batch_size: int Maximum number of messages written to a file at once.
+
+    Raises:
+      InvalidInputError: if the policy is neither BLOCK nor DROP.
+    """
+    if policy not in (BLOCK, DROP):
+      raise InvalidInputError('Invalid log queue policy \'%s\', expecting one '
+                              'of %s.' % (policy, [BLOCK, DROP]))
+    self._logger = logger
+    self._policy = policy
+    self._max_batch_size = max_batch_size
+    self._queue = Queue.Queue(max_queue_size)
+    self._dropped = 0
+    self._lock = threading.Lock()
+    self._thread = None
+
+  def Log(self, log_name, message, log_level=Logger.NOTSET,
+          log_handler=Logger.FILE):
+    """Queues a message to be written to a log file.
+
+    Args:
+      log_name: str Name of the log. If the log is handled by an external
+                file, this will be the file name appended by log.
+      message: str|function Message to log, or a function returning it or
+               None if there is nothing to log.
+      [optional]
+      log_level: int Level of importance of the current message.
+      log_handler: int Type of log handler. Should be one of NONE, FILE,
+                   CONSOLE, or FILE_AND_CONSOLE. Only messages logged to FILE
+                   are queued.
+    """
+    if log_handler != Logger.FILE:
+      self._logger.Log(log_name, message, log_level, log_handler)
+      return
+
+    self.__Start()
+    record = (log_name, message, log_level, time.time())
+    if self._policy == DROP:
+      try:
+        self._queue.put_nowait(record)
+      except Queue.Full:
+        self._lock.acquire()
+        try:
+          self._dropped += 1
+        finally:
+          self._lock.release()
+    else:
+      self._queue.put(record)
+
+  def Flush(self):
+    """Waits until every message queued so far has been written."""
+    self._queue.join()
+
+  def GetDroppedCount(self):
+    """Returns the number of messages dropped because the queue was full.
+
+    Returns:
+      int Number of dropped messages.
+    """
+    return self._dropped
+
+  def __Start(self):
+    """Starts the writer thread, unless it is running already."""
+    if self._thread is not None:
+      return
+    self._lock.acquire()
+    try:
+      if self._thread is None:
+        # Wake the thread up when the writer is garbage collected, so that it
+        # stops.
+        queue = self._queue
+        writer_ref = weakref.ref(self, lambda unused_ref: _Wake(queue))
+        thread = threading.Thread(target=_Write, args=(writer_ref, queue,
+                                                       self._max_batch_size))
+        thread.setDaemon(True)
+        thread.start()
+        _WRITERS[self] = True
+        self._thread = thread
+    finally:
+      self._lock.release()
+
+  def _WriteBatch(self, batch):
+    """Builds the text of a batch of messages and writes it.
+
+    Consecutive messages for the same log at the same level are written
+    together.
+
+    Args:
+      batch: list (log name, message, log level, time logged) tuples.
+    """
+    for (log_name, log_level), records in itertools.groupby(
+        batch, lambda record: (record[0], record[2])):
+      messages = []
+      for unused_name, message, unused_level, created in records:
+        try:
+          if callable(message):
+            message = message()
+        except Exception:
+          traceback.print_exc()
+          continue
+        if message is not None:
+          messages.append((message, created))
+      if messages:
+        try:
+          self._logger.LogBatch(log_name, messages, log_level)
+        except Exception:
+          traceback.print_exc()
+
+
+def _Write(writer_ref, queue, max_batch_size):
+  """Writes the messages of a writer's queue as they come in.
+
+  Holds only a weak reference to the writer, so that the writer can be
+  garbage collected while its thread waits for messages. The thread stops
+  once the writer is gone.
+
+  Args:
+    writer_ref: weakref.ref Reference to the AsyncLogWriter.
+    queue: Queue.Queue The writer's queue.
+    max_batch_size: int Maximum number of messages written at once.
+  """
+  # Module globals are gone when the interpreter shuts down, while this daemon
+  # thread may still be running.
+  empty = Queue.Empty
+  while True:
+    batch = [queue.get()]
+    while len(batch) < max_batch_size:
+      try:
+        batch.append(queue.get_nowait())
+      except empty:
+        break
+    writer = writer_ref()
+    try:
+      if writer is not None:
+        writer._WriteBatch([record for record in batch if record is not None])
+    finally:
+      del writer
+      for _ in batch:
+        queue.task_done()
+    if writer_ref() is None:
+      return
+
+
+def _Wake(queue):
+  """Wakes a writer thread up, if it waits for messages.
+
+  Args:
+    queue: Queue.Queue The queue the thread reads from.
+  """
+  try:
+    queue.put_nowait(None)
+  except Queue.Full:
+    # The thread is busy writing, and will notice that its writer is gone.
+    pass
+
+
+def _FlushAll():
+  """Writes out the pending messages of every writer, at exit."""
+  for writer in _WRITERS.keys():
+    writer.Flush()
+
+
+atexit.register(_FlushAll)
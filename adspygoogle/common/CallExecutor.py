@@ -0,0 +1,242 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bounded pool of worker threads running independent API calls."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import Queue
+import sys
+import threading
+
+from adspygoogle.common.Errors import Error
+
+
+# Default number of worker threads of a CallExecutor.
+DEFAULT_MAX_WORKERS = 8
+
+
+class Future(object):
+
+  """The eventual outcome of a call submitted to a CallExecutor."""
+
+  def __init__(self):
+    """Inits Future."""
+    self.__done = threading.Event()
+    self.__lock = threading.Lock()
+    self.__callbacks = []
+    self.__result = None
+    self.__exc_info = None
+
+  def SetResult(self, result):
+    """Completes the future with the value the call returned.
+
+    Args:
+      result: mixed The value the call returned.
+    """
+    self.__result = result
+    self.__Complete()
+
+  def SetExcInfo(self, exc_info):
+    """Completes the future with the exception the call raised.
+
+    Args:
+      exc_info: tuple The (type, value, traceback) of the exception, as
+                returned by sys.exc_info().
+    """
+    self.__exc_info = exc_info
+    self.__Complete()
+
+  def AddDoneCallback(self, callback):
+    """Arranges for a function to be called with this future once it is done.
+
+    The callback runs in the thread which completes the future or, if the
+    future is already done, right away in the calling thread. Exceptions it
+    raises are ignored.
+
+    Args:
+      callback: callable The function to call. Passed this future.
+    """
+    self.__lock.acquire()
+    try:
+      if not self.__done.isSet():
+        self.__callbacks.append(callback)
+        return
+    finally:
+      self.__lock.release()
+    self.__RunCallback(callback)
+
+  def IsDone(self):
+    """Whether the call has completed.
+
+    Returns:
+      bool True if the call has returned or raised, False otherwise.
+    """
+    return self.__done.isSet()
+
+  def GetException(self, timeout=None):
+    """Waits for the call and returns the exception it raised, if any.
+
+    Args:
+      [optional]
+      timeout: float Seconds to wait for the call. None means wait forever.
+
+    Returns:
+      Exception The exception the call raised, or None if it returned.
+
+    Raises:
+      Error: if the call did not complete in time.
+    """
+    self.__Wait(timeout)
+    if self.__exc_info:
+      return self.__exc_info[1]
+    return None
+
+  def GetResult(self, timeout=None):
+    """Waits for the call and returns its value.
+
+    Args:
+      [optional]
+      timeout: float Seconds to wait for the call. None means wait forever.
+
+    Returns:
+      mixed The value the call returned.
+
+    Raises:
+      Exception: the exception the call raised, with its original traceback.
+      Error: if the call did not complete in time.
+    """
+    self.__Wait(timeout)
+    if self.__exc_info:
+      raise self.__exc_info[0], self.__exc_info[1], self.__exc_info[2]
+    return self.__result
+
+  def __Complete(self):
+    """Marks the future as done and runs the callbacks waiting on it."""
+    self.__lock.acquire()
+    try:
+      self.__done.set()
+      callbacks, self.__callbacks = self.__callbacks, []
+    finally:
+      self.__lock.release()
+    for callback in callbacks:
+      self.__RunCallback(callback)
+
+  def __RunCallback(self, callback):
+    """Calls a done callback, ignoring what it raises.
+
+    Args:
+      callback: callable The function to call. Passed this future.
+    """
+    try:
+      callback(self)
+    except Exception:
+      pass
+
+  def __Wait(self, timeout):
+    """Waits for the call to complete.
+
+    Args:
+      timeout: float Seconds to wait for the call. None means wait forever.
+
+    Raises:
+      Error: if the call did not complete in time.
+    """
+    self.__done.wait(timeout)
+    if not self.__done.isSet():
+      raise Error('The call did not complete within %s seconds.' % timeout)
+
+
+class CallExecutor(object):
+
+  """Runs submitted calls on a bounded pool of worker threads.
+
+  Worker threads are started as calls are submitted, up to max_workers, and
+  exit once Shutdown() has been called and every submitted call has run.
+  """
+
+  def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+    """Inits CallExecutor.
+
+    Args:
+      [optional]
+      max_workers: int Maximum number of calls to run at the same time.
+    """
+    self.__max_workers = max(1, max_workers)
+    self.__queue = Queue.Queue()
+    self.__workers = []
+    self.__lock = threading.Lock()
+    self.__shutdown = False
+
+  def Submit(self, function, *args, **kwargs):
+    """Schedules a call.
+
+    Args:
+      function: callable The function to call.
+      args: list Positional arguments to call it with.
+      kwargs: dict Keyword arguments to call it with.
+
+    Returns:
+      Future The outcome of the call.
+
+    Raises:
+      RuntimeError: if the executor has been shut down.
+    """
+    future = Future()
+    self.__lock.acquire()
+    try:
+      if self.__shutdown:
+        raise RuntimeError('Can not submit calls to a shut down executor.')
+      self.__queue.put((future, function, args, kwargs))
+      if len(self.__workers) < self.__max_workers:
+        worker = threading.Thread(target=self.__Work)
+        worker.setDaemon(True)
+        worker.start()
+        self.__workers.append(worker)
+    finally:
+      self.__lock.release()
+    return future
+
+  def Shutdown(self, wait=True):
+    """Stops accepting calls. Calls already submitted still run.
+
+    Args:
+      [optional]
+      wait: bool Whether to wait for every submitted call to complete.
+    """
+    self.__lock.acquire()
+    try:
+      if not self.__shutdown:
+        self.__shutdown = True
+        for _ in self.__workers:
+          self.__queue.put(None)
+    finally:
+      self.__lock.release()
+    if wait:
+      for worker in self.__workers:
+        worker.join()
+
+  def __Work(self):
+    """Runs queued calls until told to stop."""
+    while True:
+      item = self.__queue.get()
+      if item is None:
+        return
+      future, function, args, kwargs = item
+      try:
+        future.SetResult(function(*args, **kwargs))
+      except Exception:
+        future.SetExcInfo(sys.exc_info())
@@ -0,0 +1,112 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measurements of a single API call, for monitoring."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import time
+
+
+# Stages of an API call, in the order they happen.
+#   validate  Checking the arguments against the WSDL, in strict mode.
+#   pack      Packing the arguments into SOAPpy objects.
+#   build     Building the SOAP XML message.
+#   connect   Opening the connection, unless a pooled one was reused.
+#   send      Sending the HTTP request.
+#   wait      Waiting for the response's status line and headers.
+#   receive   Reading the response's body. Includes decoding it when the
+#             response is streamed into the decoder.
+#   parse     Decoding the SOAP XML message. The SAX decoder also unpacks it.
+#   unpack    Unpacking SOAPpy's objects into dicts, lists and strings.
+#   log       Writing the call's XML and request logs, and handling its errors.
+STAGES = ('validate', 'pack', 'build', 'connect', 'send', 'wait', 'receive',
+          'parse', 'unpack', 'log')
+
+
+class CallMetrics(object):
+
+  """Holds the measurements of a single API call.
+
+  A CallMetrics is handed to the function set as the 'metrics_callback' config
+  value once a call is over, after it has been logged and its errors handled.
+  Its attributes are:
+    service_name: str Name of the service called.
+    method_name: str Name of the API method called, as in the WSDL.
+    tags: dict Product-specific values identifying the call, such as the DFP
+          network code under 'networkCode'.
+    request_id: str ID the server gave the request, if known.
+    response_time: str Time the server says it took to handle the request, in
+                   milliseconds, if known.
+    timings: dict Seconds spent in each of the STAGES of the call.
+    total_time: float Seconds the whole call took, logging included.
+    request_size: int Bytes of the SOAP request.
+    request_size_sent: int Bytes of the HTTP request body, once compressed.
+    response_size: int Bytes of the SOAP response, once decompressed.
+    response_size_received: int Bytes of the HTTP response body, as received.
+    retries: int Number of times the request was sent again because a pooled
+             connection had been closed by the server.
+    status: int HTTP status code of the response, if any.
+    error: Exception The error the call raised or returned, or None if it
+           succeeded. A SOAP fault is an error.
+  """
+
+  def __init__(self, service_name, method_name):
+    """Inits CallMetrics.
+
+    Args:
+      service_name: str Name of the service called.
+      method_name: str Name of the API method called.
+    """
+    self.service_name = service_name
+    self.method_name = method_name
+    self.tags = {}
+    self.request_id = None
+    self.response_time = None
+    self.timings = dict.fromkeys(STAGES, 0.0)
+    self.total_time = None
+    self.request_size = None
+    self.request_size_sent = None
+    self.response_size = None
+    self.response_size_received = None
+    self.retries = 0
+    self.status = None
+    self.error = None
+
+  def AddTime(self, stage, start):
+    """Adds the time elapsed since start to a stage of the call.
+
+    Args:
+      stage: str One of the STAGES.
+      start: float Time the stage started at, as returned by time.time().
+
+    Returns:
+      float The current time, which the next stage starts at.
+    """
+    now = time.time()
+    self.timings[stage] += now - start
+    return now
+
+  def AsDict(self):
+    """Returns the measurements as a dictionary, for example to export them.
+
+    Returns:
+      dict The attributes of the CallMetrics, by name. The timings are a copy.
+    """
+    dct = dict(self.__dict__)
+    dct['tags'] = dict(self.tags)
+    dct['timings'] = dict(self.timings)
+    return dct
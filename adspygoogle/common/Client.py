@@ -25,6 +25,7 @@ import warnings
 from adspygoogle.common import PYXML
 from adspygoogle.common import SanityCheck
 from adspygoogle.common import Utils
+from adspygoogle.common.ConnectionPool import ConnectionPool
 from adspygoogle.common.Errors import ValidationError
 
 
@@ -44,7 +45,20 @@ _DEFAULT_CONFIG = {
     'pretty_xml': 'y',
     'compress': 'y',
     'access': '',
-    'wrap_in_tuple': 'y'
+    'wrap_in_tuple': 'y',
+    'keep_alive': 'y',
+    'concurrent': 'n',
+    'wsdl_cache': 'y',
+    'wsdl_cache_ttl': 86400,
+    'sax_decode': 'y',
+    'stream_response': 'n',
+    'async_log': 'n',
+    'log_queue_size': 1000,
+    'log_queue_policy': 'block',
+    'xml_log_sample_rate': 1,
+    'xml_log_max_size': 0,
+    'log_overrides': None,
+    'metrics_callback': None
 }
 
 
@@ -71,6 +85,7 @@ class Client(object):
     """
     self._headers = headers or {}
     self._config = config or self._SetMissingDefaultConfigValues()
+    self._connection_pool = ConnectionPool()
 
   def _LoadAuthCredentials(self):
     """Load existing authentication credentials from auth.pkl.
@@ -426,3 +441,23 @@ class Client(object):
     return self._config['compress']
 
   compress = property(__GetUsingCompression, __SetUsingCompression)
+
+  def __SetConnectionPool(self, connection_pool):
+    """Sets the pool of persistent HTTP connections used by new services.
+
+    A single pool may be shared by several Client instances.
+
+    Args:
+      connection_pool: ConnectionPool The pool to use.
+    """
+    self._connection_pool = connection_pool
+
+  def __GetConnectionPool(self):
+    """Returns the pool of persistent HTTP connections used by new services.
+
+    Returns:
+      ConnectionPool The pool in use.
+    """
+    return self._connection_pool
+
+  connection_pool = property(__GetConnectionPool, __SetConnectionPool)
@@ -0,0 +1,226 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pool of persistent HTTP/1.1 connections shared by API services."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import httplib
+import os
+import select
+import threading
+import time
+
+
+# Default maximum number of idle connections kept open per address.
+DEFAULT_MAX_IDLE_PER_HOST = 10
+# Default maximum number of connections, idle or in use, per address. A value
+# of 0 or None means there is no limit.
+DEFAULT_MAX_PER_HOST = 0
+# Default number of seconds an idle connection may sit in the pool before it is
+# considered too old to reuse.
+DEFAULT_IDLE_TIMEOUT = 60
+
+
+def NewConnection(scheme, address):
+  """Creates a new, unconnected HTTP connection.
+
+  If SSL certificate validation has been turned on through the Client's
+  "ca_certs" property, HTTPS connections will validate the server certificate.
+
+  Args:
+    scheme: str Either 'http' or 'https'.
+    address: str The host[:port] the socket should connect to.
+
+  Returns:
+    httplib.HTTPConnection A new connection object.
+  """
+  if scheme == 'https':
+    try:
+      from adspygoogle.common.https import Https
+      if Https.GetCurrentCertsFile():
+        return Https._SslAwareHttpsConnection(address)
+    except ImportError:
+      pass
+    return httplib.HTTPSConnection(address)
+  return httplib.HTTPConnection(address)
+
+
+class ConnectionPool(object):
+
+  """Thread-safe pool of persistent HTTP/1.1 connections.
+
+  Connections are keyed by scheme and by the address the socket actually
+  connects to, which is the HTTP proxy when one is in use. A connection is
+  checked out with Acquire() for the duration of a single request/response
+  exchange and handed back with Release() once the response has been read in
+  full, at which point another call, possibly from another service, can reuse
+  it.
+  """
+
+  def __init__(self, max_idle_per_host=DEFAULT_MAX_IDLE_PER_HOST,
+               max_per_host=DEFAULT_MAX_PER_HOST,
+               idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """Inits ConnectionPool.
+
+    Args:
+      [optional]
+      max_idle_per_host: int Maximum number of idle connections to keep open
+                         per address. Connections released beyond this limit
+                         are closed.
+      max_per_host: int Maximum number of connections, idle or in use, per
+                    address. Acquire() blocks while the limit is reached. 0 or
+                    None means no limit.
+      idle_timeout: int Number of seconds after which an idle connection is
+                    closed rather than reused.
+    """
+    self._max_idle_per_host = max_idle_per_host
+    self._max_per_host = max_per_host
+    self._idle_timeout = idle_timeout
+    self._cond = threading.Condition(threading.Lock())
+    self._Reset()
+
+  def _Reset(self):
+    """Forgets all connections.
+
+    Used on creation and after a fork, when the sockets inherited from the
+    parent process must not be shared with it.
+    """
+    self._pid = os.getpid()
+    # Maps (scheme, address) to a list of (connection, last used time) tuples.
+    self._idle = {}
+    # Maps (scheme, address) to the number of open connections, idle or not.
+    self._open = {}
+
+  def Acquire(self, scheme, address):
+    """Checks out a connection for the given scheme and address.
+
+    Idle connections are reused most recently used first. Connections which
+    have timed out or whose socket was closed by the server are discarded.
+
+    Args:
+      scheme: str Either 'http' or 'https'.
+      address: str The host[:port] the socket should connect to.
+
+    Returns:
+      tuple (httplib.HTTPConnection, bool) The connection and whether it is a
+      reused one, which may still turn out to be dead when it is written to.
+    """
+    key = (scheme, address)
+    self._cond.acquire()
+    try:
+      if self._pid != os.getpid():
+        self._Reset()
+      idle = self._idle.setdefault(key, [])
+      while True:
+        while idle:
+          connection, last_used = idle.pop()
+          if (time.time() - last_used < self._idle_timeout and
+              not _IsStale(connection)):
+            return connection, True
+          connection.close()
+          self._open[key] -= 1
+        if (not self._max_per_host or
+            self._open.get(key, 0) < self._max_per_host):
+          break
+        self._cond.wait()
+      self._open[key] = self._open.get(key, 0) + 1
+    finally:
+      self._cond.release()
+    return NewConnection(scheme, address), False
+
+  def Release(self, scheme, address, connection, reusable=True):
+    """Returns a connection to the pool.
+
+    Args:
+      scheme: str The scheme the connection was acquired for.
+      address: str The address the connection was acquired for.
+      connection: httplib.HTTPConnection The connection to return.
+      [optional]
+      reusable: bool Whether the connection can serve another request. Pass
+                False if the exchange failed or the server asked to close the
+                connection.
+    """
+    key = (scheme, address)
+    self._cond.acquire()
+    try:
+      if self._pid != os.getpid():
+        return
+      idle = self._idle.setdefault(key, [])
+      if (reusable and connection.sock is not None and
+          len(idle) < self._max_idle_per_host):
+        idle.append((connection, time.time()))
+      else:
+        connection.close()
+        self._open[key] -= 1
+      self._cond.notify()
+    finally:
+      self._cond.release()
+
+  def Clear(self):
+    """Closes all idle connections.
+
+    Connections currently checked out are closed when they are released.
+    """
+    self._cond.acquire()
+    try:
+      for key, idle in self._idle.items():
+        for connection, _ in idle:
+          connection.close()
+        self._open[key] -= len(idle)
+        del idle[:]
+      self._cond.notifyAll()
+    finally:
+      self._cond.release()
+
+  def GetStats(self):
+    """Returns the number of open and idle connections per address.
+
+    Returns:
+      dict Maps (scheme, address) to a tuple (open connections, idle
+      connections).
+    """
+    self._cond.acquire()
+    try:
+      return dict([(key, (self._open.get(key, 0), len(idle)))
+                   for key, idle in self._idle.items()])
+    finally:
+      self._cond.release()
+
+
+def _IsStale(connection):
+  """Checks whether an idle connection can no longer be written to.
+
+  An idle HTTP connection should never have anything to read. If its socket is
+  readable, the server has either closed its end or sent unsolicited data, and
+  neither leaves the connection usable.
+
+  Args:
+    connection: httplib.HTTPConnection The idle connection to check.
+
+  Returns:
+    bool True if the connection should be discarded, False otherwise.
+  """
+  sock = connection.sock
+  if sock is None:
+    return True
+  try:
+    if hasattr(sock, 'pending') and sock.pending():
+      return True
+    readable, _, _ = select.select([sock], [], [], 0)
+  except (select.error, ValueError, TypeError):
+    return True
+  return bool(readable)
@@ -18,22 +18,44 @@
 
 __author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
 
+import functools
 import httplib
+import itertools
+import os
 import sys
 import time
-import threading
+import traceback
 
 from adspygoogle import SOAPpy
 from adspygoogle.common import MessageHandler
 from adspygoogle.common import SanityCheck
 from adspygoogle.common import Utils
+from adspygoogle.common import WsdlCache
+from adspygoogle.common.CallMetrics import CallMetrics
 from adspygoogle.common.Errors import AuthTokenError
 from adspygoogle.common.Errors import Error
 from adspygoogle.common.Errors import ValidationError
 from adspygoogle.common.Logger import Logger
+from adspygoogle.common.soappy import ResponseDecoder
+from adspygoogle.common.soappy import SoappyUtils
+from adspygoogle.common.soappy.HttpTransport import GetHeaderTuples
+from adspygoogle.common.soappy.HttpTransport import HttpTransport
+from adspygoogle.SOAPpy.Config import SOAPConfig
+from adspygoogle.SOAPpy.Parser import parseSOAPRPC
+from adspygoogle.SOAPpy.SOAPBuilder import buildSOAP
+from adspygoogle.SOAPpy.Types import faultType
+from adspygoogle.SOAPpy.Types import simplify
 from adspygoogle.SOAPpy.wstools.WSDLTools import WSDLError
 
-sys_stdout_monkey_lock = threading.Lock()
+
+# Maps (namespace, service name, method name) tuples to the method info of an
+# operation, so that it is only pulled from the WSDL once per API version.
+_method_info_cache = {}
+
+# Maps (service name, method name) tuples to the count of successful calls
+# considered for SOAP XML logging, when only some of them are logged.
+_xml_log_counters = {}
+
 
 class GenericApiService(object):
 
@@ -43,7 +65,7 @@ class GenericApiService(object):
   directly. Classes which implement this class are required to provide the
   following methods:
 
-  _SetHeaders
+  _GetSoapHeaders
   _GetMethodInfo
   _HandleLogsAndErrors
 
@@ -52,11 +74,28 @@ class GenericApiService(object):
 
   _TakeActionOnSoapCall
   _TakeActionOnPackedArgs
+  _TakeActionOnCallMetrics
+
+  Subclasses written before _GetSoapHeaders may implement _SetHeaders, which
+  sets the headers on the SOAPpy proxy, instead. Such subclasses must leave the
+  'concurrent' config value off, and each of their services parses a SOAPpy
+  proxy of its own rather than sharing one from the WSDL cache, so that it
+  never sends the headers of another client.
+
+  Every SOAP call is built, sent and parsed on its own copy of the SOAP headers,
+  HTTP headers and SOAPpy configuration, leaving the shared SOAPpy proxy
+  untouched. Calls are nonetheless serialized on the lock given to the
+  constructor, unless the 'concurrent' config value is on.
+
+  If the 'metrics_callback' config value is set, it is called with a
+  CallMetrics once each call is over, in the thread making the call but
+  without holding the lock. It should return quickly. An error it raises is
+  written to the call_metrics log rather than failing the call.
   """
 
   def __init__(self, headers, config, op_config, lock, logger, service_name,
                service_url, wrap_lists, buffer_class, namespace,
-               namespace_extractor):
+               namespace_extractor, connection_pool=None):
     """Inits GenericApiService.
 
     Args:
@@ -66,7 +105,8 @@ class GenericApiService(object):
       op_config: dict Dictionary object with additional configuration values for
                  this operation.
       lock: mixed Thread lock to use to synchronize requests. May be a
-            thread.lock or a threading.RLock
+            thread.lock or a threading.RLock. Not used if the 'concurrent'
+            config value is on.
       logger: Logger Instance of Logger to use for logging.
       service_name: string The name of this service.
       service_url: string The URL pointing to this web service.
@@ -76,6 +116,10 @@ class GenericApiService(object):
       namespace: string The namespace this service uses by default.
       namespace_extractor: function A function which takes a URL and returns the
                            namespace prefix to use to represent it.
+      [optional]
+      connection_pool: ConnectionPool Pool of persistent HTTP connections to
+                       share with other services. Only used if the
+                       'keep_alive' config value is on.
 
     Raises:
       Error: The WSDL for this service could not be found. Will also be raised
@@ -96,11 +140,21 @@ class GenericApiService(object):
     self._namespace = namespace
     self._namespace_extractor = namespace_extractor
     self._method_proxies = {}
+    if Utils.BoolTypeConvert(self._config['keep_alive']):
+      self._connection_pool = connection_pool
+    else:
+      self._connection_pool = None
 
     wsdl_url = service_url + '?wsdl'
     try:
-      self._soappyservice = SOAPpy.WSDL.Proxy(
-          wsdl_url, noroot=1, http_proxy=self._op_config['http_proxy'])
+      if (Utils.BoolTypeConvert(self._config['wsdl_cache']) and
+          not self.__SetsHeadersOnProxy()):
+        self._soappyservice = WsdlCache.GetProxy(
+            wsdl_url, self.__GetWsdlCacheDir(), self.__GetWsdlCacheTtl(),
+            self._op_config['http_proxy'])
+      else:
+        self._soappyservice = SOAPpy.WSDL.Proxy(
+            wsdl_url, noroot=1, http_proxy=self._op_config['http_proxy'])
     except WSDLError:
       raise Error('Unable to locate WSDL at path \'%s\'' % wsdl_url)
     else:
@@ -110,10 +164,29 @@ class GenericApiService(object):
       self._soappyservice.soapproxy.config.typed = 0
       self._soappyservice.soapproxy.config.namespaceStyle = '2001'
       self._soappyservice.soapproxy.config.returnFaultInfo = 1
-      self._soappyservice.soapproxy.config.dumpHeadersIn = 1
-      self._soappyservice.soapproxy.config.dumpHeadersOut = 1
-      self._soappyservice.soapproxy.config.dumpSOAPIn = 1
-      self._soappyservice.soapproxy.config.dumpSOAPOut = 1
+
+  def __GetWsdlCacheDir(self):
+    """Returns the directory of the on-disk WSDL cache.
+
+    Returns:
+      str The directory under the client's home, or None if there is no home
+      to put it under.
+    """
+    if self._config.get('home'):
+      return os.path.join(self._config['home'], WsdlCache.CACHE_DIR_NAME)
+    return None
+
+  def __GetWsdlCacheTtl(self):
+    """Returns the number of seconds before a cached WSDL is revalidated.
+
+    Returns:
+      int The 'wsdl_cache_ttl' config value, or None if cached WSDLs should
+      never be revalidated.
+    """
+    ttl = self._config.get('wsdl_cache_ttl')
+    if ttl is None or ttl == '':
+      return None
+    return int(ttl)
 
   def __getattr__(self, name):
     """Takes an attribute name and tries to create a SOAP call proxy around it.
@@ -137,17 +210,77 @@ class GenericApiService(object):
 
   def __dir__(self):
     """Overrides default dir() behavior; prints the service's public methods."""
-    dir_list = ['CallRawMethod']
+    dir_list = ['CallRawMethod', 'CopyWithLock', 'GetMethodInfo']
     dir_list.extend(self._soappyservice.methods.keys())
     return dir_list
 
-  def _SetHeaders(self):
-    """Sets the SOAP headers for this service's requests.
+  def CopyWithLock(self, lock):
+    """Returns a copy of this service which synchronizes calls on another lock.
 
-    Must be overridden by an extending class.
+    The copy shares everything else with this service, including its headers,
+    config, parsed WSDL, logger and connection pool.
+
+    Args:
+      lock: thread.lock Thread lock, or any object with acquire and release
+            methods such as a threading.Semaphore, for the copy's calls to
+            hold. Not used if the 'concurrent' config value is on.
+
+    Returns:
+      GenericApiService The copy.
+    """
+    service = object.__new__(self.__class__)
+    service.__dict__.update(self.__dict__)
+    service._lock = lock
+    service._method_proxies = {}
+    return service
+
+  def GetMethodInfo(self, method_name):
+    """Returns what the WSDL says about an API method's inputs and outputs.
+
+    Args:
+      method_name: str The name of the method, as in the WSDL or with its first
+                   letter capitalized, such as 'CreateLineItems'.
+
+    Returns:
+      dict The method info, as returned by _GetMethodInfo, with the output type
+      tuples under MethodInfoKeys.OUTPUT_TYPES. Shared by every service of the
+      same API version, so not to be modified.
+
+    Raises:
+      AttributeError: if the service has no such method.
+    """
+    return self._GetCachedMethodInfo(self._ResolveMethodName(method_name))
+
+  def _GetSoapHeaders(self):
+    """Returns the SOAP headers for a request made by this service.
+
+    Must be overridden by an extending class, unless it overrides _SetHeaders.
+    Called once per request.
+
+    Returns:
+      SOAPpy.Types.headerType The SOAP headers to send.
     """
+    if self.__SetsHeadersOnProxy():
+      self._SetHeaders()
+      return self._soappyservice.soapproxy.header
     raise NotImplementedError
 
+  def __SetsHeadersOnProxy(self):
+    """Returns whether this service's class overrides _SetHeaders.
+
+    Returns:
+      bool True if the SOAP headers are set on the SOAPpy proxy by _SetHeaders.
+    """
+    return (self.__class__._SetHeaders.im_func is not
+            GenericApiService._SetHeaders.im_func)
+
+  def _SetHeaders(self):
+    """Sets the SOAP headers on the SOAPpy proxy.
+
+    Deprecated, use _GetSoapHeaders. Calls no longer read the proxy's headers.
+    """
+    self._soappyservice.soapproxy.header = self._GetSoapHeaders()
+
   def _GetMethodInfo(self, method_name):
     """Pulls all of the relevant data about a method from a SOAPpy service.
 
@@ -211,59 +344,223 @@ class GenericApiService(object):
     """
     return ksoap_args
 
-  def _ReadyOAuth(self):
-    """If OAuth is on, sets the transport handler to add OAuth HTTP header."""
+  def _TakeActionOnCallMetrics(self, metrics, buf):
+    """Allows a service to add product-specific values to a call's metrics.
+
+    If a product has values to add, such as the request ID the server sent
+    back, then its extending service class must override this method.
+
+    Args:
+      metrics: CallMetrics The measurements of the call.
+      buf: SoapBuffer SOAP buffer of the call.
+    """
+    pass
+
+  def _ReadyOAuth(self, http_headers):
+    """If OAuth is on, adds the OAuth Authorization HTTP header.
+
+    Args:
+      http_headers: dict The HTTP headers of the request being prepared.
+    """
     if (self._config.get('oauth_handler') and
         self._headers.get('oauth_credentials')):
       signedrequestparams = self._config[
           'oauth_handler'].GetSignedRequestParameters(
               self._headers['oauth_credentials'], str(self._service_url))
-      self._soappyservice.soapproxy.transport.additional_headers[
-          'Authorization'] = (
-              'OAuth ' +
-              self._config['oauth_handler'].FormatParametersForHeader(
-                  signedrequestparams))
+      http_headers['Authorization'] = (
+          'OAuth ' +
+          self._config['oauth_handler'].FormatParametersForHeader(
+              signedrequestparams))
     elif self._headers.get('oauth2credentials'):
-      self._headers['oauth2credentials'].apply(
-          self._soappyservice.soapproxy.transport.additional_headers)
-    else:
-      if ('Authorization' in
-          self._soappyservice.soapproxy.transport.additional_headers):
-        del self._soappyservice.soapproxy.transport.additional_headers[
-            'Authorization']
+      self._headers['oauth2credentials'].apply(http_headers)
+
+  def _ReadyCompression(self, soap_config):
+    """Sets whether the HTTP transport layer should use compression.
 
-  def _ReadyCompression(self):
-    """Sets whether the HTTP transport layer should use compression."""
+    Args:
+      soap_config: SOAPpy.Config.SOAPConfig The configuration of the request
+                   being prepared.
+    """
     compress = Utils.BoolTypeConvert(self._config['compress'])
-    self._soappyservice.soapproxy.config.send_compressed = compress
-    self._soappyservice.soapproxy.config.accept_compressed = compress
+    soap_config.send_compressed = compress
+    soap_config.accept_compressed = compress
+
+  def _InvokeSoapMethod(self, method_name, ksoap_args, soap_headers,
+                        method_attrs, http_headers, soap_config, buf,
+                        output_types, metrics=None):
+    """Builds, sends and decodes a single SOAP call.
+
+    This does what calling the method on the SOAPpy proxy would do, but all of
+    the per-request state is passed in rather than read off the shared proxy,
+    so that several calls can safely be in flight at once.
+
+    Args:
+      method_name: str The name of the SOAP operation to call.
+      ksoap_args: dict The packed keyword arguments for the operation.
+      soap_headers: SOAPpy.Types.headerType The SOAP headers to send.
+      method_attrs: dict The attributes to set on the operation's element.
+      http_headers: dict Extra HTTP headers to send.
+      soap_config: SOAPpy.Config.SOAPConfig The configuration to use.
+      buf: SoapBuffer The buffer to capture the HTTP and SOAP traffic into.
+      output_types: list (namespace, type name, maxOccurs) tuples of the values
+                    the operation returns.
+      [optional]
+      metrics: CallMetrics Object to record the timings and sizes of the call
+               into.
+
+    Returns:
+      mixed The response, unpacked into dicts, lists and strings.
+
+    Raises:
+      SOAPpy.Types.faultType: if the server responded with a SOAP fault.
+      Error: if a streamed response could not be decoded.
+    """
+    if metrics is None:
+      metrics = CallMetrics(self._service_name, method_name)
+    soapproxy = self._soappyservice.soapproxy
+    callinfo = self._soappyservice.methods[method_name]
+    start = time.time()
+    message = buildSOAP(kw=ksoap_args, method=method_name,
+                        namespace=callinfo.namespace, header=soap_headers,
+                        methodattrs=method_attrs, encoding=soapproxy.encoding,
+                        config=soap_config, noroot=soapproxy.noroot)
+    metrics.AddTime('build', start)
+
+    sax_decode = (Utils.BoolTypeConvert(self._config['sax_decode']) and
+                  not soap_config.returnAllAttrs)
+    decoder = None
+    if (sax_decode and Utils.BoolTypeConvert(self._config['stream_response'])
+        and not Utils.BoolTypeConvert(self._config['raw_response'])):
+      try:
+        decoder = ResponseDecoder.ResponseDecoder(
+            SoappyUtils.GetSchemaIndex(self._soappyservice), output_types)
+      except ResponseDecoder.UnsupportedResponseError:
+        pass
+
+    transport = HttpTransport(http_headers, self._connection_pool,
+                              capture=buf, metrics=metrics)
+    response, _ = transport.call(
+        callinfo.location, message, callinfo.namespace,
+        callinfo.soapAction or method_name, encoding=soapproxy.encoding,
+        http_proxy=self._op_config['http_proxy'], config=soap_config,
+        decoder=decoder)
+
+    start = time.time()
+    if response is None:
+      # The response was decoded while it was being read.
+      try:
+        result = decoder.Close()
+      except ResponseDecoder.UnsupportedResponseError, e:
+        raise Error('Unable to decode the streamed SOAP response. %s' % e)
+      metrics.AddTime('parse', start)
+      buf.SetResponseHeaderValues(decoder.GetHeaderValues())
+      return result
+
+    if sax_decode:
+      try:
+        decoder = ResponseDecoder.ResponseDecoder(
+            SoappyUtils.GetSchemaIndex(self._soappyservice), output_types)
+        decoder.Feed(response)
+        result = decoder.Close()
+      except ResponseDecoder.UnsupportedResponseError:
+        # Faults and unusual responses are left to SOAPpy.
+        pass
+      else:
+        metrics.AddTime('parse', start)
+        buf.SetResponseHeaderValues(decoder.GetHeaderValues())
+        return result
+
+    result, header, attrs = parseSOAPRPC(response, header=1, attrs=1)
+    start = metrics.AddTime('parse', start)
+    buf.SetResponseHeaderValues(_GetHeaderValues(header))
+    if soapproxy.throw_faults and isinstance(result, faultType):
+      raise result
+
+    # Mirror SOAPpy's handling of single element responses and simplification.
+    if soapproxy.unwrap_results:
+      try:
+        public_keys = [key for key in result.__dict__ if key[0] != '_']
+        if len(public_keys) == 1:
+          result = getattr(result, public_keys[0])
+      except AttributeError:
+        pass
+    if soapproxy.simplify_objects:
+      result = simplify(result)
+
+    if soap_config.returnAllAttrs:
+      result = (result, attrs)
+    result = MessageHandler.RestoreListTypeWithSoappy(
+        MessageHandler.UnpackResponseAsDict(result), self._soappyservice,
+        output_types)
+    metrics.AddTime('unpack', start)
+    return result
+
+  def _GetCachedMethodInfo(self, method_name):
+    """Returns the method info of an operation, pulling it from the WSDL once.
+
+    The method info is shared by every service instance of the same API version
+    and, on top of what _GetMethodInfo returns, holds the output type tuples
+    under MethodInfoKeys.OUTPUT_TYPES.
+
+    Args:
+      method_name: string The name of the method to get information for.
+
+    Returns:
+      dict A dictionary containing information about a SOAP method.
+    """
+    key = (self._namespace, self._service_name, method_name)
+    method_info = _method_info_cache.get(key)
+    if method_info is None:
+      method_info = self._GetMethodInfo(method_name)
+      method_info[MethodInfoKeys.OUTPUT_TYPES] = [
+          (out_param[MethodInfoKeys.NS], out_param[MethodInfoKeys.TYPE],
+           out_param[MethodInfoKeys.MAX_OCCURS])
+          for out_param in method_info[MethodInfoKeys.OUTPUTS]]
+      method_info = _method_info_cache.setdefault(key, method_info)
+    return method_info
+
+  def _ResolveMethodName(self, method_name):
+    """Returns the name the WSDL gives an operation.
+
+    Args:
+      method_name: str The name of the operation, as in the WSDL or with its
+                   first letter capitalized.
+
+    Returns:
+      str The name of the operation in the WSDL.
+
+    Raises:
+      AttributeError: if the service has no such operation.
+    """
+    if method_name not in self._soappyservice.methods:
+      method_name = method_name[0].lower() + method_name[1:]
+      if method_name not in self._soappyservice.methods:
+        raise AttributeError(method_name)
+    return method_name
 
   def _CreateMethod(self, method_name):
     """Create a method wrapping an invocation to the SOAP service."""
-    try:
-      soap_service_method = getattr(self._soappyservice, method_name)
-    except AttributeError:
-      method_name = method_name[0].lower() + method_name[1:]
-      soap_service_method = getattr(self._soappyservice, method_name)
+    method_name = self._ResolveMethodName(method_name)
+    method_info = self._GetCachedMethodInfo(method_name)
 
-    def CallMethod(*args):
-      """Perform a SOAP call."""
-      try:
+    def Call(args, metrics, collect_metrics):
+      """Perform a SOAP call, holding the lock unless calls are concurrent."""
+      concurrent = Utils.BoolTypeConvert(self._config['concurrent'])
+      if not concurrent:
         self._lock.acquire()
-        self._ReadyOAuth()
-        self._ReadyCompression()
-        self._SetHeaders()
+      try:
+        http_headers = {}
+        self._ReadyOAuth(http_headers)
+        soap_config = SOAPConfig(self._soappyservice.soapproxy.config)
+        self._ReadyCompression(soap_config)
+        soap_headers = self._GetSoapHeaders()
 
         args = self._TakeActionOnSoapCall(method_name, args)
-        method_info = self._GetMethodInfo(method_name)
-        method_attrs_holder = None
+        method_attrs = self._soappyservice.soapproxy.methodattrs
         if not method_info[MethodInfoKeys.INPUTS]:
           # Don't put any namespaces other than this service's namespace on
           # calls with no input params.
-          method_attrs_holder = self._soappyservice.soapproxy.methodattrs
-          self._soappyservice.soapproxy.methodattrs = {
-              'xmlns': self._namespace
-          }
+          method_attrs = {'xmlns': self._namespace}
 
         if len(args) != len(method_info[MethodInfoKeys.INPUTS]):
           raise TypeError(''.join([
@@ -273,6 +570,7 @@ class GenericApiService(object):
 
         ksoap_args = {}
         for i in range(len(method_info[MethodInfoKeys.INPUTS])):
+          start = time.time()
           if Utils.BoolTypeConvert(self._config['strict']):
             SanityCheck.SoappySanityCheck(
                 self._soappyservice, args[i],
@@ -280,6 +578,7 @@ class GenericApiService(object):
                 method_info[MethodInfoKeys.INPUTS][i][MethodInfoKeys.TYPE],
                 method_info[MethodInfoKeys.INPUTS][i][
                     MethodInfoKeys.MAX_OCCURS])
+            start = metrics.AddTime('validate', start)
 
           element_name = str(method_info[MethodInfoKeys.INPUTS][i][
               MethodInfoKeys.ELEMENT_NAME])
@@ -291,36 +590,41 @@ class GenericApiService(object):
               self._soappyservice,
               self._wrap_lists,
               self._namespace_extractor)
+          metrics.AddTime('pack', start)
 
         ksoap_args = self._TakeActionOnPackedArgs(method_name, ksoap_args)
 
         buf = self._buffer_class(
             xml_parser=self._config['xml_parser'],
             pretty_xml=Utils.BoolTypeConvert(self._config['pretty_xml']))
-        sys_stdout_monkey_lock.acquire()
+        buf.SetCallName(method_name)
+
+        error = {}
+        response = None
+        start_time = time.strftime('%Y-%m-%d %H:%M:%S')
         try:
-            old_stdout = sys.stdout
-            sys.stdout = buf
-
-            error = {}
-            response = None
-            start_time = time.strftime('%Y-%m-%d %H:%M:%S')
-            try:
-              response = MessageHandler.UnpackResponseAsDict(
-                  soap_service_method(**ksoap_args))
-            except Exception, e:
-              error['data'] = e
-            stop_time = time.strftime('%Y-%m-%d %H:%M:%S')
-            # Restore stdout
-            sys.stdout = old_stdout
-        finally:
-            sys_stdout_monkey_lock.release()
+          response = self._InvokeSoapMethod(
+              method_name, ksoap_args, soap_headers, method_attrs,
+              http_headers, soap_config, buf,
+              method_info[MethodInfoKeys.OUTPUT_TYPES], metrics)
+        except Exception, e:
+          error['data'] = e
+        stop_time = time.strftime('%Y-%m-%d %H:%M:%S')
 
         if isinstance(response, Error):
           error = response
 
+        if collect_metrics:
+          if isinstance(error, dict):
+            metrics.error = error.get('data')
+          else:
+            metrics.error = error
+          self._TakeActionOnCallMetrics(metrics, buf)
+
         if not Utils.BoolTypeConvert(self._config['raw_debug']):
+          start = time.time()
           self._HandleLogsAndErrors(buf, start_time, stop_time, error)
+          metrics.AddTime('log', start)
 
         # When debugging mode is ON, fetch last traceback.
         if Utils.BoolTypeConvert(self._config['debug']):
@@ -359,27 +663,55 @@ class GenericApiService(object):
           response = buf.GetRawSoapIn()
         elif error:
           response = error
-        else:
-          output_types = [(out_param[MethodInfoKeys.NS],
-                           out_param[MethodInfoKeys.TYPE],
-                           out_param[MethodInfoKeys.MAX_OCCURS]) for out_param
-                          in method_info[MethodInfoKeys.OUTPUTS]]
-          response = MessageHandler.RestoreListTypeWithSoappy(
-              response, self._soappyservice, output_types)
 
         if Utils.BoolTypeConvert(self._config['wrap_in_tuple']):
           response = MessageHandler.WrapInTuple(response)
 
-        # Restore method_attrs if they were over-ridden
-        if method_attrs_holder:
-          self._soappyservice.soapproxy.methodattrs = method_attrs_holder
-
         return response
       finally:
-        self._lock.release()
+        if not concurrent:
+          self._lock.release()
+
+    def CallMethod(*args):
+      """Perform a SOAP call."""
+      metrics_callback = self._config.get('metrics_callback')
+      metrics = CallMetrics(self._service_name, method_name)
+      call_start = time.time()
+      try:
+        response = Call(args, metrics, metrics_callback is not None)
+      except Exception, e:
+        if metrics_callback is None:
+          raise
+        exc_info = sys.exc_info()
+        metrics.error = e
+        self._CallMetricsCallback(metrics_callback, metrics, call_start)
+        raise exc_info[0], exc_info[1], exc_info[2]
+      if metrics_callback is not None:
+        self._CallMetricsCallback(metrics_callback, metrics, call_start)
+      return response
 
     return CallMethod
 
+  def _CallMetricsCallback(self, metrics_callback, metrics, call_start):
+    """Hands the metrics of a finished call to the 'metrics_callback'.
+
+    Called once the call has been logged and its errors handled, without
+    holding the lock, so that a slow callback does not hold up other calls.
+    An error raised by the callback is logged rather than raised.
+
+    Args:
+      metrics_callback: function The function to call.
+      metrics: CallMetrics The metrics of the call.
+      call_start: float Time the call started at.
+    """
+    metrics.total_time = time.time() - call_start
+    try:
+      metrics_callback(metrics)
+    except Exception:
+      self._logger.Log(
+          'call_metrics', 'The metrics_callback raised an error.\n%s'
+          % traceback.format_exc(), log_level=Logger.ERROR)
+
   def _ManageSoap(self, buf, log_handlers, lib_url, start_time, stop_time,
                   error=None):
     """Manage SOAP XML message.
@@ -417,37 +749,40 @@ class GenericApiService(object):
     # file, both, or ignore. Each handler supports the following elements,
     #   tag: Config value for this handler. If left empty, will never write
     #        data to file.
-    #   target: Target/destination represented by this handler (i.e. FILE,
-    #           CONSOLE, etc.). Initially, it should be set to Logger.NONE.
     #   name: Name of the log file to use.
-    #   data: Data to write.
-    for handler in log_handlers:
-      if handler['tag'] == 'xml_log':
-        handler['target'] = Logger.NONE
-        handler['data'] += ('StartTime: %s\n%s\n%s\n%s\n%s\nEndTime: %s'
-                            % (start_time, buf.GetHeadersOut(),
-                               buf.GetSoapOut(), buf.GetHeadersIn(),
-                               buf.GetSoapIn(), stop_time))
-      elif handler['tag'] == 'request_log':
-        handler['target'] = Logger.NONE
-        handler['data'] += ' isFault=%s' % is_fault
-      elif not handler['tag']:
-        handler['target'] = Logger.NONE
-        handler['data'] += 'DEBUG: %s' % error_msg
+    #   data: Data to write, or a function returning it.
+    # The data of a handler is only built, and the buffer only parsed, if the
+    # handler logs somewhere, so that calls cost nothing extra when logging
+    # is off. It is handed to the logger as a function, which an
+    # AsyncLogWriter calls from its writer thread.
+    #
+    # Only one in 'xml_log_sample_rate' successful calls is written to the SOAP
+    # XML log file, while faults always are, and SOAP bodies are cut down to
+    # 'xml_log_max_size' bytes. Logging config values can be overridden per
+    # service and method in 'log_overrides'.
     for handler in log_handlers:
+      handler['target'] = Logger.NONE
       if (handler['tag'] and
-          Utils.BoolTypeConvert(self._config[handler['tag']])):
+          Utils.BoolTypeConvert(self._GetLogConfigValue(handler['tag'], buf))):
         handler['target'] = Logger.FILE
+        if (handler['tag'] == 'xml_log' and not is_fault and
+            not self._IsXmlLogSampled(buf)):
+          handler['target'] = Logger.NONE
       # If debugging is On, raise handler's target two levels,
       #   NONE -> CONSOLE
       #   FILE -> FILE_AND_CONSOLE.
       if Utils.BoolTypeConvert(self._config['debug']):
         handler['target'] += 2
+      if handler['target'] == Logger.NONE:
+        continue
+      if handler['tag'] == 'xml_log':
+        buf.SetMaxSoapSize(
+            int(self._GetLogConfigValue('xml_log_max_size', buf) or 0))
 
-      if (handler['target'] != Logger.NONE and handler['data'] and
-          handler['data'] != 'None' and handler['data'] != 'DEBUG: '):
-        self._logger.Log(handler['name'], handler['data'],
-                         log_level=Logger.DEBUG, log_handler=handler['target'])
+      self._logger.Log(handler['name'],
+                       functools.partial(_GetLogData, handler, buf, start_time,
+                                         stop_time, is_fault, error_msg),
+                       log_level=Logger.DEBUG, log_handler=handler['target'])
 
     # If raw response is requested, no need to validate and throw appropriate
     # error. Up to the end user to handle successful or failed request.
@@ -472,6 +807,52 @@ class GenericApiService(object):
       return fault
     return None
 
+  def _GetLogConfigValue(self, key, buf):
+    """Returns a logging config value, as overridden for the call, if it is.
+
+    The 'log_overrides' config value maps a service name, such as
+    'InventoryService', or a service and method name, such as
+    'InventoryService.getAdUnitsByStatement', to the config values to use for
+    the calls to that service or method. Method names may also be capitalized,
+    as in 'InventoryService.GetAdUnitsByStatement'. Method overrides come first.
+
+    Args:
+      key: str Name of the config value, such as 'xml_log'.
+      buf: SoapBuffer SOAP buffer of the call.
+
+    Returns:
+      mixed The config value to use for the call.
+    """
+    overrides = self._config.get('log_overrides')
+    if overrides:
+      method_name = buf.GetCallName()
+      for name in ('%s.%s' % (self._service_name, method_name),
+                   '%s.%s%s' % (self._service_name, method_name[:1].upper(),
+                                method_name[1:]),
+                   self._service_name):
+        if name in overrides and key in overrides[name]:
+          return overrides[name][key]
+    return self._config.get(key)
+
+  def _IsXmlLogSampled(self, buf):
+    """Whether the SOAP XML of a successful call is to be logged.
+
+    One in 'xml_log_sample_rate' calls to each method is, starting with the
+    first.
+
+    Args:
+      buf: SoapBuffer SOAP buffer of the call.
+
+    Returns:
+      bool True if the call is to be logged, False otherwise.
+    """
+    sample_rate = int(self._GetLogConfigValue('xml_log_sample_rate', buf) or 1)
+    if sample_rate <= 1:
+      return True
+    counter = _xml_log_counters.setdefault(
+        (self._service_name, buf.GetCallName()), itertools.count())
+    return counter.next() % sample_rate == 0
+
   def CallRawMethod(self, soap_message):
     """Makes an API call by POSTing a raw SOAP XML message to the server.
 
@@ -486,61 +867,37 @@ class GenericApiService(object):
       of the server sending back an HTTP error, such as a 502.
     """
 
-    self._lock.acquire()
+    concurrent = Utils.BoolTypeConvert(self._config['concurrent'])
+    if not concurrent:
+      self._lock.acquire()
     try:
       buf = self._buffer_class(
           xml_parser=self._config['xml_parser'],
           pretty_xml=Utils.BoolTypeConvert(self._config['pretty_xml']))
 
-      http_header = {
-          'post': self._service_url,
-          'host': Utils.GetNetLocFromUrl(self._op_config['server']),
-          'user_agent': '%s; CallRawMethod' % self.__class__.__name__,
-          'content_type': 'text/xml; charset=\"UTF-8\"',
-          'content_length': '%d' % len(soap_message),
-          'soap_action': ''
-      }
-
-      # Add OAuth header if OAuth is enabled.
-      if (self._config.get('oauth_handler') and
-          self._headers.get('oauth_credentials')):
-        signedrequestparams = self._config[
-            'oauth_handler'].GetSignedRequestParameters(
-                self._headers['oauth_credentials'], self._service_url)
-        http_header['authorization'] = (
-            'OAuth ' + self._config['oauth_handler'].FormatParametersForHeader(
-                signedrequestparams))
-
-      self._start_time = time.strftime('%Y-%m-%d %H:%M:%S')
-      buf.write('%s Outgoing HTTP headers %s\nPOST %s\nHost: %s\nUser-Agent: '
-                '%s\nContent-type: %s\nContent-length: %s\nSOAPAction: %s\n' %
-                ('*'*3, '*'*46, http_header['post'], http_header['host'],
-                 http_header['user_agent'], http_header['content_type'],
-                 http_header['content_length'], http_header['soap_action']))
-      if (self._config.get('oauth_handler') and
-          self._headers.get('oauth_credentials') or
-          self._headers.get('oauth2credentials')):
-        buf.write('Authorization: ' + http_header['authorization'] + '\n')
-      buf.write('%s\n%s Outgoing SOAP %s\n%s\n%s\n' %
-                ('*'*72, '*'*3, '*'*54, soap_message, '*'*72))
+      http_headers = {}
+      self._ReadyOAuth(http_headers)
+      headers = [
+          ('Host', Utils.GetNetLocFromUrl(self._op_config['server'])),
+          ('User-Agent', '%s; CallRawMethod' % self.__class__.__name__),
+          ('Content-type', 'text/xml; charset=\"UTF-8\"'),
+          ('Content-length', '%d' % len(soap_message)),
+          ('SOAPAction', '')]
+      headers.extend(http_headers.items())
+
+      start_time = time.strftime('%Y-%m-%d %H:%M:%S')
+      buf.CaptureRequest(self._service_url, headers, soap_message)
 
       if self._op_config['http_proxy']:
         real_address = self._op_config['http_proxy']
       else:
-        real_address = http_header['host']
+        real_address = headers[0][1]
 
       # Construct header and send SOAP message.
       web_service = httplib.HTTPS(real_address)
-      web_service.putrequest('POST', http_header['post'])
-      web_service.putheader('Host', http_header['host'])
-      web_service.putheader('User-Agent', http_header['user_agent'])
-      web_service.putheader('Content-type', http_header['content_type'])
-      web_service.putheader('Content-length', http_header['content_length'])
-      web_service.putheader('SOAPAction', http_header['soap_action'])
-      if (self._config.get('oauth_handler') and
-          self._headers.get('oauth_credentials') or
-          self._headers.get('oauth2credentials')):
-        web_service.putheader('Authorization', http_header['authorization'])
+      web_service.putrequest('POST', self._service_url, skip_host=1)
+      for name, value in headers:
+        web_service.putheader(name, value)
       web_service.endheaders()
       web_service.send(soap_message)
 
@@ -548,12 +905,9 @@ class GenericApiService(object):
       status_code, status_message, header = web_service.getreply()
       response = web_service.getfile().read()
 
-      header = str(header).replace('\r', '')
-      buf.write(('%s Incoming HTTP headers %s\n%s %s\n%s\n%s\n%s Incoming SOAP'
-                 ' %s\n%s\n%s\n' % ('*'*3, '*'*46, status_code, status_message,
-                                    header, '*'*72, '*'*3, '*'*54, response,
-                                    '*'*72)))
-      self._stop_time = time.strftime('%Y-%m-%d %H:%M:%S')
+      buf.CaptureResponse(status_code, status_message,
+                          GetHeaderTuples(header), response)
+      stop_time = time.strftime('%Y-%m-%d %H:%M:%S')
 
       # Catch local errors prior to going down to the SOAP layer, which may not
       # exist for this error instance.
@@ -567,14 +921,70 @@ class GenericApiService(object):
           msg = 'Unknown error.'
         raise Error(msg)
 
-      self._HandleLogsAndErrors(buf, self._start_time, self._stop_time)
+      self._HandleLogsAndErrors(buf, start_time, stop_time)
     finally:
-      self._lock.release()
+      if not concurrent:
+        self._lock.release()
     if self._config['wrap_in_tuple']:
       response = MessageHandler.WrapInTuple(response)
     return response
 
 
+def _GetLogData(handler, buf, start_time, stop_time, is_fault, error_msg):
+  """Returns the data a log handler writes for a call.
+
+  Args:
+    handler: dict The log handler.
+    buf: SoapBuffer SOAP buffer of the call.
+    start_time: str Time before service call was invoked.
+    stop_time: str Time after service call was invoked.
+    is_fault: bool Whether the call returned a fault.
+    error_msg: str Trace of the error, if any.
+
+  Returns:
+    str The data to log, or None if there is nothing to log.
+  """
+  data = handler['data']
+  if callable(data):
+    data = data()
+  if handler['tag'] == 'xml_log':
+    data += ('StartTime: %s\n%s\n%s\n%s\n%s\nEndTime: %s'
+             % (start_time, buf.GetHeadersOut(), buf.GetSoapOut(),
+                buf.GetHeadersIn(), buf.GetSoapIn(), stop_time))
+  elif handler['tag'] == 'request_log':
+    data += ' isFault=%s' % is_fault
+  elif not handler['tag']:
+    data += 'DEBUG: %s' % error_msg
+
+  if data and data != 'None' and data != 'DEBUG: ':
+    return data
+  return None
+
+
+def _GetHeaderValues(header):
+  """Returns the values of the fields of a SOAP header parsed by SOAPpy.
+
+  Args:
+    header: SOAPpy.Types.headerType The SOAP header, or None.
+
+  Returns:
+    dict The text of each field which holds no other field, keyed by its name.
+  """
+  values = {}
+  pending = [simplify(header)]
+  while pending:
+    item = pending.pop()
+    if isinstance(item, dict):
+      for name, value in item.iteritems():
+        if isinstance(value, (dict, list)):
+          pending.append(value)
+        elif value is not None:
+          values[str(name)] = str(value)
+    elif isinstance(item, list):
+      pending.extend(item)
+  return values
+
+
 class MethodInfoKeys(object):
   """Static constants holder; keys used to pass method information around."""
 
@@ -584,3 +994,4 @@ class MethodInfoKeys(object):
   TYPE = 'type'
   OUTPUTS = 'outputs'
   MAX_OCCURS = 'maxOccurs'
+  OUTPUT_TYPES = 'outputtypes'
@@ -127,7 +127,8 @@ class Logger(object):
     Args:
       log_name: str Name of the log. If the log is handled by an external
                 file, this will be the file name appended by log.
-      message: str Message to log.
+      message: str|function Message to log, or a function returning it or
+               None if there is nothing to log.
       [optional]
       log_level: int Level of importance of the current message. Not
                  supplying this parameter will cause the logger to log at the
@@ -137,6 +138,10 @@ class Logger(object):
       log_handler: int Type of log handler. Should be one of NONE, FILE,
                    CONSOLE, or FILE_AND_CONSOLE.
     """
+    if callable(message):
+      message = message()
+      if message is None:
+        return
     logger = logging.getLogger(log_name)
 
     # Instantiate handlers for logger with default values if none exists.
@@ -147,3 +152,79 @@ class Logger(object):
       logger.log(logger.getEffectiveLevel(), message)
     else:
       logger.log(log_level, message)
+
+  def LogBatch(self, log_name, messages, log_level=NOTSET,
+               log_handler=FILE):
+    """Log several messages at once, flushing each handler once.
+
+    Args:
+      log_name: str Name of the log. If the log is handled by an external
+                file, this will be the file name appended by log.
+      messages: list (message, time) tuples, the time being when the message
+                was logged, in seconds since the epoch.
+      [optional]
+      log_level: int Level of importance of the messages.
+      log_handler: int Type of log handler. Should be one of NONE, FILE,
+                   CONSOLE, or FILE_AND_CONSOLE.
+    """
+    logger = logging.getLogger(log_name)
+
+    # Instantiate handlers for logger with default values if none exists.
+    if not logger.handlers:
+      self.__CreateLog(log_name, log_level, log_handler)
+
+    if log_level == Logger.NOTSET:
+      log_level = logger.getEffectiveLevel()
+    if logger.disabled or not logger.isEnabledFor(log_level):
+      return
+    records = []
+    for message, created in messages:
+      record = logger.makeRecord(log_name, log_level, '(batch)', 0, message,
+                                 None, None)
+      record.created = created
+      record.msecs = (created - long(created)) * 1000
+      if logger.filter(record):
+        records.append(record)
+
+    # Like logging.Logger.callHandlers, also pass the messages to the handlers
+    # of the parent loggers.
+    handlers = []
+    current = logger
+    while current:
+      handlers.extend(current.handlers)
+      if not current.propagate:
+        break
+      current = current.parent
+    for handler in handlers:
+      if (type(handler) is not logging.FileHandler or handler.encoding or
+          handler.stream is None):
+        for record in records:
+          if record.levelno >= handler.level:
+            handler.handle(record)
+        continue
+      # The files this class creates are written in one go before being
+      # flushed, rather than flushed after every message as FileHandler.emit
+      # does. Other handlers, subclasses included, get every message handled
+      # the usual way.
+      handler.acquire()
+      try:
+        for record in records:
+          if record.levelno >= handler.level and handler.filter(record):
+            try:
+              message = handler.format(record)
+              try:
+                handler.stream.write('%s\n' % message)
+              except UnicodeError:
+                handler.stream.write('%s\n' % message.encode('UTF-8'))
+            except Exception:
+              handler.handleError(record)
+        handler.flush()
+      finally:
+        handler.release()
+
+  def Flush(self):
+    """Wait until the messages logged so far are written.
+
+    Messages are written as they are logged, so there is nothing to wait for.
+    """
+    pass
@@ -136,6 +136,7 @@ def _PackDictForSoappy(obj, xmlns, type_name, soappy_service, wrap_lists,
     SOAPpy.Types.structType The given dictionary ready for SOAPpy transport.
   """
   packed_data = {}
+  schema_index = SoappyUtils.GetSchemaIndex(soappy_service)
   obj_contained_type, type_key = SoappyUtils.GetExplicitType(
       obj, type_name, xmlns, soappy_service)
   if obj_contained_type:
@@ -144,11 +145,9 @@ def _PackDictForSoappy(obj, xmlns, type_name, soappy_service, wrap_lists,
   for key in obj:
     if key == type_key or not obj[key]:
       continue
-    ns_prefix = prefix_function(SoappyUtils.GetComplexFieldNamespaceByFieldName(
-        key, type_name, xmlns, soappy_service))
-    key_type = SoappyUtils.GetComplexFieldTypeByFieldName(
-        key, type_name, xmlns, soappy_service)
-    packed_data[ns_prefix + key] = PackForSoappy(
+    field = schema_index.GetField(type_name, xmlns, key)
+    key_type = field['type']
+    packed_data[prefix_function(field['ns']) + key] = PackForSoappy(
         obj[key], key_type.getTargetNamespace(), key_type.getName(),
         soappy_service, wrap_lists, prefix_function)
 
@@ -156,8 +155,8 @@ def _PackDictForSoappy(obj, xmlns, type_name, soappy_service, wrap_lists,
   packed_object = SOAPpy.Types.structType(packed_data, typed=0, attrs=attrs)
   packed_object._typename = type_name
   packed_object._keyord = SoappyUtils.PruneKeyOrder(
-      [param['name'] for param in SoappyUtils.GenKeyOrderAttrs(
-          soappy_service, xmlns, type_name)], packed_object)
+      [field['name'] for field in schema_index.GetType(type_name, xmlns).fields],
+      packed_object)
   return packed_object
 
 
@@ -184,11 +183,11 @@ def _PackListForSoappy(obj, xmlns, type_name, soappy_service, wrap_lists,
     False, this will return a list. If wrap_lists is set to True, this will
     return a SOAPpy.Types.structType.
   """
+  item_type = SoappyUtils.GetArrayItemTypeName(type_name, xmlns,
+                                               soappy_service)
   if wrap_lists:
     new_list = SOAPpy.Types.structType(typed=0)
     for item in obj:
-      item_type = SoappyUtils.GetArrayItemTypeName(type_name, xmlns,
-                                                   soappy_service)
       new_list._addItem(item_element_name, PackForSoappy(
           item, xmlns, item_type, soappy_service, wrap_lists,
           prefix_function))
@@ -196,8 +195,6 @@ def _PackListForSoappy(obj, xmlns, type_name, soappy_service, wrap_lists,
   else:
     new_list = []
     for item in obj:
-      item_type = SoappyUtils.GetArrayItemTypeName(type_name, xmlns,
-                                                   soappy_service)
       new_list.append(PackForSoappy(item, xmlns, item_type, soappy_service,
                                     wrap_lists, prefix_function))
     return new_list
@@ -262,15 +259,15 @@ def _RestoreListTypesForResponse(response, type_name, ns, service):
     if not response: return response
     for key in response:
       if key.endswith("_Type"): type_name = response[key]
-    parameters = SoappyUtils.GenKeyOrderAttrs(service, ns, type_name)
-    for param, param_type, param_max_occurs in [
-        (param['name'], param['type'], param['maxOccurs'])
-        for param in parameters]:
+    schema_index = SoappyUtils.GetSchemaIndex(service)
+    for field in schema_index.GetType(type_name, ns).fields:
+      param = field['name']
       if not param in response:
         continue
+      param_type, param_max_occurs = field['type'], field['maxOccurs']
       value = response[param]
-      if ((SoappyUtils.IsAnArrayType(
-          param_type.getName(), param_type.getTargetNamespace(), service) or
+      if ((schema_index.IsAnArrayType(
+          param_type.getName(), param_type.getTargetNamespace()) or
            (not param_max_occurs.isdigit() or int(param_max_occurs) > 1)) and
           not isinstance(response[param], list)):
         value = [value]
@@ -278,7 +275,8 @@ def _RestoreListTypesForResponse(response, type_name, ns, service):
           value, param_type.getName(), param_type.getTargetNamespace(), service)
     return response
   elif isinstance(response, list):
-    return [_RestoreListTypesForResponse(item, SoappyUtils.GetArrayItemTypeName(
-        type_name, ns, service), ns, service) for item in response if item]
+    item_type = SoappyUtils.GetArrayItemTypeName(type_name, ns, service)
+    return [_RestoreListTypesForResponse(item, item_type, ns, service)
+            for item in response if item]
   else:
     return response
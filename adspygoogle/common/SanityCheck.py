@@ -132,53 +132,44 @@ def _SoappySanityCheckComplexType(soappy_service, obj, ns, xsi_type):
                      given WSDL-defined complex type.
   """
   ValidateTypes(((obj, dict),))
+  schema_index = SoappyUtils.GetSchemaIndex(soappy_service)
   obj_contained_type, type_key = SoappyUtils.GetExplicitType(obj, xsi_type, ns,
                                                              soappy_service)
 
   if obj_contained_type and not obj_contained_type == xsi_type:
-    try:
-      SoappyUtils.GetTypeFromSoappyService(obj_contained_type, ns,
-                                           soappy_service)
-    except KeyError:
+    if not schema_index.HasType(obj_contained_type, ns):
       raise ValidationError('Object of class \'%s\' has an explicit type of '
                             '\'%s\', but this explicit type is not defined in '
                             'the WSDL.' % (xsi_type, obj_contained_type))
-    if not SoappyUtils.IsASuperType(soappy_service, obj_contained_type, ns,
-                                    xsi_type):
+    if not schema_index.IsASuperType(obj_contained_type, ns, xsi_type):
       raise ValidationError('Expecting type of \'%s\' but given type of class '
                             '\'%s\'.' % (xsi_type, obj_contained_type))
     xsi_type = obj_contained_type
 
-  parameters = SoappyUtils.GenKeyOrderAttrs(soappy_service, ns, xsi_type)
+  field_map = schema_index.GetType(xsi_type, ns).field_map
   for key in obj:
     if obj[key] is None or key == type_key:
       continue
-    found = False
-    for parameter, param_type, max_occurs in [
-        (param['name'], param['type'], param['maxOccurs']) for
-        param in parameters]:
-      if parameter == key:
-        found = True
-        if not max_occurs.isdigit() or int(max_occurs) > 1:
-          # This parameter should be a list.
-          if isinstance(obj[key], (list, tuple)):
-            for item in obj[key]:
-              SoappySanityCheck(soappy_service, item,
-                                param_type.getTargetNamespace(),
-                                param_type.getName())
-          else:
-            raise ValidationError('Field \'%s\' in complex type \'%s\' should '
-                                  'be a list but value \'%s\' is a \'%s\' '
-                                  'instead.'
-                                  % (key, xsi_type, obj[key], type(obj[key])))
-        else:
-          SoappySanityCheck(soappy_service, obj[key],
-                            param_type.getTargetNamespace(),
-                            param_type.getName())
-        break
-    if not found:
+    if key not in field_map:
       raise ValidationError('Field \'%s\' is not in type \'%s\'.'
                             % (key, xsi_type))
+    param_type = field_map[key]['type']
+    max_occurs = field_map[key]['maxOccurs']
+    if not max_occurs.isdigit() or int(max_occurs) > 1:
+      # This parameter should be a list.
+      if isinstance(obj[key], (list, tuple)):
+        for item in obj[key]:
+          SoappySanityCheck(soappy_service, item,
+                            param_type.getTargetNamespace(),
+                            param_type.getName())
+      else:
+        raise ValidationError('Field \'%s\' in complex type \'%s\' should '
+                              'be a list but value \'%s\' is a \'%s\' '
+                              'instead.'
+                              % (key, xsi_type, obj[key], type(obj[key])))
+    else:
+      SoappySanityCheck(soappy_service, obj[key],
+                        param_type.getTargetNamespace(), param_type.getName())
 
 
 def _SoappySanityCheckSimpleType(obj, xsi_type):
@@ -269,12 +260,13 @@ def SoappySanityCheck(soappy_service, obj, ns, obj_type, max_occurs='1'):
                             'value \'%s\' is a \'%s\' instead.' %
                             (obj_type, obj, type(obj)))
   else:
+    schema_index = SoappyUtils.GetSchemaIndex(soappy_service)
     try:
-      soap_type = soappy_service.wsdl.types[ns].types[obj_type].tag
+      soap_type = schema_index.GetType(obj_type, ns).tag
       if soap_type == 'simpleType':
         _SoappySanityCheckSimpleType(obj, obj_type)
       elif soap_type == 'complexType':
-        if (SoappyUtils.IsAnArrayType(obj_type, ns, soappy_service) or
+        if (schema_index.IsAnArrayType(obj_type, ns) or
             not max_occurs.isdigit() or int(max_occurs) > 1):
           _SoappySanityCheckArray(soappy_service, obj, ns, obj_type)
         else:
@@ -111,11 +111,76 @@ if not PYXML_LIB and not ETREE_LIB:
   raise MissingPackageError(msg)
 
 
+# Keys of the HTTP and SOAP dumps, in the order they occur.
+_DUMP_TAGS = ('dumpHeadersOut', 'dumpSoapOut', 'dumpHeadersIn', 'dumpSoapIn')
+
+# Opening and closing tags of a SOAP body.
+_BODY_START = re.compile('<([\w.-]+:)?Body(\s[^>]*)?>')
+_BODY_END = re.compile('</([\w.-]+:)?Body>')
+
+
+def _ElideBody(soap_message, max_size):
+  """Cut the body of a SOAP message down to a maximum size.
+
+  The envelope and SOAP header are kept whole, so that they are still masked
+  and logged. A message with no SOAP body is cut as a whole.
+
+  Args:
+    soap_message: str SOAP XML message.
+    max_size: int Maximum number of bytes of the body to keep.
+
+  Returns:
+    str The message, with the end of its body replaced by a comment giving the
+    number of bytes left out. Not well-formed XML if anything was left out.
+  """
+  start = _BODY_START.search(soap_message)
+  end = None
+  if start:
+    for end in _BODY_END.finditer(soap_message, start.end()):
+      pass
+  if start and end:
+    body_start, body_end = start.end(), end.start()
+  else:
+    body_start, body_end = 0, len(soap_message)
+  elided = body_end - body_start - max_size
+  if elided <= 0:
+    return soap_message
+  return '%s<!-- %d bytes elided -->%s' % (
+      soap_message[:body_start + max_size], elided, soap_message[body_end:])
+
+
+def _Banner(title):
+  """Return the banner SOAPpy puts above a debug dump.
+
+  Args:
+    title: str Title of the dump.
+
+  Returns:
+    str Banner line.
+  """
+  banner = '*** %s ' % title
+  return banner + '*' * (72 - len(banner))
+
+
 class SoapBuffer(Buffer):
 
   """Implements a SoapBuffer.
 
   Catches and parses outgoing and incoming SOAP XML messages.
+
+  The HTTP transport hands the raw request and response to the buffer through
+  CaptureRequest() and CaptureResponse(); the dumps are only formatted when
+  they are asked for. Text written to the buffer in SOAPpy's debug dump format
+  is still understood when nothing has been captured.
+
+  The service can also hand over the name of the method called and the values
+  of the response's SOAP header, which it knows anyway, so that logging them
+  does not require parsing the XML messages. Likewise, it can be told to cut
+  large SOAP bodies down before they are dumped.
+
+  Each SOAP message is parsed at most once, and the dumps are formatted at
+  most once. Both are kept until the messages change, and every getter reads
+  from them.
   """
 
   def __init__(self, xml_parser=None, pretty_xml=False):
@@ -128,7 +193,14 @@ class SoapBuffer(Buffer):
     super(SoapBuffer, self).__init__()
 
     self._buffer = ''
-    self.__dump = {}
+    self._request = None
+    self._response = None
+    self._call_name = None
+    self._header_values = {}
+    self._max_soap_size = 0
+    # The dumps, formatted on first use. None until then.
+    self.__dump = None
+    self.__xml = {}
     self.__xml_parser = xml_parser
     # Pick a default XML parser, if none was set.
     if not self.__xml_parser:
@@ -159,16 +231,106 @@ class SoapBuffer(Buffer):
       str_in: str String to append to a buffer.
     """
     super(SoapBuffer, self).write(str_in)
+    self.__dump = None
+    self.__xml = {}
 
   def flush(self):
     super(SoapBuffer, self).flush()
 
+  def CaptureRequest(self, url, headers, soap_message):
+    """Record an outgoing HTTP request.
+
+    Args:
+      url: str URL, or path, the request was POSTed to.
+      headers: list HTTP headers sent, as (name, value) tuples.
+      soap_message: str Outgoing SOAP XML message, before compression.
+    """
+    self._request = (url, headers, soap_message)
+    self.__dump = None
+    self.__xml.pop('outgoing', None)
+
+  def CaptureResponse(self, status, reason, headers, soap_message):
+    """Record an incoming HTTP response.
+
+    Args:
+      status: int HTTP status code.
+      reason: str HTTP reason phrase.
+      headers: list HTTP headers received, as (name, value) tuples.
+      soap_message: str Incoming SOAP XML message, after decompression.
+    """
+    self._response = (status, reason, headers, soap_message)
+    self.__dump = None
+    self.__xml.pop('incoming', None)
+
+  def SetCallName(self, call_name):
+    """Record the name of the API method called.
+
+    Args:
+      call_name: str Name of the API method, as in the SOAP body.
+    """
+    self._call_name = call_name
+
+  def SetResponseHeaderValues(self, header_values):
+    """Record the values of the response's SOAP header fields.
+
+    Args:
+      header_values: dict Text of each field of the SOAP header, such as
+                     requestId, keyed by its name without its namespace.
+    """
+    self._header_values = header_values
+
+  def SetMaxSoapSize(self, max_size):
+    """Cut the bodies of captured SOAP messages down when they are dumped.
+
+    A message whose body is larger is neither prettified nor dumped whole, so
+    that logging it costs little. The envelope and SOAP header are kept.
+
+    Args:
+      max_size: int Maximum number of bytes of a SOAP body to dump, or 0 to
+                dump bodies whole.
+    """
+    self._max_soap_size = max_size
+    self.__dump = None
+
+  def GetResponseHeaderValues(self):
+    """Return the values recorded with SetResponseHeaderValues().
+
+    Returns:
+      dict Text of each field of the SOAP header, keyed by its name.
+    """
+    return dict(self._header_values)
+
+  def _GetResponseHeaderValue(self, name):
+    """Return a value recorded with SetResponseHeaderValues().
+
+    Args:
+      name: str Name of the SOAP header field.
+
+    Returns:
+      str Value of the field, or None if it was not recorded.
+    """
+    return self._header_values.get(name)
+
+  def IsCaptured(self):
+    """Whether the traffic was captured from the transport or written as text.
+
+    Returns:
+      bool True if a request or response was captured, False otherwise.
+    """
+    return self._request is not None or self._response is not None
+
   def GetBufferAsStr(self):
     """Return buffer as string.
 
+    If the traffic was captured, it is rendered in SOAPpy's debug dump format.
+
     Returns:
       str Content of buffer.
     """
+    if self.IsCaptured():
+      dumps = self.__GetDumps()
+      return ''.join(['%s\n' % dumps[tag] for tag in _DUMP_TAGS
+                      if tag in dumps])
     return super(SoapBuffer, self).GetBufferAsStr()
 
   def IsHandshakeComplete(self):
@@ -185,17 +347,79 @@ class SoapBuffer(Buffer):
       return True
     return False
 
+  def __GetCapturedAsDict(self):
+    """Format captured HTTP headers and SOAP data.
+
+    Returns:
+      dict Request's HTTP headers and SOAP data.
+    """
+    dumps = {}
+    if self._request is not None:
+      url, headers, soap_message = self._request
+      lines = [_Banner('Outgoing HTTP headers'), 'POST %s HTTP/1.1' % url]
+      for name, value in headers:
+        # Insert XML parser signature into the SOAP header.
+        if name.lower() == 'content-type':
+          lines.append('XML-parser: %s' % self.__xml_parser_sig)
+        lines.append('%s:%s' % (name, value))
+      lines.append('*' * 72)
+      dumps['dumpHeadersOut'] = '\n'.join(lines)
+      dumps['dumpSoapOut'] = self.__FormatSoap('Outgoing SOAP', soap_message)
+    if self._response is not None:
+      status, reason, headers, soap_message = self._response
+      lines = [_Banner('Incoming HTTP headers'),
+               'HTTP/1.? %s %s' % (status, reason)]
+      lines.extend(['%s: %s' % header for header in headers])
+      lines.append('*' * 72)
+      dumps['dumpHeadersIn'] = '\n'.join(lines)
+      if soap_message:
+        dumps['dumpSoapIn'] = self.__FormatSoap('Incoming SOAP', soap_message)
+    return dumps
+
+  def __FormatSoap(self, title, soap_message):
+    """Format a SOAP message the way SOAPpy dumps it.
+
+    Args:
+      title: str Title of the dump.
+      soap_message: str SOAP XML message.
+
+    Returns:
+      str SOAP message between banners, prettified if requested.
+    """
+    soap_message = soap_message.strip('\n')
+    if self._max_soap_size and len(soap_message) > self._max_soap_size:
+      elided_message = _ElideBody(soap_message, self._max_soap_size)
+      if elided_message != soap_message:
+        return '%s\n%s\n%s' % (_Banner(title), elided_message, '*' * 72)
+    if self.__pretty_xml:
+      soap_message = self.__PrettyPrintXml(soap_message, 1)
+    return '%s\n%s\n%s' % (_Banner(title), soap_message, '*' * 72)
+
+  def __GetDumps(self):
+    """Return the dumps of the HTTP headers and SOAP data, formatting them once.
+
+    Returns:
+      dict Request's HTTP headers and SOAP data.
+    """
+    if self.__dump is None:
+      self.__dump = self.__GetBufferAsDict()
+    return self.__dump
+
   def __GetBufferAsDict(self):
     """Parse HTTP headers and SOAP data.
 
     Returns:
       dict Request's HTTP headers and SOAP data.
     """
+    if self.IsCaptured():
+      return self.__GetCapturedAsDict()
+
     tags = (('Outgoing HTTP headers', 'dumpHeadersOut'),
             ('Outgoing SOAP', 'dumpSoapOut'),
             ('Incoming HTTP headers', 'dumpHeadersIn'),
             ('Incoming SOAP', 'dumpSoapIn'))
     # The HTTP and SOAP messages were delivered via SOAPpy or httplib.HTTPS.
+    dumps = {}
     xml_dumps = self.GetBufferAsStr().split('\n' + ('*' * 72) + '\n')
     for xml_part in xml_dumps:
       xml_part = xml_part.lstrip('\n').rstrip('\n')
@@ -219,9 +443,9 @@ class SoapBuffer(Buffer):
             if banner:
               xml_part = '%s\n%s' % (banner,
                                      self.__PrettyPrintXml('\n'.join(doc), 1))
-          self.__dump[tag] = (xml_part + '\n' + '*' * 72)
+          dumps[tag] = (xml_part + '\n' + '*' * 72)
           break
-    return self.__dump
+    return dumps
 
   def __GetDumpValue(self, dump_type):
     """Return dump value given its type.
@@ -232,15 +456,7 @@ class SoapBuffer(Buffer):
     Returns:
       str Value of the dump.
     """
-    dump_value = None
-    try:
-      if dump_type in self.__dump:
-        dump_value = self.__dump[dump_type]
-      else:
-        dump_value = self.__GetBufferAsDict()[dump_type]
-    except KeyError:
-      dump_value = ''
-    return dump_value
+    return self.__GetDumps().get(dump_type, '')
 
   def GetHeadersOut(self):
     """Return outgoing headers dump.
@@ -287,15 +503,30 @@ class SoapBuffer(Buffer):
     Returns:
       str Raw incoming SOAP dump.
     """
+    if self._response is not None:
+      return self.__PrettyPrintXml(self._response[3], -1)
     doc = ''.join(self.GetSoapIn().split('\n')[1:-1])
     return self.__PrettyPrintXml(doc, -1)
 
   def _GetXmlOut(self):
     """Remove banners from outgoing SOAP XML and contstruct XML object.
 
+    The object is built once and returned again until the message changes.
+
+    Returns:
+      Document/Element object generated from string, representing XML message.
+    """
+    return self.__GetXml('outgoing', self.__BuildXmlOut)
+
+  def __BuildXmlOut(self):
+    """Construct XML object from outgoing SOAP XML.
+
     Returns:
       Document/Element object generated from string, representing XML message.
     """
+    if self._request is not None:
+      return self.__ParseXml(self._request[2], 'outgoing')
+
     # Remove banners.
     xml_dump = self.GetSoapOut().lstrip('\n').rstrip('\n')
     xml_parts = xml_dump.split('\n')
@@ -314,35 +545,76 @@ class SoapBuffer(Buffer):
     if non_xml: print non_xml
 
     xml_dump = '\n'.join(xml_parts[begin:len(xml_parts)-1])
-
-    try:
-      if self.__xml_parser == PYXML:
-        xml_obj = minidom.parseString(xml_dump)
-      elif self.__xml_parser == ETREE:
-        xml_obj = etree.fromstring(xml_dump)
-    except (ExpatError, SyntaxError), e:
-      msg = 'Unable to parse SOAP buffer for outgoing messages. %s' % e
-      raise MalformedBufferError(msg)
-    return xml_obj
+    return self.__ParseXml(xml_dump, 'outgoing')
 
   def _GetXmlIn(self):
     """Remove banners from incoming SOAP XML and construct XML object.
 
+    The object is built once and returned again until the message changes.
+
     Returns:
       Document/Element object generated from string, representing XML message.
     """
+    return self.__GetXml('incoming', self.__BuildXmlIn)
+
+  def __BuildXmlIn(self):
+    """Construct XML object from incoming SOAP XML.
+
+    Returns:
+      Document/Element object generated from string, representing XML message.
+    """
+    if self._response is not None:
+      return self.__ParseXml(self._response[3], 'incoming')
+
     # Remove banners.
     xml_dump = self.GetSoapIn().lstrip('\n').rstrip('\n')
     xml_parts = xml_dump.split('\n')
     xml_dump = '\n'.join(xml_parts[1:len(xml_parts)-1])
+    return self.__ParseXml(xml_dump, 'incoming')
+
+  def __GetXml(self, direction, build):
+    """Return the XML object of a message, building it on first use.
+
+    A message which could not be parsed is not parsed again; the same error is
+    raised instead.
 
+    Args:
+      direction: str Either 'outgoing' or 'incoming'.
+      build: function Builds the XML object of the message.
+
+    Returns:
+      Document/Element object generated from string, representing XML message.
+
+    Raises:
+      MalformedBufferError: if the message is not valid XML.
+    """
+    if direction not in self.__xml:
+      try:
+        self.__xml[direction] = build()
+      except MalformedBufferError, e:
+        self.__xml[direction] = e
+    xml_obj = self.__xml[direction]
+    if isinstance(xml_obj, MalformedBufferError):
+      raise xml_obj
+    return xml_obj
+
+  def __ParseXml(self, xml_dump, direction):
+    """Construct XML object from a SOAP XML message.
+
+    Args:
+      xml_dump: str SOAP XML message.
+      direction: str Either 'outgoing' or 'incoming', used in error messages.
+
+    Returns:
+      Document/Element object generated from string, representing XML message.
+    """
     try:
       if self.__xml_parser == PYXML:
         xml_obj = minidom.parseString(xml_dump)
       elif self.__xml_parser == ETREE:
         xml_obj = etree.fromstring(xml_dump)
     except (ExpatError, SyntaxError), e:
-      msg = 'Unable to parse SOAP buffer for incoming messages. %s' % e
+      msg = 'Unable to parse SOAP buffer for %s messages. %s' % (direction, e)
       raise MalformedBufferError(msg)
     return xml_obj
 
@@ -423,14 +695,14 @@ class SoapBuffer(Buffer):
     Returns:
       bool True if message is a SOAP, False otherwise.
     """
-    data = self.GetBufferAsStr()
-    if not data:
+    if not self.IsCaptured() and not self._buffer:
       return False
     try:
       if self.__xml_parser == PYXML:
+        xml_obj = self._GetXmlIn()
         if (self.GetCallResponseTime() is None and
-            not self._GetXmlIn().getElementsByTagName('soapenv:Body') and
-            not self._GetXmlIn().getElementsByTagName('soap:Body')):
+            not xml_obj.getElementsByTagName('soapenv:Body') and
+            not xml_obj.getElementsByTagName('soap:Body')):
           return False
       elif self.__xml_parser == ETREE:
         if self.__GetXmlNameByName(self._GetXmlIn(), 'Body') is None:
@@ -461,6 +733,8 @@ class SoapBuffer(Buffer):
     Returns:
       str Name of the API method that was called.
     """
+    if self._call_name is not None:
+      return self._call_name
     if self.__xml_parser == PYXML:
       # Remove "nsX:" if exists.
       pattern = re.compile('ns.*?:')
@@ -472,7 +746,7 @@ class SoapBuffer(Buffer):
 
   def GetFaultAsDictWhenOtherFails(self):
     ''' Since this is an ETREE, we have to parse through the whole thing '''
-    xml_obj = xml_obj = self._GetXmlIn()
+    xml_obj = self._GetXmlIn()
     fault_node = xml_obj.getchildren()[-1].getchildren()[0]
 
     fault_code_elem = None
@@ -558,8 +832,8 @@ class SoapBuffer(Buffer):
     """
     if not obj:
       elems = ['soapenv:Fault', 'soap:Fault']
+      xml_obj = self._GetXmlIn()
       for elem in elems:
-        xml_obj = self._GetXmlIn()
         if self.__xml_parser == PYXML:
           try:
             obj = xml_obj.getElementsByTagName(elem)[0]
@@ -640,6 +914,7 @@ class SoapBuffer(Buffer):
     """
     # Prepare string for use with regular expression.
     xml_in = xml_in.replace('\n', '%newline%')
+    self.__xml = {}
 
     try:
       pattern = re.compile('(<SOAP-ENV:Envelope:Envelope.*</SOAP-ENV:Envelope>|'
@@ -653,7 +928,7 @@ class SoapBuffer(Buffer):
       if req:
         # Rebuild original formatting of the string and dump it.
         req = req[0].replace('%newline%', '\n')
-        self.__dump['dumpSoapOut'] = (
+        self.__GetDumps()['dumpSoapOut'] = (
             '%s Outgoing SOAP %s\n'
             '<?xml version="1.0" encoding="UTF-8"?>\n%s\n'
             '%s' % ('*' * 3, '*' * 54, req, '*' * 72))
@@ -662,7 +937,7 @@ class SoapBuffer(Buffer):
       if res:
         # Rebuild original formatting of the string and dump it.
         res = res[0].replace('%newline%', '\n')
-        self.__dump['dumpSoapIn'] = (
+        self.__GetDumps()['dumpSoapIn'] = (
             '%s Incoming SOAP %s\n'
             '<?xml version="1.0" encoding="UTF-8"?>\n%s\n'
             '%s' % ('*' * 3, '*' * 54, res.lstrip('\n'), '*' * 72))
@@ -0,0 +1,395 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Two tier cache of WSDL documents and the SOAPpy proxies parsed from them.
+
+The first tier keeps one parsed SOAPpy.WSDL.Proxy per WSDL URL in memory, and
+is shared by every service of every client in the process. The second tier
+keeps the WSDL documents on disk, so that a new process does not need to
+download them again. Both tiers can be revalidated against the server once an
+entry is older than a given TTL, using the ETag and Last-Modified headers the
+server sent with the document. The disk tier also keeps the schema index
+compiled from each document, so that it does not need to be compiled again.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import hashlib
+import httplib
+import os
+import pickle
+import re
+import StringIO
+import threading
+import time
+import urllib2
+
+from adspygoogle import SOAPpy
+from adspygoogle.common.Errors import Error
+from adspygoogle.common.soappy import SchemaIndex
+
+
+# Name of the directory, under the client's home, holding the on-disk cache.
+CACHE_DIR_NAME = 'wsdl_cache'
+
+# Maps WSDL URLs to _Entry instances.
+_entries = {}
+# Guards _entries and _url_locks.
+_entries_lock = threading.Lock()
+# Maps WSDL URLs to locks that make sure a WSDL is only loaded once at a time.
+_url_locks = {}
+
+
+class _Entry(object):
+
+  """A parsed WSDL held in memory."""
+
+  def __init__(self, proxy, etag, last_modified, validated):
+    """Inits _Entry.
+
+    Args:
+      proxy: SOAPpy.WSDL.Proxy The parsed WSDL.
+      etag: str The ETag the server sent with the document, if any.
+      last_modified: str The Last-Modified date the server sent, if any.
+      validated: float When the document was last known to be current.
+    """
+    self.proxy = proxy
+    self.etag = etag
+    self.last_modified = last_modified
+    self.validated = validated
+
+
+def GetProxy(wsdl_url, cache_dir=None, ttl=None, http_proxy=None):
+  """Returns a SOAPpy proxy for the given WSDL, going to the network if needed.
+
+  Args:
+    wsdl_url: str The URL of the WSDL.
+    [optional]
+    cache_dir: str The directory of the on-disk cache. If None, only the
+               in-memory cache is used.
+    ttl: int Number of seconds a cached WSDL is used before being revalidated
+         with the server. If None, cached WSDLs are never revalidated.
+    http_proxy: str HTTP proxy to download the WSDL through, as host:port.
+
+  Returns:
+    SOAPpy.WSDL.Proxy The proxy parsed from the WSDL. The same instance is
+    handed to every caller asking for the same URL.
+
+  Raises:
+    Error: if the WSDL could neither be downloaded nor found in the cache.
+  """
+  entry = _entries.get(wsdl_url)
+  if entry is not None and not _IsExpired(entry.validated, ttl):
+    return entry.proxy
+
+  _entries_lock.acquire()
+  try:
+    url_lock = _url_locks.setdefault(wsdl_url, threading.Lock())
+  finally:
+    _entries_lock.release()
+
+  url_lock.acquire()
+  try:
+    # Another thread may have loaded the WSDL while this one was waiting.
+    entry = _entries.get(wsdl_url)
+    if entry is not None and not _IsExpired(entry.validated, ttl):
+      return entry.proxy
+    entry = _Load(wsdl_url, entry, cache_dir, ttl, http_proxy)
+    _entries[wsdl_url] = entry
+    return entry.proxy
+  finally:
+    url_lock.release()
+
+
+def Clear(cache_dir=None):
+  """Empties the in-memory cache and, optionally, an on-disk cache.
+
+  Args:
+    [optional]
+    cache_dir: str The directory of the on-disk cache to empty.
+  """
+  _entries_lock.acquire()
+  try:
+    _entries.clear()
+  finally:
+    _entries_lock.release()
+  if cache_dir and os.path.isdir(cache_dir):
+    for name in os.listdir(cache_dir):
+      if name.endswith('.wsdl') or name.endswith('.pkl'):
+        os.remove(os.path.join(cache_dir, name))
+
+
+def _Load(wsdl_url, entry, cache_dir, ttl, http_proxy=None):
+  """Loads a WSDL from disk or from the network.
+
+  Args:
+    wsdl_url: str The URL of the WSDL.
+    entry: _Entry The expired in-memory entry for this WSDL, if any.
+    cache_dir: str The directory of the on-disk cache, if any.
+    ttl: int Number of seconds a cached WSDL is considered current.
+    [optional]
+    http_proxy: str HTTP proxy to download the WSDL through, as host:port.
+
+  Returns:
+    _Entry A current entry for this WSDL.
+
+  Raises:
+    Error: if the WSDL could neither be downloaded nor found in the cache.
+  """
+  document = None
+  metadata = {}
+  if cache_dir:
+    document, metadata = _ReadFromDisk(cache_dir, wsdl_url)
+    if (entry is None and document is not None and
+        not _IsExpired(metadata.get('validated', 0), ttl)):
+      return _Entry(_Parse(wsdl_url, document, cache_dir),
+                    metadata.get('etag'), metadata.get('last_modified'),
+                    metadata['validated'])
+
+  # Prefer the validators of whichever cached copy will be used on a 304.
+  if entry is not None:
+    etag, last_modified = entry.etag, entry.last_modified
+  elif document is not None:
+    etag, last_modified = metadata.get('etag'), metadata.get('last_modified')
+  else:
+    etag, last_modified = None, None
+
+  try:
+    fetched, etag, last_modified = _Fetch(wsdl_url, etag, last_modified,
+                                            http_proxy)
+  except (IOError, httplib.HTTPException), e:
+    # Keep working off a stale copy rather than failing.
+    if entry is not None:
+      return entry
+    if document is not None:
+      return _Entry(_Parse(wsdl_url, document, cache_dir),
+                    metadata.get('etag'), metadata.get('last_modified'),
+                    metadata.get('validated', 0))
+    raise Error('Unable to locate WSDL at path \'%s\'. %s' % (wsdl_url, e))
+
+  now = time.time()
+  if fetched is not None:
+    document = fetched
+    entry = None
+  if cache_dir and document is not None:
+    _WriteToDisk(cache_dir, wsdl_url, document, {
+        'url': wsdl_url,
+        'etag': etag,
+        'last_modified': last_modified,
+        'validated': now
+    })
+  if entry is None:
+    entry = _Entry(_Parse(wsdl_url, document, cache_dir), etag, last_modified,
+                   now)
+  else:
+    entry.validated = now
+  return entry
+
+
+def _IsExpired(validated, ttl):
+  """Checks whether a cached WSDL needs to be revalidated.
+
+  Args:
+    validated: float When the WSDL was last known to be current.
+    ttl: int Number of seconds a cached WSDL is considered current, or None.
+
+  Returns:
+    bool True if the WSDL should be revalidated, False otherwise.
+  """
+  return ttl is not None and time.time() - validated >= ttl
+
+
+def _Fetch(wsdl_url, etag=None, last_modified=None, http_proxy=None):
+  """Downloads a WSDL, unless the server says the cached copy is current.
+
+  Args:
+    wsdl_url: str The URL of the WSDL.
+    [optional]
+    etag: str The ETag of the cached copy.
+    last_modified: str The Last-Modified date of the cached copy.
+    http_proxy: str HTTP proxy to download the WSDL through, as host:port.
+
+  Returns:
+    tuple (str, str, str) The document, or None if the cached copy is current,
+    followed by the ETag and Last-Modified date to store with it.
+  """
+  request = urllib2.Request(wsdl_url)
+  if etag:
+    request.add_header('If-None-Match', etag)
+  if last_modified:
+    request.add_header('If-Modified-Since', last_modified)
+  if http_proxy:
+    opener = urllib2.build_opener(urllib2.ProxyHandler({'http': http_proxy,
+                                                        'https': http_proxy}))
+  else:
+    opener = urllib2.build_opener()
+  try:
+    response = opener.open(request)
+  except urllib2.HTTPError, e:
+    if e.code == 304:
+      return (None, e.info().getheader('ETag', etag),
+              e.info().getheader('Last-Modified', last_modified))
+    raise
+  try:
+    document = response.read()
+  finally:
+    response.close()
+  return (document, response.info().getheader('ETag'),
+          response.info().getheader('Last-Modified'))
+
+
+def _Parse(wsdl_url, document, cache_dir=None):
+  """Parses a WSDL document into a SOAPpy proxy.
+
+  The proxy is handed its schema index, which is read from the disk cache when
+  it was compiled from this very document before, and compiled and written to
+  the disk cache otherwise.
+
+  Args:
+    wsdl_url: str The URL the document was loaded from.
+    document: str The WSDL document.
+    [optional]
+    cache_dir: str The directory of the on-disk cache, if any.
+
+  Returns:
+    SOAPpy.WSDL.Proxy The parsed WSDL.
+
+  Raises:
+    Error: if the document is not a valid WSDL.
+  """
+  try:
+    proxy = SOAPpy.WSDL.Proxy(StringIO.StringIO(document), noroot=1)
+  except Exception, e:
+    raise Error('Unable to parse WSDL at path \'%s\'. %s' % (wsdl_url, e))
+  if cache_dir:
+    digest = hashlib.sha1(document).hexdigest()
+    path = _GetCachePath(cache_dir, wsdl_url) + '.index.pkl'
+    index = _ReadIndex(path, digest)
+    if index is None:
+      index = SchemaIndex.Compile(proxy)
+      _WriteFile(path, pickle.dumps({'digest': digest, 'index': index},
+                                    pickle.HIGHEST_PROTOCOL))
+    proxy.__dict__['schema_index'] = index
+  return proxy
+
+
+def _ReadIndex(path, digest):
+  """Reads a schema index from the disk cache.
+
+  Args:
+    path: str The path of the pickled index.
+    digest: str The SHA-1 digest of the WSDL document the index should have
+            been compiled from.
+
+  Returns:
+    SchemaIndex The index, or None if it is missing, unreadable, stale or was
+    pickled by an incompatible version of the library.
+  """
+  try:
+    fh = open(path, 'rb')
+    try:
+      cached = pickle.load(fh)
+    finally:
+      fh.close()
+  except Exception:
+    return None
+  index = cached.get('index')
+  if (cached.get('digest') != digest or
+      getattr(index, 'format_version', None) != SchemaIndex.FORMAT_VERSION):
+    return None
+  return index
+
+
+def _GetCachePath(cache_dir, wsdl_url):
+  """Returns the path, minus extension, of a WSDL's files in the disk cache.
+
+  Args:
+    cache_dir: str The directory of the on-disk cache.
+    wsdl_url: str The URL of the WSDL.
+
+  Returns:
+    str The path, with the URL's host, API version and service in the name.
+  """
+  name = re.sub('^[a-z]+://', '', wsdl_url.lower().replace('?wsdl', ''))
+  return os.path.join(cache_dir, re.sub('[^a-z0-9.-]+', '_', name))
+
+
+def _ReadFromDisk(cache_dir, wsdl_url):
+  """Reads a WSDL and its metadata from the disk cache.
+
+  Args:
+    cache_dir: str The directory of the on-disk cache.
+    wsdl_url: str The URL of the WSDL.
+
+  Returns:
+    tuple (str, dict) The document and its metadata, or (None, {}) if the WSDL
+    is not cached or the cached files can not be read.
+  """
+  path = _GetCachePath(cache_dir, wsdl_url)
+  try:
+    fh = open(path + '.pkl', 'rb')
+    try:
+      metadata = pickle.load(fh)
+    finally:
+      fh.close()
+    if metadata.get('url') != wsdl_url:
+      return None, {}
+    fh = open(path + '.wsdl', 'rb')
+    try:
+      return fh.read(), metadata
+    finally:
+      fh.close()
+  except (IOError, OSError, EOFError, pickle.UnpicklingError):
+    return None, {}
+
+
+def _WriteToDisk(cache_dir, wsdl_url, document, metadata):
+  """Writes a WSDL and its metadata to the disk cache.
+
+  Files are written under temporary names and renamed into place, so that
+  concurrent processes never read a partially written document. Failing to
+  write the cache is not an error.
+
+  Args:
+    cache_dir: str The directory of the on-disk cache.
+    wsdl_url: str The URL of the WSDL.
+    document: str The WSDL document.
+    metadata: dict The metadata to store with the document.
+  """
+  path = _GetCachePath(cache_dir, wsdl_url)
+  _WriteFile(path + '.wsdl', document)
+  _WriteFile(path + '.pkl', pickle.dumps(metadata))
+
+
+def _WriteFile(path, data):
+  """Atomically writes a file of the disk cache, ignoring any failure.
+
+  Args:
+    path: str The path of the file.
+    data: str The contents of the file.
+  """
+  suffix = '.%d.%d.tmp' % (os.getpid(), threading.currentThread().ident or 0)
+  try:
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    fh = open(path + suffix, 'wb')
+    try:
+      fh.write(data)
+    finally:
+      fh.close()
+    os.rename(path + suffix, path)
+  except (IOError, OSError):
+    pass
@@ -0,0 +1,465 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""SOAPpy HTTP transport which speaks HTTP/1.1 over pooled connections."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import base64
+import errno
+import gzip
+import httplib
+import re
+import socket
+import StringIO
+import sys
+import time
+import zlib
+
+from adspygoogle.SOAPpy.Client import HTTPTransport
+from adspygoogle.SOAPpy.Client import SOAPAddress
+from adspygoogle.SOAPpy.Client import SOAPUserAgent
+from adspygoogle.SOAPpy.Config import Config
+from adspygoogle.SOAPpy.Errors import HTTPError
+from adspygoogle.common.ConnectionPool import NewConnection
+from adspygoogle.common.Errors import Error
+from adspygoogle.common.soappy.ResponseDecoder import UnsupportedResponseError
+
+
+# Number of bytes read off the socket at a time when streaming a response.
+STREAM_CHUNK_SIZE = 65536
+
+# Lines BadStatusLine holds when the server closed the connection before
+# sending anything, depending on the version of Python.
+_EMPTY_STATUS_LINES = ('', "''", 'No status line received - the server has '
+                       'closed the connection')
+
+
+class HttpTransport(HTTPTransport):
+
+  """Drop-in replacement for SOAPpy's HTTPTransport.
+
+  SOAPpy's own transport opens a new HTTP/1.0 connection for every call. This
+  one sends HTTP/1.1 requests and, when given a ConnectionPool, keeps the
+  connection open afterwards so that the next call to the same server skips the
+  TCP and SSL handshakes. Without a pool, every call uses a fresh connection
+  which is closed once the response has been read.
+
+  Each request and response can be handed, raw, to a capture object such as a
+  SoapBuffer. The SOAPpy debug dumps, when turned on in the SOAPpy config, are
+  formatted exactly as SOAPpy formats them, but can be written to any file-like
+  object rather than sys.stdout.
+
+  Successful responses can also be streamed into a ResponseDecoder as they are
+  read off the socket, decompressing them on the fly, so that the body of a
+  large response never has to be held in memory as a whole. Only the SOAP
+  envelope up to the start of the body is kept for the capture object and the
+  debug dumps.
+
+  The time spent connecting, sending, waiting and receiving, and the sizes of
+  the request and response, can be recorded into a CallMetrics.
+  """
+
+  def __init__(self, additional_headers=None, connection_pool=None,
+               output=None, capture=None, metrics=None):
+    """Inits HttpTransport.
+
+    Args:
+      [optional]
+      additional_headers: dict Extra HTTP headers to send with each request.
+      connection_pool: ConnectionPool Pool to check connections out of.
+      output: file File-like object to write the debug dumps to. Defaults to
+              sys.stdout.
+      capture: SoapBuffer Object whose CaptureRequest() and CaptureResponse()
+               methods are given the raw request and response of each call.
+      metrics: CallMetrics Object to record the timings and sizes of each call
+               into.
+    """
+    HTTPTransport.__init__(self, additional_headers)
+    self.connection_pool = connection_pool
+    self.output = output
+    self.capture = capture
+    self.metrics = metrics
+
+  def call(self, addr, data, namespace, soapaction=None, encoding=None,
+           http_proxy=None, config=Config, decoder=None):
+    """Posts a SOAP message and returns the server's response.
+
+    Args:
+      addr: SOAPAddress or str The address of the SOAP service.
+      data: str The SOAP message to send.
+      namespace: str The namespace of the called method.
+      [optional]
+      soapaction: str The SOAPAction header value.
+      encoding: str The character set of the SOAP message.
+      http_proxy: str The host[:port] of an HTTP proxy to go through.
+      config: SOAPpy.Config.SOAPConfig The configuration to use for this call.
+      decoder: ResponseDecoder Decoder to stream a successful response into.
+
+    Returns:
+      tuple (str, str) The response payload and the, possibly extended,
+      namespace of the response. The payload is None if the response was
+      streamed into the decoder, whose Close() method then returns its value.
+
+    Raises:
+      HTTPError: if the server does not respond with a SOAP message.
+      Error: if a streamed response turns out to be one the decoder can not
+             decode, too late to hand it to SOAPpy instead.
+    """
+    out = self.output or sys.stdout
+    if not isinstance(addr, SOAPAddress):
+      addr = SOAPAddress(addr, config)
+
+    if addr.proto == 'httpg':
+      # Globus connections are not pooled, let SOAPpy deal with them.
+      return HTTPTransport.call(self, addr, data, namespace, soapaction,
+                                encoding, http_proxy, config)
+
+    if config.send_compressed:
+      self.additional_headers['Content-Encoding'] = 'gzip'
+      buf = StringIO.StringIO()
+      gzip_file = gzip.GzipFile(mode='wb', fileobj=buf)
+      gzip_file.write(data)
+      gzip_file.close()
+      transport_data = buf.getvalue()
+    else:
+      if 'Content-Encoding' in self.additional_headers:
+        del self.additional_headers['Content-Encoding']
+      transport_data = data
+
+    if config.accept_compressed:
+      self.additional_headers['Accept-Encoding'] = 'gzip'
+    elif 'Accept-Encoding' in self.additional_headers:
+      del self.additional_headers['Accept-Encoding']
+
+    if http_proxy:
+      real_addr = http_proxy
+      real_path = addr.proto + '://' + addr.host + addr.path
+    else:
+      real_addr = addr.host
+      real_path = addr.path
+
+    content_type = 'text/xml'
+    if encoding is not None:
+      content_type += '; charset="%s"' % encoding
+    headers = [('Host', addr.host),
+               ('User-agent', SOAPUserAgent()),
+               ('Content-type', content_type),
+               ('Content-length', str(len(transport_data)))]
+    if addr.user is not None:
+      val = base64.encodestring(addr.user)
+      headers.append(('Authorization', 'Basic ' + val.replace('\012', '')))
+    headers.extend(self.additional_headers.items())
+    if not soapaction:
+      headers.append(('SOAPAction', ''))
+    else:
+      headers.append(('SOAPAction', '"%s"' % soapaction))
+
+    if self.capture is not None:
+      self.capture.CaptureRequest(real_path, headers, data)
+    if self.metrics is not None:
+      self.metrics.request_size = len(data)
+      self.metrics.request_size_sent = len(transport_data)
+
+    if config.dumpHeadersOut:
+      _DebugHeader(out, 'Outgoing HTTP headers')
+      print >>out, 'POST %s HTTP/1.1' % real_path
+      for header in headers:
+        print >>out, '%s:%s' % header
+      _DebugFooter(out)
+
+    if config.dumpSOAPOut:
+      _DebugHeader(out, 'Outgoing SOAP')
+      print >>out, data,
+      if data[-1] != '\n':
+        print >>out
+      _DebugFooter(out)
+
+    code, msg, response_headers, data, streamed = self._Exchange(
+        addr.proto, real_addr, real_path, headers, transport_data, decoder)
+
+    content_type = response_headers.get('content-type', 'text/xml')
+    if (response_headers.get('content-encoding', None) == 'gzip' and
+        streamed is None):
+      data = gzip.GzipFile(fileobj=StringIO.StringIO(data), mode='rb').read()
+    if self.metrics is not None:
+      self.metrics.status = code
+      if streamed is None:
+        self.metrics.response_size = len(data)
+
+    if self.capture is not None:
+      self.capture.CaptureResponse(code, msg, GetHeaderTuples(response_headers),
+                                   data)
+
+    if config.debug:
+      print >>out, 'code=', code
+      print >>out, 'msg=', msg
+      print >>out, 'headers=', response_headers
+      print >>out, 'content-type=', content_type
+      print >>out, 'data=', data
+
+    if config.dumpHeadersIn:
+      _DebugHeader(out, 'Incoming HTTP headers')
+      print >>out, 'HTTP/1.? %d %s' % (code, msg)
+      print >>out, '\n'.join([x.strip() for x in response_headers.headers])
+      _DebugFooter(out)
+
+    if code == 500 and not (content_type.startswith('text/xml') and data):
+      raise HTTPError(code, msg)
+
+    if config.dumpSOAPIn:
+      _DebugHeader(out, 'Incoming SOAP')
+      print >>out, data,
+      if data and data[-1] != '\n':
+        print >>out
+      _DebugFooter(out)
+
+    if code not in (200, 500):
+      raise HTTPError(code, msg)
+
+    if namespace is None:
+      new_ns = None
+    else:
+      new_ns = self.getNS(namespace, data)
+    if streamed:
+      data = None
+    return data, new_ns
+
+  def _Exchange(self, scheme, address, path, headers, body, decoder=None):
+    """Sends a POST request and reads the whole response.
+
+    If a connection taken from the pool turns out to have been closed by the
+    server, the request is sent once more over another connection. That is only
+    done when the request could not be sent, or when the server closed the
+    connection without sending a single byte of a response, as servers do with
+    idle connections, so that a request the server may have acted on is never
+    sent twice.
+
+    Args:
+      scheme: str Either 'http' or 'https'.
+      address: str The host[:port] to connect to.
+      path: str The path, or full URL when using a proxy, to POST to.
+      headers: list (name, value) tuples of HTTP headers to send.
+      body: str The request payload.
+      [optional]
+      decoder: ResponseDecoder Decoder to stream a successful response into.
+
+    Returns:
+      tuple (int, str, httplib.HTTPMessage, str, bool) The status code, the
+      reason phrase, the response headers, the response payload and whether
+      the payload was streamed into the decoder. The last is None if the
+      response was not streamed, in which case the payload is the raw one.
+      Otherwise the payload is decompressed and, if the decoder consumed the
+      response, cut off at the start of the SOAP body.
+    """
+    while True:
+      start = time.time()
+      if self.connection_pool is not None:
+        connection, reused = self.connection_pool.Acquire(scheme, address)
+      else:
+        connection, reused = NewConnection(scheme, address), False
+      response = None
+      sent = False
+      try:
+        if connection.sock is None:
+          connection.connect()
+        start = self._AddTime('connect', start)
+        connection.putrequest('POST', path, skip_host=1,
+                              skip_accept_encoding=1)
+        for name, value in headers:
+          connection.putheader(name, value)
+        try:
+          # Sends the body in the same packet as the headers, so that Nagle's
+          # algorithm does not hold it back until the server acknowledges them.
+          connection.endheaders(body)
+        except TypeError:
+          # Python versions before 2.7 only send the headers.
+          connection.endheaders()
+          connection.send(body)
+        start = self._AddTime('send', start)
+        sent = True
+        response = connection.getresponse()
+        start = self._AddTime('wait', start)
+        if decoder is not None and response.status == 200:
+          data, streamed = _StreamResponse(response, decoder, self.metrics)
+        else:
+          data, streamed = response.read(), None
+          if self.metrics is not None:
+            self.metrics.response_size_received = len(data)
+        self._AddTime('receive', start)
+      except (socket.error, httplib.HTTPException, Error), e:
+        self._Dispose(scheme, address, connection, False)
+        if (reused and response is None and
+            (not sent or _IsClosedBeforeResponse(e))):
+          if self.metrics is not None:
+            self.metrics.retries += 1
+          continue
+        raise
+      self._Dispose(scheme, address, connection, not response.will_close)
+      return response.status, response.reason, response.msg, data, streamed
+
+  def _AddTime(self, stage, start):
+    """Adds the time elapsed since start to a stage of the call's metrics.
+
+    Args:
+      stage: str One of the stages of CallMetrics.
+      start: float Time the stage started at.
+
+    Returns:
+      float The current time, which the next stage starts at.
+    """
+    if self.metrics is None:
+      return time.time()
+    return self.metrics.AddTime(stage, start)
+
+  def _Dispose(self, scheme, address, connection, reusable):
+    """Hands a connection back to the pool, or closes it if there is none.
+
+    Args:
+      scheme: str The scheme the connection was made for.
+      address: str The address the connection was made for.
+      connection: httplib.HTTPConnection The connection to dispose of.
+      reusable: bool Whether the connection can serve another request.
+    """
+    if self.connection_pool is not None:
+      self.connection_pool.Release(scheme, address, connection, reusable)
+    else:
+      connection.close()
+
+
+def _IsClosedBeforeResponse(e):
+  """Checks whether an error means the server sent no response at all.
+
+  Args:
+    e: Exception The error raised while waiting for the response.
+
+  Returns:
+    bool True if the server closed or reset the connection before the status
+    line of a response arrived, False otherwise.
+  """
+  if isinstance(e, httplib.BadStatusLine):
+    return e.line in _EMPTY_STATUS_LINES
+  if isinstance(e, socket.error):
+    return bool(e.args) and e.args[0] == errno.ECONNRESET
+  return False
+
+
+def _StreamResponse(response, decoder, metrics=None):
+  """Feeds a response to a decoder as it is read off the socket.
+
+  Everything read is kept until the decoder reaches the response element, in
+  case the response turns out to be one the decoder leaves to SOAPpy, such as
+  a SOAP fault. From then on, nothing but the envelope up to the SOAP body is
+  kept.
+
+  Args:
+    response: httplib.HTTPResponse The response, with its body not yet read.
+    decoder: ResponseDecoder The decoder to feed.
+    [optional]
+    metrics: CallMetrics Object to record the size of the response into.
+
+  Returns:
+    tuple (str, bool) The decompressed payload and whether the decoder consumed
+    it. If it did, the payload is the SOAP envelope with an empty body.
+
+  Raises:
+    Error: if the decoder fails once it has started decoding the response.
+  """
+  if response.getheader('content-encoding', None) == 'gzip':
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+  else:
+    decompressor = None
+  kept = []
+  head = None
+  received = size = 0
+  while True:
+    chunk = response.read(STREAM_CHUNK_SIZE)
+    received += len(chunk)
+    if decompressor is not None:
+      chunk = decompressor.decompress(chunk) if chunk else decompressor.flush()
+    if not chunk:
+      break
+    size += len(chunk)
+    if head is None:
+      kept.append(chunk)
+    if decoder is None:
+      continue
+    try:
+      decoder.Feed(chunk)
+    except UnsupportedResponseError, e:
+      if head is not None:
+        raise Error('Unable to decode the streamed SOAP response. %s' % e)
+      decoder = None
+      continue
+    if head is None and decoder.HasStartedResponse():
+      head = ''.join(kept)[:decoder.GetBodyOffset()]
+      kept = None
+  if metrics is not None:
+    metrics.response_size_received = received
+    metrics.response_size = size
+  if decoder is None or head is None:
+    return ''.join(kept), False
+  return _CloseEnvelope(head), True
+
+
+def _CloseEnvelope(head):
+  """Closes a SOAP envelope cut off at the start of its body.
+
+  Args:
+    head: str The SOAP envelope, up to the body's start tag.
+
+  Returns:
+    str The envelope, with an empty body.
+  """
+  match = re.search(r'<([\w.-]+:)?Envelope\b', head)
+  prefix = match and match.group(1) or ''
+  return '%s<%sBody/></%sEnvelope>' % (head, prefix, prefix)
+
+
+def GetHeaderTuples(message):
+  """Lists the headers of an HTTP message in the order they were received.
+
+  Args:
+    message: httplib.HTTPMessage The headers of an HTTP response, or None.
+
+  Returns:
+    list (name, value) tuples, one per header line.
+  """
+  if message is None:
+    return []
+  return [tuple([part.strip() for part in line.split(':', 1)])
+          for line in message.headers if ':' in line]
+
+
+def _DebugHeader(out, title):
+  """Writes the banner SOAPpy puts above each debug dump.
+
+  Args:
+    out: file File-like object to write to.
+    title: str The title of the dump.
+  """
+  banner = '*** %s ' % title
+  print >>out, banner + '*' * (72 - len(banner))
+
+
+def _DebugFooter(out):
+  """Writes the banner SOAPpy puts below each debug dump.
+
+  Args:
+    out: file File-like object to write to.
+  """
+  print >>out, '*' * 72
+  out.flush()
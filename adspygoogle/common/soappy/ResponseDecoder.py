@@ -0,0 +1,532 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Single pass decoder turning SOAP responses straight into dicts and lists.
+
+SOAPpy parses a response into a tree of SOAPpy.Types objects, which
+MessageHandler.UnpackResponseAsDict then copies into dicts and lists, which
+MessageHandler.RestoreListTypeWithSoappy then walks once more to turn fields
+the schema declares as repeated into lists. The decoder produces the very same
+result from the parser's events alone: each element is turned into its final
+value as soon as it is closed, using the schema index to know which fields
+hold lists.
+
+Responses the decoder does not handle, such as SOAP faults or SOAP encoded
+arrays and references, make it raise UnsupportedResponseError. They are meant
+to be handed to SOAPpy instead.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import xml.parsers.expat
+
+from adspygoogle.SOAPpy.Config import Config
+from adspygoogle.SOAPpy.Errors import UnknownTypeError
+from adspygoogle.SOAPpy.NS import NS
+from adspygoogle.SOAPpy.Parser import SOAPParser
+from adspygoogle.SOAPpy.wstools.XMLname import fromXMLname
+
+
+_ENVELOPE = NS.ENV + ' Envelope'
+_HEADER = NS.ENV + ' Header'
+_BODY = NS.ENV + ' Body'
+_FAULT = NS.ENV + ' Fault'
+_XSI_TYPES = tuple([xsi + ' type' for xsi in NS.XSI_L])
+_XSI_NILS = (NS.XSI + ' null', NS.XSI2 + ' null', NS.XSI3 + ' nil')
+_UNSUPPORTED_ATTRIBUTES = (NS.ENC + ' arrayType', 'href', 'id')
+
+# Used for its conversion of XML schema typed values into Python values.
+_converter = SOAPParser()
+
+
+class UnsupportedResponseError(Exception):
+
+  """Raised for responses which have to be parsed by SOAPpy instead."""
+
+
+class _Frame(object):
+
+  """An element of the response which has been opened but not yet closed."""
+
+  __slots__ = ('name', 'declared', 'type_info', 'type_info_known', 'value',
+               'repeated', 'text', 'has_children', 'nil', 'kind',
+               'attr_count')
+
+  def __init__(self, name, declared):
+    """Inits _Frame.
+
+    Args:
+      name: str The name of the element, without its namespace.
+      declared: tuple (str, str, str) The namespace, type name and maxOccurs
+                the schema declares for this element, or None if unknown.
+    """
+    self.name = name
+    self.declared = declared
+    self.type_info = None
+    self.type_info_known = False
+    self.value = {}
+    self.repeated = None
+    self.text = []
+    self.has_children = False
+    self.nil = False
+    self.kind = None
+    self.attr_count = 0
+
+
+class ResponseDecoder(object):
+
+  """Decodes a single SOAP response, fed to it in one or more chunks.
+
+  The result has exactly the shape the response would have after going through
+  SOAPpy, MessageHandler.UnpackResponseAsDict and
+  MessageHandler.RestoreListTypeWithSoappy.
+  """
+
+  def __init__(self, schema_index, output_types):
+    """Inits ResponseDecoder.
+
+    Args:
+      schema_index: SchemaIndex The index of the service's WSDL.
+      output_types: list (namespace, type name, maxOccurs) tuples of the values
+                    the operation returns. At most one is supported.
+
+    Raises:
+      UnsupportedResponseError: if the operation returns several values.
+    """
+    if len(output_types) > 1:
+      raise UnsupportedResponseError('Several output values.')
+    self._index = schema_index
+    self._output_types = output_types
+    self._prefixes = {}
+    self._stack = []
+    self._depth = 0
+    self._skip_depth = None
+    self._seen_body = False
+    self._done = False
+    self._result = None
+    self._body_offset = None
+    self._started = False
+    self._header_depth = None
+    self._header_field = None
+    self._header_text = None
+    self._header_values = {}
+    self._parser = xml.parsers.expat.ParserCreate(namespace_separator=' ')
+    self._parser.buffer_text = True
+    self._parser.StartElementHandler = self._StartElement
+    self._parser.EndElementHandler = self._EndElement
+    self._parser.CharacterDataHandler = self._CharacterData
+    self._parser.StartNamespaceDeclHandler = self._StartNamespaceDecl
+    self._parser.EndNamespaceDeclHandler = self._EndNamespaceDecl
+
+  def Feed(self, data):
+    """Decodes the next chunk of the response.
+
+    Args:
+      data: str The next chunk of the SOAP message.
+
+    Raises:
+      UnsupportedResponseError: if the response has to be parsed by SOAPpy.
+    """
+    try:
+      self._parser.Parse(data, False)
+    except xml.parsers.expat.ExpatError, e:
+      raise UnsupportedResponseError(str(e))
+
+  def Close(self):
+    """Finishes decoding the response and returns its value.
+
+    Returns:
+      mixed The decoded value of the response.
+
+    Raises:
+      UnsupportedResponseError: if the response has to be parsed by SOAPpy.
+    """
+    try:
+      self._parser.Parse('', True)
+    except xml.parsers.expat.ExpatError, e:
+      raise UnsupportedResponseError(str(e))
+    if not self._done:
+      raise UnsupportedResponseError('No response element.')
+    return self._result
+
+  def GetBodyOffset(self):
+    """Returns where the SOAP body starts in the data fed so far.
+
+    Returns:
+      int The offset, in bytes, of the SOAP body's start tag, or None if it has
+      not been reached yet.
+    """
+    return self._body_offset
+
+  def GetHeaderValues(self):
+    """Returns the values of the response's SOAP header fields.
+
+    Returns:
+      dict The text of each element of the SOAP header which holds no other
+      element, such as requestId or responseTime, keyed by its name without
+      its namespace.
+    """
+    return self._header_values
+
+  def HasStartedResponse(self):
+    """Whether the decoder has started decoding the response element.
+
+    Once it has, the response is known not to be a SOAP fault and the decoder
+    will not raise UnsupportedResponseError for anything before it.
+
+    Returns:
+      bool True if the first element of the SOAP body has been reached.
+    """
+    return self._started
+
+  def _StartNamespaceDecl(self, prefix, uri):
+    self._prefixes.setdefault(prefix, []).append(uri)
+
+  def _EndNamespaceDecl(self, prefix):
+    self._prefixes[prefix].pop()
+
+  def _StartElement(self, name, attrs):
+    self._depth += 1
+    if self._header_depth is not None:
+      self._header_field = (self._depth, str(name[name.rfind(' ') + 1:]))
+      self._header_text = []
+      return
+    if self._skip_depth is not None:
+      return
+    if self._depth == 1:
+      if name != _ENVELOPE:
+        raise UnsupportedResponseError('Not a SOAP envelope.')
+      return
+    if self._depth == 2:
+      if name == _HEADER and not self._seen_body:
+        self._header_depth = self._depth
+      elif name == _BODY:
+        self._seen_body = True
+        self._body_offset = self._parser.CurrentByteIndex
+      else:
+        raise UnsupportedResponseError('Unexpected element %s.' % name)
+      return
+    if self._depth == 3 and (self._done or name == _FAULT):
+      # Only the first element of the body is the response.
+      if name == _FAULT:
+        raise UnsupportedResponseError('SOAP fault.')
+      self._skip_depth = self._depth
+      return
+
+    for attr in _UNSUPPORTED_ATTRIBUTES:
+      if attr in attrs:
+        raise UnsupportedResponseError('Unsupported attribute %s.' % attr)
+
+    local_name = name[name.rfind(' ') + 1:]
+    if '_x' in local_name:
+      local_name = fromXMLname(local_name)
+    try:
+      local_name = str(local_name)
+    except UnicodeError:
+      pass
+    if self._stack:
+      parent = self._stack[-1]
+      parent.has_children = True
+      parent.text = None
+      declared = self._GetDeclaredType(parent, local_name)
+    else:
+      declared = None
+      self._started = True
+    frame = _Frame(local_name, declared)
+
+    if attrs:
+      frame.attr_count = len(attrs)
+      for attr in _XSI_TYPES:
+        if attr in attrs:
+          frame.kind = self._ResolveQName(attrs[attr])
+          frame.attr_count -= 1
+      for attr in _XSI_NILS:
+        if attr in attrs:
+          nil = attrs[attr].lower()
+          frame.nil = nil == 'true' or nil == '1'
+          frame.attr_count -= 1
+    self._stack.append(frame)
+
+  def _EndElement(self, name):
+    self._depth -= 1
+    if self._header_depth is not None:
+      if self._depth < self._header_depth:
+        self._header_depth = None
+      elif self._header_field and self._header_field[0] == self._depth + 1:
+        # Only elements holding no other element are kept.
+        self._header_values[self._header_field[1]] = ''.join(
+            self._header_text)
+      self._header_field = None
+      return
+    if self._skip_depth is not None:
+      if self._depth < self._skip_depth:
+        self._skip_depth = None
+      return
+    if not self._stack:
+      return
+
+    frame = self._stack.pop()
+    if self._stack:
+      self._AddField(self._stack[-1], frame.name, self._GetValue(frame))
+    else:
+      self._result = self._GetResult(frame)
+      self._done = True
+
+  def _CharacterData(self, data):
+    if self._header_field is not None:
+      self._header_text.append(data)
+      return
+    if self._stack and self._skip_depth is None:
+      text = self._stack[-1].text
+      if text is not None:
+        text.append(data)
+
+  def _ResolveQName(self, qname):
+    """Resolves a prefixed XML name into a (namespace, name) tuple.
+
+    Args:
+      qname: str The name, optionally prefixed.
+
+    Returns:
+      tuple (str, str) The namespace, or None, and the name.
+    """
+    if ':' in qname:
+      prefix, local_name = qname.split(':', 1)
+    else:
+      prefix, local_name = None, qname
+    uris = self._prefixes.get(prefix)
+    return (uris and uris[-1] or None, local_name)
+
+  def _GetDeclaredType(self, parent, field_name):
+    """Looks up the type the schema declares for a field of an open element.
+
+    Args:
+      parent: _Frame The element holding the field.
+      field_name: str The name of the field.
+
+    Returns:
+      tuple (str, str, str) The namespace, type name and maxOccurs of the field,
+      or None if the field or its parent's type is unknown.
+    """
+    if parent is self._stack[0]:
+      if self._output_types:
+        return self._output_types[0]
+      return None
+    type_info = self._GetTypeInfo(parent)
+    if type_info is None:
+      return None
+    field = type_info.field_map.get(field_name)
+    if field is None or field['type'] is None:
+      return None
+    field_type = field['type']
+    return (field_type.getTargetNamespace(),
+            self._index.GetArrayItemTypeName(field_type.getName(),
+                                             field_type.getTargetNamespace()),
+            field['maxOccurs'])
+
+  def _GetTypeInfo(self, frame):
+    """Returns the schema type of an element, as known so far.
+
+    Like MessageHandler.RestoreListTypeWithSoappy, this is the type named by the
+    element's "Type" field, if it has one, or the type the schema declares.
+
+    Args:
+      frame: _Frame The element.
+
+    Returns:
+      TypeInfo The type of the element, or None if it is unknown.
+    """
+    if not frame.type_info_known:
+      frame.type_info_known = True
+      frame.type_info = None
+      if frame.declared is not None:
+        type_name = frame.declared[1]
+        for key in frame.value:
+          if key.endswith('_Type'):
+            type_name = frame.value[key]
+        if (isinstance(type_name, basestring) and
+            self._index.HasType(type_name, frame.declared[0])):
+          frame.type_info = self._index.GetType(type_name, frame.declared[0])
+    return frame.type_info
+
+  def _AddField(self, parent, name, value):
+    """Adds the value of a closed element to its parent.
+
+    Args:
+      parent: _Frame The parent element.
+      name: str The name of the closed element.
+      value: mixed The value of the closed element.
+    """
+    if name[0] == '_':
+      return
+    if '.' in name:
+      name = name.replace('.', '_')
+    fields = parent.value
+    if name in fields:
+      if parent.repeated is None:
+        parent.repeated = set()
+      if name not in parent.repeated:
+        parent.repeated.add(name)
+        fields[name] = [fields[name]]
+      fields[name].append(value)
+    else:
+      fields[name] = value
+    if name.endswith('_Type'):
+      parent.type_info_known = False
+
+  def _GetValue(self, frame):
+    """Turns a closed element into its final value.
+
+    Args:
+      frame: _Frame The closed element.
+
+    Returns:
+      mixed The value of the element.
+    """
+    if frame.nil:
+      return None
+    if not frame.has_children:
+      return self._GetSimpleValue(frame)
+
+    fields = frame.value
+    if frame.repeated:
+      for name in frame.repeated:
+        fields[name] = [item for item in fields[name] if item is not None]
+    if fields:
+      type_info = self._GetTypeInfo(frame)
+      if type_info is not None:
+        self._RestoreListFields(fields, type_info)
+    return fields
+
+  def _RestoreListFields(self, fields, type_info):
+    """Makes sure the fields the schema declares as repeated hold lists.
+
+    Args:
+      fields: dict The fields of a decoded complex type. Updated in place.
+      type_info: TypeInfo The type the fields belong to.
+    """
+    index = self._index
+    for field in type_info.fields:
+      name = field['name']
+      if name not in fields:
+        continue
+      value = fields[name]
+      if not isinstance(value, list):
+        max_occurs = field['maxOccurs']
+        field_type = field['type']
+        if ((not max_occurs.isdigit() or int(max_occurs) > 1) or
+            (field_type is not None and
+             index.IsAnArrayType(field_type.getName(),
+                                 field_type.getTargetNamespace()))):
+          value = [value]
+        else:
+          continue
+      fields[name] = [item for item in value if item]
+
+  def _GetSimpleValue(self, frame):
+    """Converts the text of a closed element without children.
+
+    Args:
+      frame: _Frame The closed element.
+
+    Returns:
+      mixed The value of the element, as a string wherever SOAPpy would have
+      given a number or a date.
+
+    Raises:
+      UnsupportedResponseError: if SOAPpy would fail to convert the value.
+    """
+    if frame.text:
+      text = ''.join(frame.text)
+    else:
+      text = ''
+    data = None
+    if frame.kind is not None and frame.kind[0] in NS.EXSD_L:
+      try:
+        data = _converter.convertType(text, frame.kind, {}, Config)
+      except UnknownTypeError:
+        data = None
+      except Exception, e:
+        raise UnsupportedResponseError(str(e))
+    if data is None:
+      data = text
+      if not frame.attr_count:
+        try:
+          data = str(data)
+        except UnicodeError:
+          pass
+    elif isinstance(data, (int, long, float)):
+      data = str(data)
+    elif isinstance(data, tuple) and len(data) == 6:
+      data = '%04d-%02d-%02dT%02d:%02d:%02d' % data
+    return data
+
+  def _GetResult(self, frame):
+    """Turns the closed response element into the value of the response.
+
+    Args:
+      frame: _Frame The response element, the first child of the SOAP body.
+
+    Returns:
+      mixed The value of the response.
+
+    Raises:
+      UnsupportedResponseError: if the response holds several values.
+    """
+    if frame.nil or (frame.text and ''.join(frame.text).strip()):
+      raise UnsupportedResponseError('Simple response.')
+    if not self._output_types:
+      return None
+    fields = frame.value
+    if len(fields) > 1 or (frame.has_children and not fields):
+      raise UnsupportedResponseError('Several response values.')
+    max_occurs = self._output_types[0][2]
+    is_list = not max_occurs.isdigit() or int(max_occurs) > 1
+    if not fields:
+      if is_list:
+        return []
+      return {}
+    value = fields.values()[0]
+    if frame.repeated:
+      value = [item for item in value if item is not None]
+    if is_list:
+      if not value:
+        return []
+      elif not isinstance(value, list):
+        return [value]
+    if isinstance(value, list):
+      return [item for item in value if item]
+    return value
+
+
+def Decode(soap_message, schema_index, output_types):
+  """Decodes a whole SOAP response.
+
+  Args:
+    soap_message: str The SOAP response.
+    schema_index: SchemaIndex The index of the service's WSDL.
+    output_types: list (namespace, type name, maxOccurs) tuples of the values
+                  the operation returns.
+
+  Returns:
+    mixed The decoded value of the response.
+
+  Raises:
+    UnsupportedResponseError: if the response has to be parsed by SOAPpy.
+  """
+  decoder = ResponseDecoder(schema_index, output_types)
+  decoder.Feed(soap_message)
+  return decoder.Close()
@@ -0,0 +1,324 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Precompiled, picklable index of the schema types defined in a WSDL."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+from adspygoogle.SOAPpy.wstools.XMLSchema import TypeDescriptionComponent
+
+
+# Bumped whenever the layout of the index changes, so that indexes pickled by
+# an older version of the library are recompiled rather than used.
+FORMAT_VERSION = 1
+
+_SOAP_ARRAY_TYPE = 'http://schemas.xmlsoap.org/wsdl/'
+
+
+class TypeInfo(object):
+
+  """Everything the library needs to know about a single WSDL-defined type.
+
+  Attributes:
+    name: str The name of the type.
+    ns: str The namespace the type belongs to.
+    tag: str Either 'complexType' or 'simpleType'.
+    base: TypeDescriptionComponent The type this type extends, or None.
+    fields: tuple Dictionaries describing the fields of this type, inherited
+            ones first, in the order they appear in XML. Each holds the
+            'name', 'type' and 'maxOccurs' of the field as well as the 'ns' of
+            the type which declares it.
+    field_map: dict Maps field names to the dictionaries in fields.
+    is_array: bool Whether this type is a SOAP encoded array.
+    array_item_type: str The name of the type of the items of a SOAP encoded
+                     array. This type's own name for other types.
+  """
+
+  def __init__(self, name, ns, tag):
+    """Inits TypeInfo.
+
+    Args:
+      name: str The name of the type.
+      ns: str The namespace the type belongs to.
+      tag: str Either 'complexType' or 'simpleType'.
+    """
+    self.name = name
+    self.ns = ns
+    self.tag = tag
+    self.base = None
+    self.fields = ()
+    self.field_map = {}
+    self.is_array = False
+    self.array_item_type = name
+
+  def HasField(self, name):
+    """Whether this type, or a type it extends, has a field with this name.
+
+    Args:
+      name: str The name of the field.
+
+    Returns:
+      bool True if the field exists, False otherwise.
+    """
+    return name in self.field_map
+
+
+class SchemaIndex(object):
+
+  """Flat index of the types and elements defined in a WSDL's schemas.
+
+  Walking the wstools object graph to find the fields of a type, and the types
+  it extends, is slow and has to be repeated for every object packed or
+  validated. The index does the walk once, up front, and answers the same
+  questions with dictionary lookups. It holds nothing but strings, tuples,
+  dictionaries and TypeInfo objects, so it can be pickled and cached.
+  """
+
+  def __init__(self, types, elements):
+    """Inits SchemaIndex.
+
+    Args:
+      types: dict Maps (namespace, type name) tuples to TypeInfo objects.
+      elements: dict Maps (namespace, element name) tuples to the tuple of
+                field dictionaries of the element's anonymous complex type.
+    """
+    self.format_version = FORMAT_VERSION
+    self._types = types
+    self._elements = elements
+
+  def GetType(self, type_name, ns):
+    """Returns what is known about a WSDL-defined type.
+
+    Args:
+      type_name: str The name of the type.
+      ns: str The namespace the type belongs to.
+
+    Returns:
+      TypeInfo The type's information.
+
+    Raises:
+      KeyError: if there is no such type in the WSDL.
+    """
+    return self._types[(ns, type_name)]
+
+  def HasType(self, type_name, ns):
+    """Whether a type is defined in the WSDL.
+
+    Args:
+      type_name: str The name of the type.
+      ns: str The namespace the type belongs to.
+
+    Returns:
+      bool True if the type is defined, False otherwise.
+    """
+    return (ns, type_name) in self._types
+
+  def GetField(self, type_name, ns, field_name):
+    """Returns a field of a complex type, including inherited fields.
+
+    Args:
+      type_name: str The name of the complex type.
+      ns: str The namespace the complex type belongs to.
+      field_name: str The name of the field.
+
+    Returns:
+      dict The 'name', 'type', 'maxOccurs' and declaring 'ns' of the field.
+
+    Raises:
+      KeyError: if there is no such type in the WSDL.
+      TypeError: if the given field is not within the given complex type.
+    """
+    field_map = self._types[(ns, type_name)].field_map
+    if field_name not in field_map:
+      raise TypeError('There is no field with the name %s in complex type %s.'
+                      % (field_name, type_name))
+    return field_map[field_name]
+
+  def GetElementFields(self, element_name, ns):
+    """Returns the fields of a top level element, such as an operation's input.
+
+    Args:
+      element_name: str The name of the element.
+      ns: str The namespace the element belongs to.
+
+    Returns:
+      tuple The field dictionaries of the element, in order.
+
+    Raises:
+      KeyError: if there is no such element in the WSDL.
+    """
+    return self._elements[(ns, element_name)]
+
+  def IsASuperType(self, sub_type, ns, super_type):
+    """Determines if one type is a supertype of another type.
+
+    Args:
+      sub_type: str A type that may be extending super_type.
+      ns: str The namespace sub_type belongs to.
+      super_type: str A type that may be extended by sub_type.
+
+    Returns:
+      bool Whether super_type is really a supertype of sub_type.
+    """
+    # Like the wstools walk this replaces, every type in the chain is looked up
+    # in the sub type's namespace.
+    type_name = sub_type
+    while type_name != super_type:
+      type_info = self._types.get((ns, type_name))
+      if type_info is None or type_info.base is None:
+        return False
+      type_name = type_info.base.getName()
+    return True
+
+  def IsAnArrayType(self, type_name, ns):
+    """Determines if a type represents a SOAP encoded array.
+
+    Args:
+      type_name: str The name of the type.
+      ns: str The namespace the type belongs to.
+
+    Returns:
+      bool Whether the given type represents an array.
+    """
+    if type_name == 'Array':
+      return True
+    type_info = self._types.get((ns, type_name))
+    return type_info is not None and type_info.is_array
+
+  def GetArrayItemTypeName(self, type_name, ns):
+    """Returns the name of the type of the items in an array.
+
+    Args:
+      type_name: str The name of the array's type.
+      ns: str The namespace the array's type belongs to.
+
+    Returns:
+      str The item type of a SOAP encoded array, or type_name for any other
+      type.
+    """
+    type_info = self._types.get((ns, type_name))
+    if type_info is None:
+      return type_name
+    return type_info.array_item_type
+
+
+def Compile(soappy_service):
+  """Compiles the schema index of a SOAPpy WSDL proxy.
+
+  Args:
+    soappy_service: SOAPpy.WSDL.Proxy The SOAPpy service object encapsulating
+                    the information stored in the WSDL.
+
+  Returns:
+    SchemaIndex The compiled index.
+  """
+  schemas = soappy_service.wsdl.types
+  types = {}
+  elements = {}
+  for ns in schemas.keys():
+    schema = schemas[ns]
+    for type_name in schema.types.keys():
+      _CompileType(schemas, ns, type_name, types)
+    for element_name in schema.elements.keys():
+      try:
+        sequence = schema.elements[element_name].content.content.content
+      except AttributeError:
+        continue
+      elements[(ns, element_name)] = _GetDeclaredFields(sequence, ns)
+  return SchemaIndex(types, elements)
+
+
+def _CompileType(schemas, ns, type_name, types):
+  """Compiles a single type, and the types it extends, into the index.
+
+  Args:
+    schemas: wstools.WSDLTools.Types The schemas of the WSDL, by namespace.
+    ns: str The namespace the type belongs to.
+    type_name: str The name of the type.
+    types: dict The index being built. Updated in place.
+
+  Returns:
+    TypeInfo The compiled type, or None if the type is not defined in the WSDL.
+  """
+  key = (ns, type_name)
+  if key in types:
+    return types[key]
+  try:
+    type_def = schemas[ns].types[type_name]
+  except KeyError:
+    return None
+
+  type_info = TypeInfo(type_name, ns, type_def.tag)
+  types[key] = type_info
+  content = getattr(type_def, 'content', None)
+  if content is None:
+    return type_info
+
+  if hasattr(content, 'derivation'):
+    derivation = content.derivation
+    type_info.base = TypeDescriptionComponent(
+        tuple(derivation.attributes['base']))
+    base_name = type_info.base.getName()
+    base_info = _CompileType(schemas, type_info.base.getTargetNamespace(),
+                             base_name, types)
+    if base_info is not None:
+      fields = list(base_info.fields)
+      type_info.is_array = base_info.is_array
+    else:
+      fields = []
+      type_info.is_array = base_name == 'Array'
+    if hasattr(derivation.content, 'content'):
+      fields.extend(_GetDeclaredFields(derivation.content.content, ns))
+    type_info.fields = tuple(fields)
+    try:
+      array_type = derivation.attr_content[0].attributes[_SOAP_ARRAY_TYPE][
+          'arrayType']
+      type_info.array_item_type = array_type[array_type.find(':') + 1:-2]
+    except (AttributeError, IndexError, KeyError, TypeError):
+      pass
+  elif hasattr(content, 'content'):
+    type_info.fields = _GetDeclaredFields(content.content, ns)
+
+  for field in type_info.fields:
+    type_info.field_map.setdefault(field['name'], field)
+  return type_info
+
+
+def _GetDeclaredFields(element_declarations, ns):
+  """Turns wstools element declarations into field dictionaries.
+
+  Args:
+    element_declarations: tuple The wstools element declarations of a sequence.
+    ns: str The namespace of the type declaring the elements.
+
+  Returns:
+    tuple The field dictionaries, in order.
+  """
+  fields = []
+  for element in element_declarations or ():
+    attributes = getattr(element, 'attributes', None)
+    if not attributes or 'name' not in attributes:
+      continue
+    field_type = attributes.get('type')
+    if field_type is not None:
+      field_type = TypeDescriptionComponent(tuple(field_type))
+    fields.append({
+        'name': attributes['name'],
+        'type': field_type,
+        'maxOccurs': attributes.get('maxOccurs', '1'),
+        'ns': ns
+    })
+  return tuple(fields)
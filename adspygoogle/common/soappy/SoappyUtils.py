@@ -18,6 +18,28 @@
 
 __author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
 
+from adspygoogle.common.soappy import SchemaIndex
+
+
+def GetSchemaIndex(soappy_service):
+  """Returns the schema index of a SOAPpy service, compiling it if needed.
+
+  The index is stored on the service object, so it is compiled at most once per
+  WSDL and shared by everything using the same service object.
+
+  Args:
+    soappy_service: SOAPpy.WSDL.Proxy The SOAPpy service object encapsulating
+                    the information stored in the WSDL.
+
+  Returns:
+    SchemaIndex The index of the types defined in the WSDL.
+  """
+  index = soappy_service.__dict__.get('schema_index')
+  if index is None or index.format_version != SchemaIndex.FORMAT_VERSION:
+    index = SchemaIndex.Compile(soappy_service)
+    soappy_service.__dict__['schema_index'] = index
+  return index
+
 
 def GetArrayItemTypeName(type_name, ns, soappy_service):
   """Returns the name of the SOAP type which the items in an array represent.
@@ -38,19 +60,7 @@ def GetArrayItemTypeName(type_name, ns, soappy_service):
   Returns:
     string The type name of the array's contents.
   """
-  try:
-    array_type = GetTypeFromSoappyService(type_name, ns, soappy_service)
-    attr_contents = array_type.content.derivation.attr_content
-    if attr_contents:
-      raw_type_name = attr_contents[0].attributes[
-          'http://schemas.xmlsoap.org/wsdl/']['arrayType']
-      return raw_type_name[raw_type_name.find(':') + 1:-2]
-    else:
-      return type_name
-  except KeyError:
-    return type_name
-  except AttributeError:
-    return type_name
+  return GetSchemaIndex(soappy_service).GetArrayItemTypeName(type_name, ns)
 
 
 def IsASuperType(soappy_service, sub_type, ns, super_type):
@@ -69,20 +79,7 @@ def IsASuperType(soappy_service, sub_type, ns, super_type):
   Returns:
     bool Whether super_type is really a supertype of sub_type.
   """
-  if sub_type == super_type: return True
-
-  try:
-    if IsASubType(sub_type, ns, soappy_service):
-      complex_type = GetTypeFromSoappyService(sub_type, ns, soappy_service)
-      return IsASuperType(
-          soappy_service,
-          complex_type.content.derivation.attributes['base'].getName(), ns,
-          super_type)
-    else:
-      return False
-  except KeyError:
-    # The given sub_type does not exist in the WSDL definitions.
-    return False
+  return GetSchemaIndex(soappy_service).IsASuperType(sub_type, ns, super_type)
 
 
 def IsASubType(type_name, ns, soappy_service):
@@ -97,8 +94,7 @@ def IsASubType(type_name, ns, soappy_service):
   Returns:
     boolean Whether the given type is extending another type.
   """
-  return hasattr(GetTypeFromSoappyService(
-      type_name, ns, soappy_service).content, 'derivation')
+  return GetSchemaIndex(soappy_service).GetType(type_name, ns).base is not None
 
 
 def IsAnArrayType(type_name, ns, soappy_service):
@@ -113,20 +109,7 @@ def IsAnArrayType(type_name, ns, soappy_service):
   Returns:
     boolean Whether the given type represents an array.
   """
-  if type_name == 'Array':
-    return True
-  try:
-    wsdl_type_def = GetTypeFromSoappyService(type_name, ns, soappy_service)
-    if hasattr(wsdl_type_def.content, 'derivation'):
-      # This is an extension of another type.
-      return IsAnArrayType(
-          wsdl_type_def.content.derivation.attributes['base'].getName(),
-          wsdl_type_def.content.derivation.attributes[
-              'base'].getTargetNamespace(), soappy_service)
-    else:
-      return False
-  except KeyError:
-    return False
+  return GetSchemaIndex(soappy_service).IsAnArrayType(type_name, ns)
 
 
 def GetTypeFromSoappyService(type_name, ns, soappy_service):
@@ -156,24 +139,10 @@ def GenKeyOrderAttrs(soappy_service, ns, type_name):
     type_name: string The name of the WSDL-defined type to search for.
 
   Returns:
-    list A list of dictionaries containing the attributes of keys within a
-    complex type, in order.
+    list A list of dictionaries containing the name, type and maxOccurs of keys
+    within a complex type, in order.
   """
-  complex_type = soappy_service.wsdl.types[ns].types[type_name]
-
-  if IsASubType(type_name, ns, soappy_service):
-    # This is an extension of another type.
-    key_order = GenKeyOrderAttrs(
-        soappy_service,
-        complex_type.content.derivation.attributes['base'].getTargetNamespace(),
-        complex_type.content.derivation.attributes['base'].getName())
-    if hasattr(complex_type.content.derivation.content, 'content'):
-      key_order.extend([element.attributes for element in
-                        complex_type.content.derivation.content.content])
-    return key_order
-  else:
-    # This is a base type.
-    return [element.attributes for element in complex_type.content.content]
+  return list(GetSchemaIndex(soappy_service).GetType(type_name, ns).fields)
 
 
 def PruneKeyOrder(key_order, soappy_struct_object):
@@ -230,11 +199,7 @@ def GetComplexFieldTypeByFieldName(key, type_name, ns, soappy_service):
   Raises:
     TypeError: if the given key is not within the given complex type.
   """
-  for param in GenKeyOrderAttrs(soappy_service, ns, type_name):
-    if param['name'] == key:
-      return param['type']
-  raise TypeError('There is no field with the name %s in complex type %s.'
-                  % (key, type_name))
+  return GetSchemaIndex(soappy_service).GetField(type_name, ns, key)['type']
 
 
 def GetComplexFieldNamespaceByFieldName(field, type_name, ns, soappy_service):
@@ -254,26 +219,7 @@ def GetComplexFieldNamespaceByFieldName(field, type_name, ns, soappy_service):
   Raises:
     TypeError: if the given field is not within the given complex type.
   """
-  type_obj = soappy_service.wsdl.types[ns].types[type_name]
-
-  if IsASubType(type_name, ns, soappy_service):
-    if hasattr(type_obj.content.derivation.content, 'content'):
-      for element in type_obj.content.derivation.content.content:
-        if element.attributes['name'] == field: return ns
-    try:
-      return GetComplexFieldNamespaceByFieldName(
-          field,
-          type_obj.content.derivation.attributes['base'].getName(),
-          type_obj.content.derivation.attributes['base'].getTargetNamespace(),
-          soappy_service)
-    except TypeError:
-      raise TypeError('There is no field with the name %s in complex type %s.'
-                      % (field, type_name))
-  else:
-    for element in type_obj.content.content:
-      if element.attributes['name'] == field: return ns
-    raise TypeError('There is no field with the name %s in complex type %s.'
-                    % (field, type_name))
+  return GetSchemaIndex(soappy_service).GetField(type_name, ns, field)['ns']
 
 
 def GetExplicitType(obj, type_name, ns, soappy_service):
@@ -314,7 +260,4 @@ def _HasNativeType(type_name, ns, soappy_service):
   Returns:
     bool Whether or not the given type has a field named 'type'.
   """
-  params = GenKeyOrderAttrs(soappy_service, ns, type_name)
-  for param in params:
-    if param['name'] == 'type': return True
-  return False
+  return GetSchemaIndex(soappy_service).GetType(type_name, ns).HasField('type')
@@ -0,0 +1,257 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runs API methods over long lists of entities, a part of the list at a time.
+
+The list of entities passed to a method such as CreateLineItems or
+UpdateLineItems is split into shards, each sent in an API call of its own. The
+entities returned by every call are merged back in the order of the input.
+MutateInChunks makes the calls from threads, RunInProcesses from processes.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import multiprocessing
+import threading
+
+from adspygoogle.common.CallExecutor import CallExecutor
+from adspygoogle.common.CallExecutor import DEFAULT_MAX_WORKERS
+from adspygoogle.common.Errors import ValidationError
+from adspygoogle.common.GenericApiService import MethodInfoKeys
+from adspygoogle.dfp.DfpClient import DfpClient
+from adspygoogle.dfp.DfpErrors import DfpApiError
+
+
+# Default number of entities sent in a single API call.
+DEFAULT_SHARD_SIZE = 100
+
+# The service each worker process makes calls through, or the error raised
+# while creating it. Set by _InitWorker.
+_worker_service = None
+_worker_error = None
+
+
+def MutateInChunks(service, method_name, entities,
+                   chunk_size=DEFAULT_SHARD_SIZE,
+                   max_in_flight=DEFAULT_MAX_WORKERS):
+  """Calls an API method over a list of entities, a chunk at a time.
+
+  Any method whose only input is a list, that is an element with an unbounded
+  maxOccurs in the WSDL, can be called this way. This covers methods such as
+  CreateLineItems, UpdateAdUnits or CreateLineItemCreativeAssociations. The
+  chunks are sent from several threads at once; the calls do not wait on the
+  client's lock, whatever the 'concurrent' config value.
+
+  Args:
+    service: GenericDfpService The service to call the method of.
+    method_name: str Name of the method to call, such as 'CreateLineItems'.
+    entities: list The entities to call the method over.
+    [optional]
+    chunk_size: int Number of entities to send in a single API call.
+    max_in_flight: int Number of API calls to make at the same time.
+
+  Returns:
+    list The entity returned for each of the given entities, in the same order.
+    For each entity of a chunk whose call failed, the DfpApiError it raised.
+
+  Raises:
+    ValidationError: if the service has no such method, or the method does not
+                     take a list as its only input.
+  """
+  try:
+    inputs = service.GetMethodInfo(method_name)[MethodInfoKeys.INPUTS]
+  except AttributeError:
+    raise ValidationError('Service has no method \'%s\'.' % method_name)
+  if len(inputs) != 1 or inputs[0][MethodInfoKeys.MAX_OCCURS] != 'unbounded':
+    raise ValidationError('Method \'%s\' does not take a list of entities as '
+                          'its only argument.' % method_name)
+
+  chunks = _Shard(entities, chunk_size)
+  chunk_service = service.CopyWithLock(threading.Semaphore(max_in_flight))
+  executor = CallExecutor(max_in_flight)
+  try:
+    futures = [executor.Submit(_CallOverChunk, chunk_service, method_name,
+                               chunk)
+               for chunk in chunks]
+  finally:
+    executor.Shutdown()
+  return _Merge(chunks, [future.GetResult() for future in futures])
+
+
+def RunInProcesses(client, service_name, method_name, entities,
+                   shard_size=DEFAULT_SHARD_SIZE, processes=None,
+                   server='https://www.google.com', version=None,
+                   http_proxy=None):
+  """Calls an API method over a list of entities from a pool of processes.
+
+  Packing the request and parsing the response are CPU bound and only use one
+  core per process. Each worker process has a service of its own, created the
+  first time it runs, with the client's headers and config. The service loads
+  its WSDL from the WSDL cache under the client's home, so the document is
+  only downloaded once.
+
+  Args:
+    client: DfpClient The client whose headers and config to use.
+    service_name: str Name of the service to use, such as 'LineItemService'.
+    method_name: str Name of the method to call, such as 'UpdateLineItems'. It
+                 must take a list of entities as its only argument.
+    entities: list The entities to call the method over.
+    [optional]
+    shard_size: int Number of entities to send in a single API call.
+    processes: int Number of worker processes. Defaults to the number of CPUs.
+    server: str API server to access for API calls. The default value is
+            'https://www.google.com'.
+    version: str API version to use.
+    http_proxy: str HTTP proxy to use.
+
+  Returns:
+    list The entity returned for each of the given entities, in the same order.
+    For each entity of a shard whose call failed, the DfpApiError it raised.
+  """
+  shards = _Shard(entities, shard_size)
+  if not shards:
+    return []
+  pool = multiprocessing.Pool(
+      min(processes or multiprocessing.cpu_count(), len(shards)), _InitWorker,
+      (client.GetAuthCredentials(), client.GetConfigValues(), service_name,
+       server, version, http_proxy))
+  try:
+    results = pool.map(_RunShard, [(method_name, shard) for shard in shards],
+                       chunksize=1)
+  finally:
+    pool.close()
+    pool.join()
+  return _Merge(shards, [(entities, error and error[0](error[1]))
+                         for entities, error in results])
+
+
+def _Shard(entities, shard_size):
+  """Splits a list of entities into shards.
+
+  Args:
+    entities: list The entities to split.
+    shard_size: int The maximum number of entities in a shard.
+
+  Returns:
+    list The shards, each a list of entities.
+  """
+  shard_size = max(1, shard_size)
+  return [list(entities[i:i + shard_size])
+          for i in xrange(0, len(entities), shard_size)]
+
+
+def _Merge(shards, results):
+  """Merges the results of calls made over shards back into a single list.
+
+  Args:
+    shards: list The shards the calls were made over.
+    results: list (entities, error) tuples of the entities each call returned
+             or, if it failed, the DfpApiError it raised.
+
+  Returns:
+    list The entity returned for each entity of each shard, in order. For each
+    entity of a shard whose call failed, or did not return one entity per
+    entity sent, the error it raised or a DfpApiError saying so.
+  """
+  merged = []
+  for shard, (entities, error) in zip(shards, results):
+    if error is None and len(entities) != len(shard):
+      error = DfpApiError({
+          'faultcode': 'Client',
+          'faultstring': 'The call returned %d entities for the %d sent.'
+                         % (len(entities), len(shard))
+      })
+    if error is not None:
+      merged.extend([error] * len(shard))
+    else:
+      merged.extend(entities)
+  return merged
+
+
+def _ToDfpApiError(error):
+  """Turns an exception raised by an API call into a DfpApiError.
+
+  Args:
+    error: Exception The exception the call raised.
+
+  Returns:
+    DfpApiError The exception itself if it is a DfpApiError, otherwise a
+    DfpApiError holding its message.
+  """
+  if isinstance(error, DfpApiError):
+    return error
+  return DfpApiError({'faultcode': 'Client', 'faultstring': str(error)})
+
+
+def _CallOverChunk(service, method_name, chunk):
+  """Calls an API method over a chunk of entities in a worker thread.
+
+  Args:
+    service: GenericDfpService The service to call the method of.
+    method_name: str Name of the method to call.
+    chunk: list The entities to call the method over.
+
+  Returns:
+    tuple (list, DfpApiError) The entities the method returned and None or, if
+    it failed, None and the error it raised.
+  """
+  try:
+    return list(getattr(service, method_name)(chunk)), None
+  except Exception, e:
+    return None, _ToDfpApiError(e)
+
+
+def _InitWorker(headers, config, service_name, server, version, http_proxy):
+  """Creates the service a worker process makes its calls through.
+
+  Args:
+    headers: dict The client's authentication credentials.
+    config: dict The client's configuration values.
+    service_name: str Name of the service to create.
+    server: str API server to access for API calls.
+    version: str API version to use.
+    http_proxy: str HTTP proxy to use.
+  """
+  global _worker_service, _worker_error
+  # An initializer which raises makes the pool replace the worker over and
+  # over, so the error is kept and reported for every shard instead.
+  try:
+    client = DfpClient(headers, config, config['home'])
+    _worker_service = client.GetService(service_name, server, version,
+                                        http_proxy)
+  except Exception, e:
+    _worker_error = e
+
+
+def _RunShard(task):
+  """Calls an API method over a shard of entities in a worker process.
+
+  Args:
+    task: tuple The name of the method and the shard to call it over.
+
+  Returns:
+    tuple (list, tuple) The entities the method returned and None or, if it
+    failed, None and the class and fault of the DfpApiError it raised. API
+    errors do not survive pickling, so they are rebuilt by the parent process.
+  """
+  method_name, shard = task
+  try:
+    if _worker_error is not None:
+      raise _worker_error
+    return list(getattr(_worker_service, method_name)(shard)), None
+  except Exception, e:
+    error = _ToDfpApiError(e)
+    return None, (error.__class__, error()[0])
@@ -21,12 +21,17 @@ __author__ = 'api.sgrinberg@gmail.com (Stan Grinberg)'
 import os
 import re
 import thread
+import threading
 import time
 
 from adspygoogle.common import SanityCheck
 from adspygoogle.common import Utils
+from adspygoogle.common.AsyncLogWriter import AsyncLogWriter
+from adspygoogle.common.CallExecutor import CallExecutor
+from adspygoogle.common.CallExecutor import DEFAULT_MAX_WORKERS
 from adspygoogle.common.Client import Client
 from adspygoogle.common.Errors import AuthTokenError
+from adspygoogle.common.Errors import Error
 from adspygoogle.common.Errors import ValidationError
 from adspygoogle.common.Logger import Logger
 from adspygoogle.dfp import AUTH_TOKEN_SERVICE
@@ -35,6 +40,7 @@ from adspygoogle.dfp import DfpSanityCheck
 from adspygoogle.dfp import LIB_SHORT_NAME
 from adspygoogle.dfp import LIB_SIG
 from adspygoogle.dfp import REQUIRED_SOAP_HEADERS
+from adspygoogle.dfp.DfpErrors import DfpApiError
 from adspygoogle.dfp.GenericDfpService import GenericDfpService
 
 
@@ -80,6 +86,21 @@ class DfpClient(Client):
         'strict': 'y',
         'pretty_xml': 'y',
         'compress': 'y',
+        'keep_alive': 'y',
+        'concurrent': 'n',
+        'wsdl_cache': 'y',
+        'wsdl_cache_ttl': 86400,
+        'sax_decode': 'y',
+        'stream_response': 'n',
+        'async_log': 'n',
+        'log_queue_size': 1000,
+        'log_queue_policy': 'block', # Or 'drop'
+        'xml_log_sample_rate': 1, # Log 1 in N successful calls
+        'xml_log_max_size': 0, # Bytes of each SOAP body to log, 0 for all
+        'log_overrides': {
+          'InventoryService.getAdUnitsByStatement': {'xml_log_max_size': 4096}
+        },
+        'metrics_callback': None, # Function called with a CallMetrics per call
         'access': ''
       }
       path = '/path/to/home'
@@ -164,8 +185,13 @@ class DfpClient(Client):
       self._headers['applicationName'] = (
           '%s%s' % (self._headers['applicationName'], LIB_SIG))
 
-    # Initialize logger.
+    # Initialize logger. With async_log on, SOAP XML and request logs are
+    # formatted and written by a background thread.
     self.__logger = Logger(LIB_SIG, self._config['log_home'])
+    if Utils.BoolTypeConvert(self._config['async_log']):
+      self.__logger = AsyncLogWriter(self.__logger,
+                                     int(self._config['log_queue_size']),
+                                     self._config['log_queue_policy'])
 
   def __LoadAuthCredentials(self):
     """Load existing authentication credentials from dfp_api_auth.pkl.
@@ -261,7 +287,121 @@ class DfpClient(Client):
           'http_proxy': http_proxy
       }
     return GenericDfpService(self._headers, self._config, op_config,
-                             self.__lock, self.__logger, service_name)
+                             self.__lock, self.__logger, service_name,
+                             self._connection_pool)
+
+  def FlushLogs(self):
+    """Waits until the logs of the calls made so far are written.
+
+    Only needed with the 'async_log' config value on, for example before
+    reading the log files. Pending logs are also written when the process
+    exits.
+    """
+    self.__logger.Flush()
+
+  def SubmitBatch(self, calls, max_workers=DEFAULT_MAX_WORKERS):
+    """Starts running independent API calls on a pool of worker threads.
+
+    The calls do not wait on the client's lock, whatever the 'concurrent'
+    config value, but at most max_workers of them run at the same time. Calls
+    made through the same service share its WSDL and its client's pool of
+    keep-alive connections.
+
+    Args:
+      calls: list (service, method_name, args) tuples, where service is a
+             service returned by GetService or one of the Get*Service methods,
+             method_name the name of the API method to call and args the list
+             of arguments to call it with.
+      [optional]
+      max_workers: int Maximum number of calls to run at the same time.
+
+    Returns:
+      list Future objects holding the outcome of each call, in the order of
+      calls. A call which failed holds a DfpApiError.
+    """
+    executor = CallExecutor(max_workers)
+    try:
+      return self.__SubmitToExecutor(executor, calls, max_workers)
+    finally:
+      executor.Shutdown(wait=False)
+
+  def ExecuteBatch(self, calls, max_workers=DEFAULT_MAX_WORKERS):
+    """Runs independent API calls on a pool of worker threads.
+
+    Unlike a loop of calls, a call which fails does not stop the batch. The
+    error it raised takes the place of its result instead.
+
+    Args:
+      calls: list (service, method_name, args) tuples, as for SubmitBatch.
+      [optional]
+      max_workers: int Maximum number of calls to run at the same time.
+
+    Returns:
+      list The response of each call, in the order of calls, or the
+      DfpApiError it raised.
+    """
+    executor = CallExecutor(max_workers)
+    try:
+      futures = self.__SubmitToExecutor(executor, calls, max_workers)
+    finally:
+      executor.Shutdown()
+    return [future.GetException() or future.GetResult() for future in futures]
+
+  def __SubmitToExecutor(self, executor, calls, max_workers):
+    """Submits API calls to an executor.
+
+    Each service the calls are made through is stood in for by a copy which
+    waits on a semaphore letting max_workers calls through, rather than on the
+    client's lock.
+
+    Args:
+      executor: CallExecutor The executor to run the calls on.
+      calls: list (service, method_name, args) tuples, as for SubmitBatch.
+      max_workers: int Maximum number of calls to run at the same time.
+
+    Returns:
+      list Future objects holding the outcome of each call, in the order of
+      calls.
+    """
+    semaphore = threading.Semaphore(max_workers)
+    batch_services = {}
+    futures = []
+    for service, method_name, args in calls:
+      if id(service) not in batch_services:
+        batch_services[id(service)] = service.CopyWithLock(semaphore)
+      futures.append(executor.Submit(
+          self.__CallForBatch, batch_services[id(service)], method_name, args))
+    return futures
+
+  def __CallForBatch(self, service, method_name, args):
+    """Calls an API method, turning any error into a DfpApiError.
+
+    A call failing before its request could be sent, such as one to a server
+    which can't be reached, returns an Error rather than raising it. Such an
+    error is raised as a DfpApiError too.
+
+    Args:
+      service: GenericDfpService The service to call the method of.
+      method_name: str The name of the API method to call.
+      args: list The arguments to call it with.
+
+    Returns:
+      tuple The response of the API method.
+
+    Raises:
+      DfpApiError: if the call failed.
+    """
+    try:
+      response = getattr(service, method_name)(*args)
+    except DfpApiError:
+      raise
+    except Exception, e:
+      raise DfpApiError({'faultcode': 'Client', 'faultstring': str(e)})
+    if isinstance(response, DfpApiError):
+      raise response
+    elif isinstance(response, Error):
+      raise DfpApiError({'faultcode': 'Client', 'faultstring': str(response)})
+    return response
 
   def GetCompanyService(self, server='https://www.google.com', version=None,
                         http_proxy=None):
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Factory of DfpClient objects for many networks sharing one login."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import threading
+
+from adspygoogle.common.ConnectionPool import ConnectionPool
+from adspygoogle.dfp.DfpClient import DfpClient
+
+
+class DfpClientPool(object):
+
+  """Hands out one DfpClient per network, sharing everything but the headers.
+
+  Every client made by the pool is given its own copy of the headers, holding
+  its network's code, and of the config. They share the pool's HTTP connection
+  pool and, as long as the 'wsdl_cache' config value is on, the parsed WSDLs
+  and compiled method information of each service, which are kept once per
+  process. Only the first client logs in with an email and password; the
+  others reuse its authentication token.
+  """
+
+  def __init__(self, headers, config=None, path=None, connection_pool=None):
+    """Inits DfpClientPool.
+
+    Args:
+      headers: dict Object with populated authentication credentials, as for
+               DfpClient, without a networkCode.
+      [optional]
+      config: dict Object with client configuration values.
+      path: str Relative or absolute path to home directory (i.e. location of
+            pickles and logs/).
+      connection_pool: ConnectionPool The pool of persistent HTTP connections
+                       for the clients to share. By default, the pool creates
+                       one.
+    """
+    self._headers = headers
+    self._config = config
+    self._path = path
+    self._connection_pool = connection_pool or ConnectionPool()
+    self._clients = {}
+    self._lock = threading.Lock()
+
+  def GetClient(self, network_code):
+    """Returns the client for a network, creating it on first use.
+
+    Args:
+      network_code: str The code of the network to make API calls against.
+
+    Returns:
+      DfpClient The network's client.
+    """
+    self._lock.acquire()
+    try:
+      if network_code not in self._clients:
+        headers = dict(self._headers)
+        headers['networkCode'] = network_code
+        auth_token_epoch = None
+        for client in self._clients.itervalues():
+          if client._headers.get('authToken'):
+            headers['authToken'] = client._headers['authToken']
+            auth_token_epoch = client._config['auth_token_epoch']
+            break
+        config = None
+        if self._config is not None:
+          config = dict(self._config)
+        client = DfpClient(headers, config, self._path)
+        if auth_token_epoch is not None:
+          # The token expires when it would for the client it came from.
+          client._config['auth_token_epoch'] = auth_token_epoch
+        client.connection_pool = self._connection_pool
+        self._clients[network_code] = client
+      return self._clients[network_code]
+    finally:
+      self._lock.release()
+
+  def GetNetworkCodes(self):
+    """Returns the codes of the networks the pool has made clients for.
+
+    Returns:
+      list The network codes.
+    """
+    self._lock.acquire()
+    try:
+      return self._clients.keys()
+    finally:
+      self._lock.release()
+
+  def __GetConnectionPool(self):
+    """Return the connection pool shared by the clients.
+
+    Returns:
+      ConnectionPool The pool in use.
+    """
+    return self._connection_pool
+
+  connection_pool = property(__GetConnectionPool)
@@ -0,0 +1,245 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Waits for many report jobs at once, polling each less often as it ages."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import heapq
+import threading
+import time
+
+
+# Default number of seconds between the first two status checks of a job.
+DEFAULT_INITIAL_INTERVAL = 2
+# Default maximum number of seconds between two status checks of a job.
+DEFAULT_MAX_INTERVAL = 30
+# Default factor the interval between status checks grows by after each check.
+DEFAULT_BACKOFF = 2.0
+# Default number of failed status checks in a row after which a job is dropped.
+DEFAULT_MAX_ERRORS = 3
+
+_FINAL_STATUSES = ('COMPLETED', 'FAILED')
+
+
+class DfpReportScheduler(object):
+
+  """Tracks report jobs until they complete or fail.
+
+  A job's status is checked as soon as it is added, then after
+  initial_interval seconds, then after intervals growing by backoff each time,
+  up to max_interval seconds. Short reports are thus picked up within seconds,
+  while long ones cost few GetReportJob calls. Jobs due at the same time are
+  checked one after the other, over the service's keep-alive connection. Once
+  a job completes or fails, its callback is called right away, for example to
+  start downloading the report.
+
+  A status check which raises an error, such as a network error, is retried
+  on the job's usual schedule, so that one bad call does not affect the other
+  jobs. After max_errors such errors in a row the job is dropped, and its
+  errback is called with the last error.
+  """
+
+  def __init__(self, service, initial_interval=DEFAULT_INITIAL_INTERVAL,
+               max_interval=DEFAULT_MAX_INTERVAL, backoff=DEFAULT_BACKOFF,
+               executor=None, max_errors=DEFAULT_MAX_ERRORS):
+    """Inits DfpReportScheduler.
+
+    Args:
+      service: GenericDfpService A service pointing to the ReportService.
+      [optional]
+      initial_interval: float Seconds between the first two status checks of a
+                        job.
+      max_interval: float Maximum number of seconds between two status checks
+                    of a job.
+      backoff: float Factor the interval between status checks grows by.
+      executor: CallExecutor Executor to run callbacks on, so that a download
+                does not hold up the status checks of other jobs. By default,
+                callbacks run in the thread running the scheduler.
+      max_errors: int Number of failed status checks in a row after which a
+                  job is dropped.
+    """
+    self._service = service
+    self._initial_interval = initial_interval
+    self._max_interval = max_interval
+    self._backoff = backoff
+    self._executor = executor
+    self._max_errors = max_errors
+    self._queue = []
+    self._statuses = {}
+    self._errors = {}
+    self._condition = threading.Condition()
+
+  def Add(self, report_job_id, callback=None, errback=None):
+    """Starts tracking a report job. Can be called while Run is running.
+
+    Args:
+      report_job_id: str ID of the report job.
+      [optional]
+      callback: function Called with the ID and the final status of the report
+                job, 'COMPLETED' or 'FAILED', as soon as it is known.
+      errback: function Called with the ID of the report job and the error
+               raised by its last status check, if the job is dropped.
+    """
+    self._condition.acquire()
+    try:
+      heapq.heappush(self._queue, (time.time(), report_job_id, 0, 0, callback,
+                                   errback))
+      self._condition.notify()
+    finally:
+      self._condition.release()
+
+  def Run(self, timeout=None):
+    """Checks the status of the report jobs until none is left to track.
+
+    Args:
+      [optional]
+      timeout: float Maximum number of seconds to run for. None means run
+               until every job has completed or failed.
+
+    Returns:
+      dict The final status of each job which completed or failed, by ID.
+      Jobs dropped because of errors are left out, see GetErrors.
+    """
+    deadline = timeout is not None and time.time() + timeout or None
+    while True:
+      due = self._WaitForDueJobs(deadline)
+      if not due:
+        break
+      while due:
+        check = due.pop(0)
+        try:
+          self._Check(*check)
+        except:
+          # A callback raised. Keep tracking the jobs which were due with it.
+          self._condition.acquire()
+          try:
+            for check in due:
+              heapq.heappush(self._queue, check)
+          finally:
+            self._condition.release()
+          raise
+    self._condition.acquire()
+    try:
+      return dict(self._statuses)
+    finally:
+      self._condition.release()
+
+  def GetErrors(self):
+    """Returns the jobs dropped because their status could not be checked.
+
+    Returns:
+      dict The error raised by the last status check of each dropped job, by
+      ID.
+    """
+    self._condition.acquire()
+    try:
+      return dict(self._errors)
+    finally:
+      self._condition.release()
+
+  def _WaitForDueJobs(self, deadline):
+    """Waits until at least one job is due for a status check.
+
+    Args:
+      deadline: float Time at which to stop waiting, or None to wait as long
+                as there are jobs.
+
+    Returns:
+      list (due time, report job ID, interval, errors, callback, errback)
+      tuples of the jobs due for a status check. Empty if there are no jobs left or the deadline
+      has passed.
+    """
+    self._condition.acquire()
+    try:
+      while self._queue:
+        now = time.time()
+        if deadline is not None and now >= deadline:
+          return []
+        if self._queue[0][0] <= now:
+          due = []
+          while self._queue and self._queue[0][0] <= now:
+            due.append(heapq.heappop(self._queue))
+          return due
+        wait = self._queue[0][0] - now
+        if deadline is not None:
+          wait = min(wait, deadline - now)
+        self._condition.wait(wait)
+      return []
+    finally:
+      self._condition.release()
+
+  def _Check(self, unused_due, report_job_id, interval, errors, callback,
+             errback):
+    """Checks the status of a report job, then reschedules or finishes it.
+
+    Args:
+      unused_due: float Time the check was due at.
+      report_job_id: str ID of the report job.
+      interval: float Seconds waited since the previous check of this job.
+      errors: int Number of failed status checks of this job in a row.
+      callback: function Called with the ID and final status of the job.
+      errback: function Called with the ID of the job and the last error, if
+               the job is dropped.
+    """
+    try:
+      status = self._service.GetReportJob(report_job_id)[0]['reportJobStatus']
+    except Exception, e:
+      errors += 1
+      if errors >= self._max_errors:
+        self._condition.acquire()
+        try:
+          self._errors[report_job_id] = e
+        finally:
+          self._condition.release()
+        self._Call(errback, report_job_id, e)
+        return
+      status = None
+    else:
+      errors = 0
+
+    if status not in _FINAL_STATUSES:
+      if interval:
+        interval = min(interval * self._backoff, self._max_interval)
+      else:
+        interval = self._initial_interval
+      self._condition.acquire()
+      try:
+        heapq.heappush(self._queue, (time.time() + interval, report_job_id,
+                                     interval, errors, callback, errback))
+      finally:
+        self._condition.release()
+      return
+
+    self._condition.acquire()
+    try:
+      self._statuses[report_job_id] = status
+    finally:
+      self._condition.release()
+    self._Call(callback, report_job_id, status)
+
+  def _Call(self, callback, *args):
+    """Calls a job's callback, on the executor if there is one.
+
+    Args:
+      callback: function The callback, or None.
+      *args: list Arguments to call the callback with.
+    """
+    if callback is not None:
+      if self._executor is not None:
+        self._executor.Submit(callback, *args)
+      else:
+        callback(*args)
@@ -0,0 +1,263 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Holds the rows of a CSV or TSV report in one compact array per column."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import array
+import itertools
+import math
+
+from adspygoogle.dfp.DfpErrors import DfpError
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+# Largest magnitude up to which every integer is exactly a float.
+_MAX_EXACT_FLOAT = 2 ** 53
+
+
+class DfpReportTable(object):
+
+  """Columnar storage for the rows of a report.
+
+  Each column is stored as an array.array of integers ('l') as long as all of
+  its values are integers, then as an array.array of floats ('d') as long as
+  all of its values are numbers. Other columns, usually dimensions, are stored
+  as lists of interned strings, so that each distinct value is held in memory
+  once. A column switches to the next kind when a value does not fit, the
+  values read so far included, which keep the text they had in the report
+  when the column switches to strings. Integers with a leading zero, such as
+  postal codes, and values such as 'nan' or 'inf' are kept as strings.
+
+  A report thus takes about 8 bytes per value, rather than a dict and a string
+  per value when rows are parsed into dicts.
+  """
+
+  def __init__(self, rows):
+    """Inits DfpReportTable.
+
+    Args:
+      rows: iterable The rows of the report, each a list of strings, header row
+            first, as yielded by DfpUtils.GetReportRows. Empty rows are
+            skipped.
+
+    Raises:
+      DfpError: if there is no header row, or a row does not have one value per
+                column.
+    """
+    rows = iter(rows)
+    try:
+      self._headers = list(rows.next())
+    except StopIteration:
+      raise DfpError('The report has no header row.')
+    width = len(self._headers)
+    self._columns = [array.array('l') for _ in xrange(width)]
+    parsers = [_ParseInt] * width
+    # The text of the numbers which _Format does not give back as written, by
+    # row, for each column, until the column's kind is known.
+    texts = [{} for _ in xrange(width)]
+    self._length = 0
+    for row in rows:
+      if not row:
+        continue
+      if len(row) != width:
+        raise DfpError('Row %d of the report has %d values, expected %d.'
+                       % (self._length + 1, len(row), width))
+      for index in xrange(width):
+        value = row[index]
+        try:
+          parsed = parsers[index](value)
+          # Integers too large for a C long do not fit in an array('l').
+          self._columns[index].append(parsed)
+        except (ValueError, OverflowError):
+          parsers[index] = self.__Widen(index, value, texts[index])
+          continue
+        if parsers[index] is not intern and _Format(parsed) != value:
+          texts[index][self._length] = value
+      self._length += 1
+
+  def __Widen(self, index, value, texts):
+    """Switches a column to the next kind able to hold a value, and appends it.
+
+    Args:
+      index: int Index of the column.
+      value: str The value which does not fit in the column.
+      texts: dict The text of the column's numbers which _Format does not give
+             back as written, by row. Updated for the new kind.
+
+    Returns:
+      function The parser for the values of the column from now on.
+    """
+    column = self._columns[index]
+    if isinstance(column, array.array) and column.typecode == 'l':
+      try:
+        parsed = _ParseFloat(value)
+      except (ValueError, OverflowError):
+        pass
+      else:
+        for row_index, number in enumerate(column):
+          if abs(number) > _MAX_EXACT_FLOAT and row_index not in texts:
+            texts[row_index] = str(number)
+        self._columns[index] = array.array('d', column)
+        self._columns[index].append(parsed)
+        if _Format(parsed) != value:
+          texts[len(column)] = value
+        return _ParseFloat
+    if isinstance(column, array.array):
+      column = [intern(texts.get(row_index) or _Format(number))
+                for row_index, number in enumerate(column)]
+      self._columns[index] = column
+      texts.clear()
+    column.append(intern(value))
+    return intern
+
+  def __len__(self):
+    """Returns the number of rows, header row excluded."""
+    return self._length
+
+  def __iter__(self):
+    """Iterates over the rows of the report.
+
+    Returns:
+      iterator tuple the values of each row, header row excluded.
+    """
+    return itertools.izip(*self._columns)
+
+  def __getitem__(self, index):
+    """Returns a row of the report.
+
+    Args:
+      index: int Index of the row, header row excluded.
+
+    Returns:
+      tuple The values of the row.
+    """
+    return tuple([column[index] for column in self._columns])
+
+  def GetHeaders(self):
+    """Returns the names of the columns, from the header row.
+
+    Returns:
+      list The names of the columns.
+    """
+    return list(self._headers)
+
+  def GetColumn(self, name):
+    """Returns the values of a column.
+
+    Args:
+      name: str Name of the column, as in the header row.
+
+    Returns:
+      array.array|list The values of the column. Not to be modified.
+
+    Raises:
+      DfpError: if the report has no such column.
+    """
+    if name not in self._headers:
+      raise DfpError('The report has no column \'%s\'.' % name)
+    return self._columns[self._headers.index(name)]
+
+  def GetNumPyColumn(self, name):
+    """Returns the values of a column as a NumPy array.
+
+    Numeric columns are returned as read-only views of the stored data, without
+    copying it. String columns are returned as arrays of objects.
+
+    Args:
+      name: str Name of the column, as in the header row.
+
+    Returns:
+      numpy.ndarray The values of the column.
+
+    Raises:
+      DfpError: if NumPy is not installed, or the report has no such column.
+    """
+    if numpy is None:
+      raise DfpError('NumPy is not installed.')
+    column = self.GetColumn(name)
+    if not isinstance(column, array.array):
+      return numpy.array(column, dtype=object)
+    if not column:
+      return numpy.zeros(0, dtype=column.typecode)
+    return numpy.frombuffer(column, dtype=column.typecode)
+
+
+def _ParseInt(value):
+  """Parses an integer, unless it has a leading zero.
+
+  Args:
+    value: str The value to parse.
+
+  Returns:
+    int The parsed value.
+
+  Raises:
+    ValueError: if the value is not an integer or has a leading zero.
+  """
+  _CheckLeadingZero(value)
+  return int(value)
+
+
+def _ParseFloat(value):
+  """Parses a number, unless it has a leading zero.
+
+  Args:
+    value: str The value to parse.
+
+  Returns:
+    float The parsed value.
+
+  Raises:
+    ValueError: if the value is not a finite number or has a leading zero.
+  """
+  _CheckLeadingZero(value)
+  number = float(value)
+  if math.isnan(number) or math.isinf(number):
+    raise ValueError('Not a finite number: %r.' % value)
+  return number
+
+
+def _Format(number):
+  """Formats a number the way a report usually writes it.
+
+  Args:
+    number: int|float The number to format.
+
+  Returns:
+    str The number, without a fractional part if it is a whole number.
+  """
+  if isinstance(number, float):
+    if number.is_integer() and abs(number) <= _MAX_EXACT_FLOAT:
+      return '%d' % number
+    return repr(number)
+  return str(number)
+
+
+def _CheckLeadingZero(value):
+  """Rejects numbers with a leading zero, such as postal codes.
+
+  Args:
+    value: str The value to check.
+
+  Raises:
+    ValueError: if the value starts with a zero followed by a digit.
+  """
+  if value[:1] == '0' and value[1:2].isdigit():
+    raise ValueError('Leading zero in %r.' % value)
@@ -63,6 +63,9 @@ class DfpSoapBuffer(SoapBuffer):
     Returns:
       str responseTime header value.
     """
+    value = self._GetResponseHeaderValue('responseTime')
+    if value is not None:
+      return value
     return self.__GetXmlValueByName(self._GetXmlIn(),
         ['responseTime', 'Header/ResponseHeader/responseTime',
          'ns2:responseTime'])
@@ -73,5 +76,8 @@ class DfpSoapBuffer(SoapBuffer):
     Returns:
       str requestId header value.
     """
+    value = self._GetResponseHeaderValue('requestId')
+    if value is not None:
+      return value
     return self.__GetXmlValueByName(self._GetXmlIn(),
         ['requestId', 'Header/ResponseHeader/requestId', 'ns2:requestId'])
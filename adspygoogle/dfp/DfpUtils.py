@@ -18,19 +18,31 @@
 
 __author__ = 'api.sgrinberg@gmail.com (Stan Grinberg)'
 
-import gzip
+import collections
+import csv
+import httplib
 import os
-import StringIO
+import socket
+import sys
+import threading
 import time
-import urllib
+import urllib2
+import zlib
 
 from adspygoogle.common import SanityCheck
 from adspygoogle.common import Utils
 from adspygoogle.common.Errors import ValidationError
 from adspygoogle.dfp import DEFAULT_API_VERSION
 from adspygoogle.dfp import LIB_HOME
+from adspygoogle.dfp.DfpReportScheduler import DfpReportScheduler
+from adspygoogle.dfp.DfpReportTable import DfpReportTable
 
 
+# Number of compressed bytes read at a time when downloading a report.
+REPORT_CHUNK_SIZE = 65536
+# Default number of times a failed report download is resumed.
+DEFAULT_REPORT_DOWNLOAD_RETRIES = 3
+
 def GetCurrencies():
   """Get a list of available currencies.
 
@@ -53,7 +65,8 @@ def GetTimezones():
 
 def GetAllEntitiesByStatement(client, service_name, query='', page_size=500,
                               server='https://www.google.com',
-                              version=DEFAULT_API_VERSION, http_proxy=None):
+                              version=DEFAULT_API_VERSION, http_proxy=None,
+                              max_in_flight=1):
   """Get all existing entities by statement.
 
   All existing entities are retrieved for a given statement and page size. The
@@ -72,17 +85,20 @@ def GetAllEntitiesByStatement(client, service_name, query='', page_size=500,
             'https://www.google.com'.
     version: str API version to use.
     http_proxy: str HTTP proxy to use.
+    max_in_flight: int number of pages to request at the same time. The
+                   default is 1.
 
   Returns:
     list a list of existing entities.
   """
   service = eval('client.Get%sService(server, version, http_proxy)'
                  % service_name)
-  return GetAllEntitiesByStatementWithService(service, query, page_size)
+  return GetAllEntitiesByStatementWithService(service, query, page_size,
+                                              max_in_flight=max_in_flight)
 
 
 def GetAllEntitiesByStatementWithService(service, query='', page_size=500,
-                                         bind_vars=None):
+                                         bind_vars=None, max_in_flight=1):
   """Get all existing entities by statement.
 
   All existing entities are retrieved for a given statement and page size. The
@@ -97,22 +113,84 @@ def GetAllEntitiesByStatementWithService(service, query='', page_size=500,
     page_size: int size of the page to use. If page size is less than 0 or
                greater than 500, defaults to 500.
     bind_vars: list Key value pairs of bind variables to use with query.
+    max_in_flight: int number of pages to request at the same time. The
+                   default is 1.
 
   Returns:
     list a list of existing entities.
   """
+  return list(GetEntitiesByStatementWithService(
+      service, query, page_size, bind_vars, max_in_flight=max_in_flight))
 
-  service_name = service._service_name[0:service._service_name.rfind('Service')]
 
-  if service_name == 'Inventory':
-    service_name = 'AdUnit'
-  if service_name[-1] == 'y':
-    method_name = service_name[:-1] + 'ies'
-  else:
-    method_name = service_name + 's'
-  if service_name == 'Content':
-    method_name = service_name
-  method_name = 'Get%sByStatement' % method_name
+def GetEntitiesByStatementWithService(service, query='', page_size=500,
+                                      bind_vars=None, offset=0,
+                                      max_in_flight=1):
+  """Iterate over existing entities by statement.
+
+  Works like GetAllEntitiesByStatementWithService, but yields the entities as
+  each page arrives instead of grouping them into a single list, so that only
+  one page of entities is held in memory at a time.
+
+  Args:
+    service: ApiService an instance of the service to use.
+    [optional]
+    query: str a statement filter to apply, if any. The default is empty string.
+    page_size: int size of the page to use. If page size is less than 0 or
+               greater than 500, defaults to 500.
+    bind_vars: list Key value pairs of bind variables to use with query.
+    offset: int offset of the first entity to fetch, to resume an earlier
+            iteration. The default is 0.
+    max_in_flight: int number of pages to request at the same time. The
+                   default is 1.
+
+  Returns:
+    generator the existing entities, one at a time.
+
+  Raises:
+    ValidationError: if the query contains a LIMIT or OFFSET clause.
+  """
+  for _, entities in GetPagesByStatementWithService(
+      service, query, page_size, bind_vars, offset, max_in_flight):
+    for entity in entities:
+      yield entity
+
+
+def GetPagesByStatementWithService(service, query='', page_size=500,
+                                   bind_vars=None, offset=0, max_in_flight=1):
+  """Iterate over pages of existing entities by statement.
+
+  By default, each page is fetched only once the previous one has been
+  consumed. With max_in_flight above 1, the pages that follow are requested
+  ahead, from as many threads, while earlier ones are being consumed. Pages
+  are still yielded in order and no further page is requested once a short
+  one comes back. The requests themselves only overlap if the client's
+  'concurrent' config value is on; otherwise they wait for each other on the
+  client's lock.
+
+  Along with its entities, every page comes with its offset, which can be
+  passed back in to resume fetching at that page.
+
+  Args:
+    service: ApiService an instance of the service to use.
+    [optional]
+    query: str a statement filter to apply, if any. The default is empty string.
+    page_size: int size of the page to use. If page size is less than 0 or
+               greater than 500, defaults to 500.
+    bind_vars: list Key value pairs of bind variables to use with query.
+    offset: int offset of the first entity to fetch, to resume an earlier
+            iteration. The default is 0.
+    max_in_flight: int number of pages to request at the same time. The
+                   default is 1.
+
+  Returns:
+    generator (int, list) tuples of the offset and the entities of each page.
+
+  Raises:
+    ValidationError: if the query contains a LIMIT or OFFSET clause, or the
+                     offset is negative.
+  """
+  method = getattr(service, _GetByStatementMethodName(service))
 
   if page_size <= 0 or page_size > 500:
     page_size = 500
@@ -121,22 +199,135 @@ def GetAllEntitiesByStatementWithService(service, query='', page_size=500,
       (query.upper().find('LIMIT') > -1 or query.upper().find('OFFSET') > -1)):
     raise ValidationError('The filter query contains an option that is '
                           'incompatible with this method.')
+  if offset < 0:
+    raise ValidationError('The offset must not be negative.')
 
-  offset = 0
-  all_entities = []
-  while True:
-    filter_statement = {
-        'query': '%s LIMIT %s OFFSET %s' % (query, page_size, offset),
-        'values': bind_vars
-    }
-    entities = eval('service.%s(filter_statement)[0].get(\'results\')'
-                    % method_name)
-
+  if max_in_flight > 1:
+    pages = _PrefetchPages(method, query, page_size, bind_vars, offset,
+                           max_in_flight)
+  else:
+    pages = (_GetPage(method, query, page_size, bind_vars, page_offset)
+             for page_offset in xrange(offset, sys.maxint, page_size))
+  for page_offset, entities in pages:
     if not entities: break
-    all_entities.extend(entities)
+    yield page_offset, entities
     if len(entities) < page_size: break
-    offset += page_size
-  return all_entities
+
+
+def _GetPage(method, query, page_size, bind_vars, offset):
+  """Get a single page of entities.
+
+  Args:
+    method: function the service's Get*ByStatement method.
+    query: str a statement filter to apply.
+    page_size: int size of the page.
+    bind_vars: list Key value pairs of bind variables to use with query.
+    offset: int offset of the page's first entity.
+
+  Returns:
+    tuple (int, list) the offset and the entities of the page.
+  """
+  filter_statement = {
+      'query': '%s LIMIT %s OFFSET %s' % (query, page_size, offset),
+      'values': bind_vars
+  }
+  return offset, method(filter_statement)[0].get('results')
+
+
+class _PageRequest(threading.Thread):
+
+  """Requests a single page of entities in the background."""
+
+  def __init__(self, method, query, page_size, bind_vars, offset):
+    """Inits _PageRequest.
+
+    Args:
+      method: function the service's Get*ByStatement method.
+      query: str a statement filter to apply.
+      page_size: int size of the page.
+      bind_vars: list Key value pairs of bind variables to use with query.
+      offset: int offset of the page's first entity.
+    """
+    threading.Thread.__init__(self)
+    self.setDaemon(True)
+    self.__args = (method, query, page_size, bind_vars, offset)
+    self.__page = None
+    self.__exc_info = None
+
+  def run(self):
+    try:
+      self.__page = _GetPage(*self.__args)
+    except Exception:
+      self.__exc_info = sys.exc_info()
+
+  def GetPage(self):
+    """Wait for the page and return it.
+
+    Returns:
+      tuple (int, list) the offset and the entities of the page.
+
+    Raises:
+      Exception: whatever the request raised.
+    """
+    self.join()
+    if self.__exc_info:
+      raise self.__exc_info[0], self.__exc_info[1], self.__exc_info[2]
+    return self.__page
+
+
+def _PrefetchPages(method, query, page_size, bind_vars, offset, max_in_flight):
+  """Get pages of entities, keeping several requests for them in flight.
+
+  Args:
+    method: function the service's Get*ByStatement method.
+    query: str a statement filter to apply.
+    page_size: int size of the page.
+    bind_vars: list Key value pairs of bind variables to use with query.
+    offset: int offset of the first page's first entity.
+    max_in_flight: int number of pages to request at the same time.
+
+  Returns:
+    generator (int, list) tuples of the offset and the entities of each page,
+    in order. Stops after the first page that is not full.
+  """
+  in_flight = collections.deque()
+  try:
+    while True:
+      while len(in_flight) < max_in_flight:
+        request = _PageRequest(method, query, page_size, bind_vars, offset)
+        request.start()
+        in_flight.append(request)
+        offset += page_size
+      page = in_flight.popleft().GetPage()
+      yield page
+      if not page[1] or len(page[1]) < page_size: break
+  finally:
+    # Requests for pages past the last one can not be cancelled. They are
+    # waited for, so that no call is left running once iteration stops.
+    for request in in_flight:
+      request.join()
+
+
+def _GetByStatementMethodName(service):
+  """Get the name of the method that fetches a service's entities by statement.
+
+  Args:
+    service: ApiService an instance of the service to use.
+
+  Returns:
+    str name of the service's Get*ByStatement method.
+  """
+  service_name = service._service_name[0:service._service_name.rfind('Service')]
+
+  if service_name == 'Inventory':
+    service_name = 'AdUnit'
+  if service_name[-1] == 'y':
+    method_name = service_name[:-1] + 'ies'
+  else:
+    method_name = service_name + 's'
+  if service_name == 'Content':
+    method_name = service_name
+  return 'Get%sByStatement' % method_name
 
 
 def DownloadReport(report_job_id, export_format, service):
@@ -150,28 +341,284 @@ def DownloadReport(report_job_id, export_format, service):
   Returns:
     str Report data or empty string if report failed.
   """
+  return ''.join(GetReportChunks(report_job_id, export_format, service))
+
+
+def DownloadReportToFile(report_job_id, export_format, service, outfile,
+                         progress_callback=None,
+                         max_retries=DEFAULT_REPORT_DOWNLOAD_RETRIES):
+  """Download report data into a file, a chunk at a time.
+
+  Args:
+    report_job_id: str ID of the report job.
+    export_format: str Export format for the report file.
+    service: GenericDfpService A service pointing to the ReportService.
+    outfile: file File, or any object with a write method, to write the
+             decompressed report data into.
+    [optional]
+    progress_callback: function Called after each chunk is downloaded with the
+                       number of compressed bytes downloaded so far and the
+                       size of the compressed report, or None if unknown.
+    max_retries: int Number of times a failed download is resumed.
+
+  Returns:
+    bool True if the report was written, False if the report failed.
+  """
+  report_url = _GetCompletedReportUrl(report_job_id, export_format, service)
+  if report_url is None:
+    return False
+  for chunk in _StreamReport(report_url, progress_callback, max_retries):
+    outfile.write(chunk)
+  return True
+
+
+def GetReportChunks(report_job_id, export_format, service,
+                    progress_callback=None,
+                    max_retries=DEFAULT_REPORT_DOWNLOAD_RETRIES):
+  """Iterate over the decompressed data of a report as it is downloaded.
+
+  Only one chunk of the report is held in memory at a time. If the download
+  fails midway, it is resumed where it stopped, using an HTTP range request.
+
+  Args:
+    report_job_id: str ID of the report job.
+    export_format: str Export format for the report file.
+    service: GenericDfpService A service pointing to the ReportService.
+    [optional]
+    progress_callback: function Called after each chunk is downloaded with the
+                       number of compressed bytes downloaded so far and the
+                       size of the compressed report, or None if unknown.
+    max_retries: int Number of times a failed download is resumed.
+
+  Returns:
+    generator str chunks of report data. Nothing if the report failed.
+  """
+  report_url = _GetCompletedReportUrl(report_job_id, export_format, service)
+  if report_url is None:
+    return
+  for chunk in _StreamReport(report_url, progress_callback, max_retries):
+    yield chunk
+
+
+def GetReportRows(report_job_id, export_format, service,
+                  progress_callback=None,
+                  max_retries=DEFAULT_REPORT_DOWNLOAD_RETRIES):
+  """Iterate over the rows of a CSV or TSV report as it is downloaded.
+
+  Args:
+    report_job_id: str ID of the report job.
+    export_format: str Export format for the report file. One of the CSV
+                   formats or TSV.
+    service: GenericDfpService A service pointing to the ReportService.
+    [optional]
+    progress_callback: function Called after each chunk is downloaded with the
+                       number of compressed bytes downloaded so far and the
+                       size of the compressed report, or None if unknown.
+    max_retries: int Number of times a failed download is resumed.
+
+  Returns:
+    generator list the values of each row, header row first.
+  """
+  if export_format == 'TSV':
+    delimiter = '\t'
+  else:
+    delimiter = ','
+  chunks = GetReportChunks(report_job_id, export_format, service,
+                           progress_callback, max_retries)
+  return csv.reader(_SplitLines(chunks), delimiter=delimiter)
+
+
+def GetReportTable(report_job_id, export_format, service,
+                   progress_callback=None,
+                   max_retries=DEFAULT_REPORT_DOWNLOAD_RETRIES):
+  """Download a CSV or TSV report into one compact array per column.
+
+  The report is parsed as it is downloaded, so neither its text nor a list of
+  its rows is ever held in memory.
+
+  Args:
+    report_job_id: str ID of the report job.
+    export_format: str Export format for the report file. One of the CSV
+                   formats or TSV.
+    service: GenericDfpService A service pointing to the ReportService.
+    [optional]
+    progress_callback: function Called after each chunk is downloaded with the
+                       number of compressed bytes downloaded so far and the
+                       size of the compressed report, or None if unknown.
+    max_retries: int Number of times a failed download is resumed.
+
+  Returns:
+    DfpReportTable The rows of the report.
+  """
+  return DfpReportTable(GetReportRows(report_job_id, export_format, service,
+                                      progress_callback, max_retries))
+
+
+def WaitForReportJob(report_job_id, service):
+  """Wait for a report job to complete or fail.
+
+  The job's status is checked less and less often, from every few seconds up
+  to every 30 seconds. Use DfpReportScheduler to wait for several jobs at once.
+
+  Args:
+    report_job_id: str ID of the report job.
+    service: GenericDfpService A service pointing to the ReportService.
+
+  Returns:
+    str The final status of the report job, 'COMPLETED' or 'FAILED'.
+
+  Raises:
+    Exception: the error raised by the last status check of the job, if its
+    status could not be checked several times in a row.
+  """
   SanityCheck.ValidateTypes(((report_job_id, (str, unicode)),))
 
-  # Wait for report to complete.
-  status = service.GetReportJob(report_job_id)[0]['reportJobStatus']
-  while status != 'COMPLETED' and status != 'FAILED':
-    if Utils.BoolTypeConvert(service._config['debug']):
-      print 'Report job status: %s' % status
-    time.sleep(30)
-    status = service.GetReportJob(report_job_id)[0]['reportJobStatus']
+  scheduler = DfpReportScheduler(service)
+  scheduler.Add(report_job_id)
+  statuses = scheduler.Run()
+  if report_job_id not in statuses:
+    raise scheduler.GetErrors()[report_job_id]
+  status = statuses[report_job_id]
 
-  if status == 'FAILED':
-    if Utils.BoolTypeConvert(service._config['debug']):
+  if Utils.BoolTypeConvert(service._config['debug']):
+    if status == 'FAILED':
       print 'Report process failed'
-    return ''
-  else:
-    if Utils.BoolTypeConvert(service._config['debug']):
+    else:
       print 'Report has completed successfully'
+  return status
+
+
+def _GetCompletedReportUrl(report_job_id, export_format, service):
+  """Wait for a report job and get the URL its report can be downloaded from.
+
+  Args:
+    report_job_id: str ID of the report job.
+    export_format: str Export format for the report file.
+    service: GenericDfpService A service pointing to the ReportService.
+
+  Returns:
+    str The report download URL, or None if the report failed.
+  """
+  if WaitForReportJob(report_job_id, service) == 'FAILED':
+    return None
+  return service.GetReportDownloadURL(report_job_id, export_format)[0]
+
 
-  # Get report download URL.
-  report_url = service.GetReportDownloadURL(report_job_id, export_format)[0]
+def _StreamReport(report_url, progress_callback=None,
+                  max_retries=DEFAULT_REPORT_DOWNLOAD_RETRIES):
+  """Download and decompress a gzipped report, a chunk at a time.
+
+  Args:
+    report_url: str URL of the gzipped report.
+    [optional]
+    progress_callback: function Called after each chunk is downloaded with the
+                       number of compressed bytes downloaded so far and the
+                       size of the compressed report, or None if unknown.
+    max_retries: int Number of times a failed download is resumed.
 
-  # Download report.
-  data = urllib.urlopen(report_url).read()
-  data = gzip.GzipFile(fileobj=StringIO.StringIO(data)).read()
-  return data
+  Returns:
+    generator str chunks of decompressed report data.
+
+  Raises:
+    urllib2.URLError, httplib.HTTPException, socket.error: if the download
+    still fails after max_retries attempts to resume it.
+    httplib.IncompleteRead: if the report is shorter than its Content-Length,
+    or, without one, its gzip stream ends early, after max_retries attempts
+    to resume it.
+  """
+  decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+  received = 0
+  total = None
+  retries = 0
+  while True:
+    request = urllib2.Request(report_url)
+    if received:
+      request.add_header('Range', 'bytes=%d-' % received)
+    try:
+      response = urllib2.urlopen(request)
+      try:
+        # Servers which ignore the range send the whole report again.
+        skip = 0
+        if received and response.getcode() != 206:
+          skip = received
+        if total is None and not received:
+          length = response.info().getheader('Content-Length')
+          if length and length.isdigit():
+            total = int(length)
+        while True:
+          chunk = response.read(REPORT_CHUNK_SIZE)
+          if not chunk:
+            break
+          if skip:
+            chunk, skip = chunk[skip:], max(0, skip - len(chunk))
+            if not chunk:
+              continue
+          received += len(chunk)
+          if progress_callback:
+            progress_callback(received, total)
+          data = decompressor.decompress(chunk)
+          if data:
+            yield data
+      finally:
+        response.close()
+      # Without a Content-Length, a dropped connection looks like the end of
+      # the report, but leaves the gzip stream unfinished.
+      if ((total is not None and received < total) or
+          (total is None and not _IsGzipStreamComplete(decompressor))):
+        raise httplib.IncompleteRead('%d bytes read' % received, total)
+      break
+    except (urllib2.URLError, httplib.HTTPException, socket.error):
+      retries += 1
+      if retries > max_retries:
+        raise
+      time.sleep(retries)
+  if not _IsGzipStreamComplete(decompressor):
+    raise httplib.IncompleteRead('%d bytes read, gzip stream unfinished'
+                                 % received, total)
+  data = decompressor.flush()
+  if data:
+    yield data
+
+
+def _IsGzipStreamComplete(decompressor):
+  """Return whether a decompressor has read the whole of its gzip stream.
+
+  Decompression objects do not tell whether the end of the stream, trailer
+  included, was reached, so a copy of the decompressor is given one more byte,
+  which it only leaves unused past the end of the stream.
+
+  Args:
+    decompressor: zlib.Decompress The decompressor of the report.
+
+  Returns:
+    bool True if the gzip stream was read to its end.
+  """
+  probe = decompressor.copy()
+  try:
+    probe.decompress('\0')
+  except zlib.error:
+    return False
+  return bool(probe.unused_data)
+
+
+def _SplitLines(chunks):
+  """Split chunks of text into lines, keeping their line endings.
+
+  Args:
+    chunks: iterable str chunks of text.
+
+  Returns:
+    generator str lines of text.
+  """
+  partial = ''
+  for chunk in chunks:
+    lines = (partial + chunk).splitlines(True)
+    partial = ''
+    # The last line may go on in the next chunk, even if it ends with a '\r'
+    # whose '\n' has not arrived yet.
+    if lines and not lines[-1].endswith('\n'):
+      partial = lines.pop()
+    for line in lines:
+      yield line
+  if partial:
+    yield partial
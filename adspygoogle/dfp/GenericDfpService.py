@@ -18,6 +18,7 @@
 
 __author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
 
+import threading
 import time
 
 from adspygoogle import SOAPpy
@@ -26,6 +27,7 @@ from adspygoogle.common.Errors import Error
 from adspygoogle.common.Errors import ValidationError
 from adspygoogle.common.GenericApiService import GenericApiService
 from adspygoogle.common.GenericApiService import MethodInfoKeys
+from adspygoogle.common.soappy import SoappyUtils
 from adspygoogle.dfp import AUTH_TOKEN_EXPIRE
 from adspygoogle.dfp import AUTH_TOKEN_SERVICE
 from adspygoogle.dfp import LIB_SIG
@@ -36,6 +38,11 @@ from adspygoogle.dfp.DfpErrors import ERRORS
 from adspygoogle.dfp.DfpSoapBuffer import DfpSoapBuffer
 
 
+# Held while an expired auth token is regenerated, so that concurrent calls
+# sharing a client's headers log in only once.
+_auth_token_lock = threading.Lock()
+
+
 class GenericDfpService(GenericApiService):
 
   """Wrapper for any DFP web service."""
@@ -51,7 +58,8 @@ class GenericDfpService(GenericApiService):
   # all SOAP interactions
   _BUFFER_CLASS = DfpSoapBuffer
 
-  def __init__(self, headers, config, op_config, lock, logger, service_name):
+  def __init__(self, headers, config, op_config, lock, logger, service_name,
+               connection_pool=None):
     """Inits GenericDfpService.
 
     Args:
@@ -63,6 +71,9 @@ class GenericDfpService(GenericApiService):
       lock: thread.lock Thread lock to use to synchronize requests.
       logger: Logger Instance of Logger to use for logging.
       service_name: string The name of this service.
+      [optional]
+      connection_pool: ConnectionPool Pool of persistent HTTP connections to
+                       share with other services.
     """
     service_url = '/'.join([op_config['server'], 'apis/ads/publisher',
                             op_config['version'], service_name])
@@ -73,7 +84,7 @@ class GenericDfpService(GenericApiService):
     super(GenericDfpService, self).__init__(
         headers, config, op_config, lock, logger, service_name, service_url,
         GenericDfpService._WRAP_LISTS, GenericDfpService._BUFFER_CLASS,
-        namespace, namespace_extractor)
+        namespace, namespace_extractor, connection_pool)
 
     # DFP-specific changes to the SOAPpy.WSDL.Proxy
     methodattrs = {
@@ -82,24 +93,22 @@ class GenericDfpService(GenericApiService):
     }
     self._soappyservice.soapproxy.methodattrs = methodattrs
 
-  def _SetHeaders(self):
-    """Sets the SOAP headers for this service's requests."""
-    now = time.time()
-    if ((('authToken' not in self._headers and
-          'auth_token_epoch' not in self._config) or
-         int(now - self._config['auth_token_epoch']) >= AUTH_TOKEN_EXPIRE) and
-        not self._headers.get('oauth2credentials')):
-      if ('email' not in self._headers or not self._headers['email'] or
-          'password' not in self._headers or not self._headers['password']):
-        raise ValidationError('Required authentication headers, \'email\' and '
-                              '\'password\', are missing. Unable to regenerate '
-                              'authentication token.')
-      self._headers['authToken'] = Utils.GetAuthToken(
-          self._headers['email'], self._headers['password'], AUTH_TOKEN_SERVICE,
-          LIB_SIG, self._config['proxy'])
-      self._config['auth_token_epoch'] = time.time()
-
-    # Apply headers to the SOAPpy service.
+  def _GetSoapHeaders(self):
+    """Returns the SOAP headers for a request made by this service.
+
+    Returns:
+      SOAPpy.Types.headerType The SOAP headers to send.
+    """
+    if self.__IsAuthTokenExpired():
+      _auth_token_lock.acquire()
+      try:
+        # Another call may have regenerated the token while this one waited.
+        if self.__IsAuthTokenExpired():
+          self.__RegenerateAuthToken()
+      finally:
+        _auth_token_lock.release()
+
+    # Build the headers for this request.
     soap_headers = SOAPpy.Types.headerType(attrs={'xmlns': self._namespace})
     request_header_data = {}
     if 'authToken' in self._headers:
@@ -118,7 +127,35 @@ class GenericDfpService(GenericApiService):
     soap_headers.RequestHeader = request_header
     if 'authToken' in self._headers:
       soap_headers.RequestHeader._keyord = ['applicationName', 'authentication']
-    self._soappyservice.soapproxy.header = soap_headers
+    return soap_headers
+
+  def __IsAuthTokenExpired(self):
+    """Returns whether the auth token is missing or too old to be used.
+
+    Returns:
+      bool True if a new auth token has to be generated before the next call.
+    """
+    return ((('authToken' not in self._headers and
+              'auth_token_epoch' not in self._config) or
+             int(time.time() - self._config['auth_token_epoch']) >=
+             AUTH_TOKEN_EXPIRE) and
+            not self._headers.get('oauth2credentials'))
+
+  def __RegenerateAuthToken(self):
+    """Logs in with the email and password headers to get a new auth token.
+
+    Raises:
+      ValidationError: if the email or password header is missing.
+    """
+    if ('email' not in self._headers or not self._headers['email'] or
+        'password' not in self._headers or not self._headers['password']):
+      raise ValidationError('Required authentication headers, \'email\' and '
+                            '\'password\', are missing. Unable to regenerate '
+                            'authentication token.')
+    self._headers['authToken'] = Utils.GetAuthToken(
+        self._headers['email'], self._headers['password'], AUTH_TOKEN_SERVICE,
+        LIB_SIG, self._config['proxy'])
+    self._config['auth_token_epoch'] = time.time()
 
   def _GetMethodInfo(self, method_name):
     """Pulls all of the relevant data about a method from a SOAPpy service.
@@ -133,37 +170,32 @@ class GenericDfpService(GenericApiService):
     Returns:
       dict A dictionary containing information about a SOAP method.
     """
+    schema_index = SoappyUtils.GetSchemaIndex(self._soappyservice)
     rval = {}
-    rval[MethodInfoKeys.INPUTS] = []
-    for i in range(len(self._soappyservice.wsdl.types[
-        self._namespace].elements[method_name].content.content.content)):
-      param_attributes = self._soappyservice.wsdl.types[
-          self._namespace].elements[method_name].content.content.content[
-              i].attributes
-      inparam = {
-          MethodInfoKeys.ELEMENT_NAME: param_attributes['name'],
-          MethodInfoKeys.NS: param_attributes['type'].getTargetNamespace(),
-          MethodInfoKeys.TYPE: param_attributes['type'].getName(),
-          MethodInfoKeys.MAX_OCCURS: param_attributes['maxOccurs']
-      }
-      rval[MethodInfoKeys.INPUTS].append(inparam)
-
-    rval[MethodInfoKeys.OUTPUTS] = []
-    for i in range(len(self._soappyservice.wsdl.types[
-        self._namespace].elements[
-            method_name + 'Response'].content.content.content)):
-      param_attributes = self._soappyservice.wsdl.types[
-          self._namespace].elements[
-              method_name + 'Response'].content.content.content[i].attributes
-      outparam = {
-          MethodInfoKeys.ELEMENT_NAME: param_attributes['name'],
-          MethodInfoKeys.NS: param_attributes['type'].getTargetNamespace(),
-          MethodInfoKeys.TYPE: param_attributes['type'].getName(),
-          MethodInfoKeys.MAX_OCCURS: param_attributes['maxOccurs']
-      }
-      rval[MethodInfoKeys.OUTPUTS].append(outparam)
+    for key, element_name in ((MethodInfoKeys.INPUTS, method_name),
+                              (MethodInfoKeys.OUTPUTS,
+                               method_name + 'Response')):
+      rval[key] = [{
+          MethodInfoKeys.ELEMENT_NAME: field['name'],
+          MethodInfoKeys.NS: field['type'].getTargetNamespace(),
+          MethodInfoKeys.TYPE: field['type'].getName(),
+          MethodInfoKeys.MAX_OCCURS: field['maxOccurs']
+      } for field in schema_index.GetElementFields(element_name,
+                                                   self._namespace)]
     return rval
 
+  def _TakeActionOnCallMetrics(self, metrics, buf):
+    """Adds the network code and the response header values to the metrics.
+
+    Args:
+      metrics: CallMetrics The measurements of the call.
+      buf: SoapBuffer SOAP buffer of the call.
+    """
+    header_values = buf.GetResponseHeaderValues()
+    metrics.request_id = header_values.get('requestId')
+    metrics.response_time = header_values.get('responseTime')
+    metrics.tags['networkCode'] = self._headers.get('networkCode')
+
   def _HandleLogsAndErrors(self, buf, start_time, stop_time, error=None):
     """Manage SOAP XML message.
 
@@ -221,11 +253,12 @@ class GenericDfpService(GenericApiService):
         {
             'tag': 'request_log',
             'name': 'request_info',
-            'data': str('host=%s service=%s method=%s responseTime=%s '
-                        'requestId=%s'
-                        % (Utils.GetNetLocFromUrl(self._service_url),
-                           self._service_name, buf.GetCallName(),
-                           buf.GetCallResponseTime(), buf.GetCallRequestId()))
+            'data': lambda: str('host=%s service=%s method=%s responseTime=%s '
+                                'requestId=%s'
+                                % (Utils.GetNetLocFromUrl(self._service_url),
+                                   self._service_name, buf.GetCallName(),
+                                   buf.GetCallResponseTime(),
+                                   buf.GetCallRequestId()))
         },
         {
             'tag': '',
@@ -34,8 +34,8 @@ LIB_SHORT_NAME = 'DfpApi-Python'
 LIB_URL = 'http://code.google.com/p/google-api-ads-python'
 LIB_AUTHOR = 'Stan Grinberg'
 LIB_AUTHOR_EMAIL = 'api.sgrinberg@gmail.com'
-LIB_VERSION = '9.6.0'
-LIB_MIN_COMMON_VERSION = '3.0.8'
+LIB_VERSION = '9.7.0'
+LIB_MIN_COMMON_VERSION = '3.1.0'
 LIB_SIG = GenerateLibSig(LIB_SHORT_NAME, LIB_VERSION)
 
 if VERSION < LIB_MIN_COMMON_VERSION:
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover AsyncApiService."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import sys
+import threading
+import unittest
+sys.path.insert(0, os.path.join('..', '..', '..'))
+
+from adspygoogle.common.AsyncApiService import AsyncApiService
+from adspygoogle.common.CallExecutor import CallExecutor
+
+
+class _Service(object):
+
+  """Stands in for a GenericApiService with a single GetUser operation."""
+
+  def __init__(self):
+    self.lock = None
+    self.started = threading.Event()
+    self.release = threading.Event()
+
+  def CopyWithLock(self, lock):
+    self.lock = lock
+    return self
+
+  def GetUser(self, user_id):
+    self.started.set()
+    self.release.wait()
+    if user_id == 'x':
+      raise ValueError(user_id)
+    return ({'id': user_id},)
+
+
+class AsyncApiServiceTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.common.AsyncApiService module."""
+
+  def testCallsReturnFutures(self):
+    """Tests that calls return before the response arrives."""
+    service = _Service()
+    async_service = AsyncApiService(service, max_workers=2)
+    self.assertTrue(isinstance(service.lock, threading._Semaphore))
+    futures = [async_service.GetUser('1'), async_service.GetUser('x')]
+    service.started.wait()
+    self.assertFalse(futures[0].IsDone())
+    service.release.set()
+    async_service.Close()
+    self.assertEqual(futures[0].GetResult(), ({'id': '1'},))
+    self.assertTrue(isinstance(futures[1].GetException(), ValueError))
+    self.assertRaises(AttributeError, getattr, async_service, 'DeleteUser')
+
+  def testSharedExecutor(self):
+    """Tests that Close leaves an executor it does not own running."""
+    service = _Service()
+    service.release.set()
+    executor = CallExecutor(1)
+    AsyncApiService(service, executor).Close()
+    self.assertEqual(executor.Submit(service.GetUser, '2').GetResult(),
+                     ({'id': '2'},))
+    executor.Shutdown()
+
+
+if __name__ == '__main__':
+  unittest.main()
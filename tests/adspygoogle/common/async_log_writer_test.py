@@ -0,0 +1,125 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover AsyncLogWriter."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+sys.path.insert(0, os.path.join('..', '..', '..'))
+
+from adspygoogle.common import AsyncLogWriter
+from adspygoogle.common.Errors import InvalidInputError
+from adspygoogle.common.Logger import Logger
+
+
+class _ListHandler(logging.FileHandler):
+
+  """File handler which also keeps the messages it emits."""
+
+  def __init__(self, filename):
+    logging.FileHandler.__init__(self, filename)
+    self.messages = []
+
+  def emit(self, record):
+    self.messages.append(record.getMessage())
+    logging.FileHandler.emit(self, record)
+
+
+class AsyncLogWriterTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.common.AsyncLogWriter module."""
+
+  def setUp(self):
+    self.log_path = tempfile.mkdtemp()
+    self.logger = Logger('test', self.log_path)
+
+  def tearDown(self):
+    shutil.rmtree(self.log_path, True)
+
+  def ReadLog(self, log_name):
+    """Returns the lines of a log file, without their prefix."""
+    fh = open(os.path.join(self.log_path, '%s.log' % log_name))
+    try:
+      return [line.split('] ', 1)[1] for line in fh.read().splitlines()]
+    finally:
+      fh.close()
+
+  def testMessagesWrittenInOrder(self):
+    """Tests that messages, built lazily, are written in the order logged."""
+    writer = AsyncLogWriter.AsyncLogWriter(self.logger)
+    for index in range(250):
+      writer.Log('async_order', lambda index=index: 'message %d' % index,
+                 Logger.DEBUG)
+    writer.Log('async_order', lambda: None, Logger.DEBUG)
+    writer.Log('async_order', 'last', Logger.DEBUG)
+    writer.Flush()
+    self.assertEqual(self.ReadLog('async_order'),
+                     ['message %d' % index for index in range(250)] + ['last'])
+
+  def testDropPolicy(self):
+    """Tests that messages are dropped once the queue is full."""
+    event = threading.Event()
+    writer = AsyncLogWriter.AsyncLogWriter(self.logger, max_queue_size=2,
+                                           policy=AsyncLogWriter.DROP)
+
+    def Wait():
+      event.wait()
+      return 'first'
+
+    writer.Log('async_drop', Wait, Logger.DEBUG)
+    # Wait for the writer thread to take the first message off the queue.
+    while not writer._queue.empty():
+      event.wait(0.01)
+    for index in range(5):
+      writer.Log('async_drop', 'message %d' % index, Logger.DEBUG)
+    event.set()
+    writer.Flush()
+    self.assertEqual(writer.GetDroppedCount(), 3)
+    self.assertEqual(self.ReadLog('async_drop'),
+                     ['first', 'message 0', 'message 1'])
+
+  def testOtherHandlersHandleMessages(self):
+    """Tests that handlers this module did not create get every message."""
+    handler = _ListHandler(os.path.join(self.log_path, 'async_other.log'))
+    handler.addFilter(logging.Filter('async_other'))
+    logger = logging.getLogger('async_other')
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+    try:
+      writer = AsyncLogWriter.AsyncLogWriter(self.logger)
+      for index in range(3):
+        writer.Log('async_other', 'message %d' % index, Logger.DEBUG)
+      writer.Flush()
+    finally:
+      logger.removeHandler(handler)
+      handler.close()
+    self.assertEqual(handler.messages, ['message 0', 'message 1', 'message 2'])
+
+  def testInvalidPolicy(self):
+    """Tests that an unknown queue policy is rejected."""
+    self.assertRaises(InvalidInputError, AsyncLogWriter.AsyncLogWriter,
+                      self.logger, policy='wait')
+
+
+if __name__ == '__main__':
+  unittest.main()
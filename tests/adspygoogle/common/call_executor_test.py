@@ -0,0 +1,95 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover CallExecutor."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import sys
+import threading
+import time
+import unittest
+sys.path.insert(0, os.path.join('..', '..', '..'))
+
+from adspygoogle.common.CallExecutor import CallExecutor
+from adspygoogle.common.Errors import Error
+
+
+class CallExecutorTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.common.CallExecutor module."""
+
+  def testResultsAndErrors(self):
+    """Tests that each future holds the outcome of its own call."""
+    executor = CallExecutor(3)
+    futures = [executor.Submit(int, value) for value in ('1', 'x', '3')]
+    executor.Shutdown()
+    self.assertEqual(futures[0].GetResult(), 1)
+    self.assertEqual(futures[0].GetException(), None)
+    self.assertTrue(isinstance(futures[1].GetException(), ValueError))
+    self.assertRaises(ValueError, futures[1].GetResult)
+    self.assertEqual(futures[2].GetResult(timeout=1), 3)
+    self.assertRaises(RuntimeError, executor.Submit, int, '1')
+
+  def testDoneCallback(self):
+    """Tests that callbacks run once the call completes, or right away."""
+    event = threading.Event()
+    executor = CallExecutor(1)
+    future = executor.Submit(event.wait)
+    results = []
+    future.AddDoneCallback(lambda done: results.append(done.IsDone()))
+    self.assertEqual(results, [])
+    event.set()
+    executor.Shutdown()
+    future.AddDoneCallback(lambda done: results.append(done.IsDone()))
+    self.assertEqual(results, [True, True])
+
+  def testMaxWorkers(self):
+    """Tests that no more than max_workers calls run at the same time."""
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def Call():
+      lock.acquire()
+      running[0] += 1
+      running[1] = max(running)
+      lock.release()
+      time.sleep(0.02)
+      lock.acquire()
+      running[0] -= 1
+      lock.release()
+
+    executor = CallExecutor(2)
+    futures = [executor.Submit(Call) for _ in range(6)]
+    executor.Shutdown()
+    self.assertTrue(all([future.IsDone() for future in futures]))
+    self.assertEqual(running[1], 2)
+
+  def testTimeout(self):
+    """Tests that waiting on a call which has not completed can time out."""
+    event = threading.Event()
+    executor = CallExecutor(1)
+    future = executor.Submit(event.wait)
+    self.assertRaises(Error, future.GetResult, 0.01)
+    self.assertFalse(future.IsDone())
+    event.set()
+    executor.Shutdown()
+    self.assertTrue(future.IsDone())
+
+
+if __name__ == '__main__':
+  unittest.main()
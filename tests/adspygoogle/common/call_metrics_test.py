@@ -0,0 +1,59 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover CallMetrics."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import sys
+import time
+import unittest
+sys.path.insert(0, os.path.join('..', '..', '..'))
+
+from adspygoogle.common import CallMetrics
+
+
+class CallMetricsTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.common.CallMetrics module."""
+
+  def testAddTime(self):
+    """Tests that the time of a stage adds up, and the next stage starts."""
+    metrics = CallMetrics.CallMetrics('UserService', 'getAllRoles')
+    start = time.time() - 2
+    now = metrics.AddTime('pack', start)
+    self.assertTrue(now >= start + 2)
+    metrics.AddTime('pack', now - 1)
+    self.assertTrue(3 <= metrics.timings['pack'] < 4)
+    self.assertEqual(sorted(metrics.timings), sorted(CallMetrics.STAGES))
+
+  def testAsDict(self):
+    """Tests that the dictionary holds copies of the timings and tags."""
+    metrics = CallMetrics.CallMetrics('UserService', 'getAllRoles')
+    metrics.tags['networkCode'] = '123'
+    dct = metrics.AsDict()
+    dct['timings']['build'] = 1.0
+    dct['tags']['networkCode'] = '456'
+    self.assertEqual(metrics.timings['build'], 0.0)
+    self.assertEqual(metrics.tags, {'networkCode': '123'})
+    self.assertEqual(dct['service_name'], 'UserService')
+    self.assertEqual(dct['method_name'], 'getAllRoles')
+    self.assertEqual(dct['retries'], 0)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,217 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover ConnectionPool and HttpTransport."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import BaseHTTPServer
+import httplib
+import os
+import SocketServer
+import StringIO
+import sys
+import threading
+import time
+import unittest
+sys.path.insert(0, os.path.join('..', '..', '..'))
+
+from adspygoogle.common.ConnectionPool import ConnectionPool
+from adspygoogle.common.soappy.HttpTransport import HttpTransport
+from adspygoogle.SOAPpy.Config import SOAPConfig
+
+
+RESPONSE_XML = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<soap:Envelope '
+                'xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">'
+                '<soap:Body><okResponse/></soap:Body></soap:Envelope>')
+
+
+class _KeepAliveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+  """Answers every POST with a small SOAP message, keeping connections open.
+
+  The next requests can instead be dropped, by closing the connection without
+  answering, or cut off, by closing it halfway through the status line.
+  """
+
+  protocol_version = 'HTTP/1.1'
+  connections = []
+  requests = 0
+  failures = []
+
+  def setup(self):
+    BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+    _KeepAliveHandler.connections.append(self.client_address)
+
+  def do_POST(self):
+    self.rfile.read(int(self.headers['Content-Length']))
+    _KeepAliveHandler.requests += 1
+    if _KeepAliveHandler.failures:
+      failure = _KeepAliveHandler.failures.pop(0)
+      if failure == 'cut':
+        self.wfile.write('HTTP/1.1 2')
+      self.close_connection = 1
+      return
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/xml; charset=utf-8')
+    self.send_header('Content-Length', str(len(RESPONSE_XML)))
+    self.end_headers()
+    self.wfile.write(RESPONSE_XML)
+
+  def log_message(self, *args):
+    pass
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+  daemon_threads = True
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.common.ConnectionPool module."""
+
+  def setUp(self):
+    """Starts a local keep-alive HTTP server."""
+    _KeepAliveHandler.connections = []
+    _KeepAliveHandler.requests = 0
+    _KeepAliveHandler.failures = []
+    self.server = _Server(('127.0.0.1', 0), _KeepAliveHandler)
+    self.address = '127.0.0.1:%d' % self.server.server_address[1]
+    thread = threading.Thread(target=self.server.serve_forever)
+    thread.setDaemon(True)
+    thread.start()
+    self.config = SOAPConfig(dumpHeadersIn=0, dumpHeadersOut=0, dumpSOAPIn=0,
+                             dumpSOAPOut=0)
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+  def testConnectionIsReused(self):
+    """Tests that consecutive calls share a single connection."""
+    transport = HttpTransport(connection_pool=ConnectionPool())
+    for _ in range(3):
+      data, _ = transport.call('http://%s/Service' % self.address, '<a/>',
+                               None, config=self.config)
+      self.assertEqual(data, RESPONSE_XML)
+    self.assertEqual(len(_KeepAliveHandler.connections), 1)
+
+  def testNoPoolUsesNewConnections(self):
+    """Tests that each call opens its own connection without a pool."""
+    transport = HttpTransport()
+    for _ in range(2):
+      transport.call('http://%s/Service' % self.address, '<a/>', None,
+                     config=self.config)
+    self.assertEqual(len(_KeepAliveHandler.connections), 2)
+
+  def testStaleConnectionIsReplaced(self):
+    """Tests that a connection closed by the server is not reused."""
+    pool = ConnectionPool()
+    transport = HttpTransport(connection_pool=pool)
+    transport.call('http://%s/Service' % self.address, '<a/>', None,
+                   config=self.config)
+    for connection, _ in pool._idle[('http', self.address)]:
+      connection.sock.shutdown(1)
+    time.sleep(0.1)
+    data, _ = transport.call('http://%s/Service' % self.address, '<a/>', None,
+                             config=self.config)
+    self.assertEqual(data, RESPONSE_XML)
+    self.assertEqual(len(_KeepAliveHandler.connections), 2)
+    self.assertEqual(pool.GetStats()[('http', self.address)], (1, 1))
+
+  def testDroppedRequestIsRetried(self):
+    """Tests that a request dropped by a pooled connection is sent again."""
+    transport = HttpTransport(connection_pool=ConnectionPool())
+    transport.call('http://%s/Service' % self.address, '<a/>', None,
+                   config=self.config)
+    _KeepAliveHandler.failures = ['drop']
+    data, _ = transport.call('http://%s/Service' % self.address, '<a/>', None,
+                             config=self.config)
+    self.assertEqual(data, RESPONSE_XML)
+    self.assertEqual(_KeepAliveHandler.requests, 3)
+
+  def testCutResponseIsNotRetried(self):
+    """Tests that a request is not sent again once a response has started."""
+    transport = HttpTransport(connection_pool=ConnectionPool())
+    transport.call('http://%s/Service' % self.address, '<a/>', None,
+                   config=self.config)
+    _KeepAliveHandler.failures = ['cut']
+    self.assertRaises(httplib.BadStatusLine, transport.call,
+                      'http://%s/Service' % self.address, '<a/>', None,
+                      config=self.config)
+    self.assertEqual(_KeepAliveHandler.requests, 2)
+
+  def testDroppedRequestOnNewConnectionIsNotRetried(self):
+    """Tests that only requests sent over pooled connections are retried."""
+    transport = HttpTransport(connection_pool=ConnectionPool())
+    _KeepAliveHandler.failures = ['drop']
+    self.assertRaises(httplib.BadStatusLine, transport.call,
+                      'http://%s/Service' % self.address, '<a/>', None,
+                      config=self.config)
+    self.assertEqual(_KeepAliveHandler.requests, 1)
+
+  def testDumpsAreWrittenToOutput(self):
+    """Tests that debug dumps go to the given output rather than sys.stdout."""
+    output = StringIO.StringIO()
+    config = SOAPConfig(dumpHeadersIn=1, dumpHeadersOut=1, dumpSOAPIn=1,
+                        dumpSOAPOut=1)
+    transport = HttpTransport(output=output)
+    transport.call('http://%s/Service' % self.address, '<a/>', None,
+                   config=config)
+    dump = output.getvalue()
+    for title in ('Outgoing HTTP headers', 'Outgoing SOAP',
+                  'Incoming HTTP headers', 'Incoming SOAP'):
+      self.assertTrue(('*** %s ' % title) in dump)
+    self.assertTrue(RESPONSE_XML in dump)
+
+  def testIdleTimeout(self):
+    """Tests that connections idle for too long are discarded."""
+    pool = ConnectionPool(idle_timeout=0)
+    connection, reused = pool.Acquire('http', self.address)
+    self.assertFalse(reused)
+    connection.connect()
+    pool.Release('http', self.address, connection)
+    connection, reused = pool.Acquire('http', self.address)
+    self.assertFalse(reused)
+
+  def testMaxIdlePerHost(self):
+    """Tests that only max_idle_per_host connections are kept open."""
+    pool = ConnectionPool(max_idle_per_host=1)
+    connections = [pool.Acquire('http', self.address)[0] for _ in range(3)]
+    for connection in connections:
+      connection.connect()
+      pool.Release('http', self.address, connection)
+    self.assertEqual(pool.GetStats()[('http', self.address)], (1, 1))
+
+  def testMaxPerHost(self):
+    """Tests that Acquire blocks while max_per_host connections are open."""
+    pool = ConnectionPool(max_per_host=1)
+    connection, _ = pool.Acquire('http', self.address)
+    acquired = []
+    waiter = threading.Thread(
+        target=lambda: acquired.append(pool.Acquire('http', self.address)))
+    waiter.start()
+    time.sleep(0.1)
+    self.assertEqual(acquired, [])
+    pool.Release('http', self.address, connection, reusable=False)
+    waiter.join(1)
+    self.assertEqual(len(acquired), 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,247 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover GenericApiService."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import BaseHTTPServer
+import os
+import SocketServer
+import sys
+import threading
+import unittest
+sys.path.insert(0, os.path.join('..', '..', '..'))
+
+from adspygoogle import SOAPpy
+from adspygoogle.common import GenericApiService
+from adspygoogle.common import WsdlCache
+from adspygoogle.common.GenericApiService import MethodInfoKeys
+from adspygoogle.common.soappy import SoappyUtils
+
+
+WSDL_PATH = os.path.join('data', 'UserService.wsdl')
+NS = 'https://www.google.com/apis/ads/publisher/v201211'
+SOAPPY_HEADERS = SOAPpy.Types.headerType()
+
+
+class _WsdlHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+  """Serves the test WSDL."""
+
+  def do_GET(self):
+    fh = open(WSDL_PATH)
+    try:
+      document = fh.read()
+    finally:
+      fh.close()
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/xml')
+    self.end_headers()
+    self.wfile.write(document)
+
+  def log_message(self, *args):
+    pass
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+  daemon_threads = True
+
+
+class _UserService(GenericApiService.GenericApiService):
+
+  """Pulls method info from the test WSDL, counting how often it does so."""
+
+  pulls = []
+
+  def _GetMethodInfo(self, method_name):
+    _UserService.pulls.append((self._namespace, method_name))
+    schema_index = SoappyUtils.GetSchemaIndex(self._soappyservice)
+    rval = {}
+    for key, element_name in ((MethodInfoKeys.INPUTS, method_name),
+                              (MethodInfoKeys.OUTPUTS,
+                               method_name + 'Response')):
+      rval[key] = [{
+          MethodInfoKeys.ELEMENT_NAME: field['name'],
+          MethodInfoKeys.NS: field['type'].getTargetNamespace(),
+          MethodInfoKeys.TYPE: field['type'].getName(),
+          MethodInfoKeys.MAX_OCCURS: field['maxOccurs']
+      } for field in schema_index.GetElementFields(element_name, NS)]
+    return rval
+
+  def _GetSoapHeaders(self):
+    return SOAPPY_HEADERS
+
+
+class _OldUserService(GenericApiService.GenericApiService):
+
+  """Sets its SOAP headers the way subclasses did before _GetSoapHeaders."""
+
+  def _SetHeaders(self):
+    self._soappyservice.soapproxy.header = SOAPPY_HEADERS
+
+
+class _Buffer(object):
+
+  """Stands in for the SoapBuffer of a call."""
+
+  def __init__(self, call_name):
+    self._call_name = call_name
+
+  def GetCallName(self):
+    return self._call_name
+
+
+class GenericApiServiceTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.common.GenericApiService module."""
+
+  def setUp(self):
+    """Starts a local server for the WSDL and empties the cache."""
+    self.server = _Server(('127.0.0.1', 0), _WsdlHandler)
+    thread = threading.Thread(target=self.server.serve_forever)
+    thread.setDaemon(True)
+    thread.start()
+    self.url = ('http://127.0.0.1:%d/apis/ads/publisher/v201211/UserService'
+                % self.server.server_address[1])
+    _UserService.pulls = []
+    GenericApiService._method_info_cache.clear()
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+    GenericApiService._method_info_cache.clear()
+
+  def __GetService(self, namespace=NS, service_class=_UserService,
+                   wsdl_cache='n'):
+    """Returns a service for the test WSDL.
+
+    Args:
+      [optional]
+      namespace: str The namespace of the service's API version.
+      service_class: class The GenericApiService subclass to instantiate.
+      wsdl_cache: str Whether the service shares a cached SOAPpy proxy.
+
+    Returns:
+      GenericApiService A new service.
+    """
+    return service_class(
+        {}, {'keep_alive': 'n', 'wsdl_cache': wsdl_cache}, {'http_proxy': None},
+        threading.RLock(), None, 'UserService', self.url, False, None,
+        namespace, None)
+
+  def testPulledOnce(self):
+    """Tests that services of the same version share the method info."""
+    method_info = self.__GetService().GetMethodInfo('GetUsersByStatement')
+    self.assertTrue(
+        self.__GetService().GetMethodInfo('getUsersByStatement') is method_info)
+    self.assertEqual(_UserService.pulls, [(NS, 'getUsersByStatement')])
+    self.assertEqual(
+        [param[MethodInfoKeys.ELEMENT_NAME]
+         for param in method_info[MethodInfoKeys.INPUTS]], ['filterStatement'])
+    self.assertEqual(method_info[MethodInfoKeys.OUTPUT_TYPES],
+                     [(NS, 'UserPage', '1')])
+
+  def testMethodProxyUsesCache(self):
+    """Tests that creating a method proxy pulls its method info once."""
+    service = self.__GetService()
+    service.GetUser
+    service.CreateUsers
+    self.__GetService().GetUser
+    self.assertEqual(_UserService.pulls, [(NS, 'getUser'), (NS, 'createUsers')])
+
+  def testKeyedByVersion(self):
+    """Tests that services of other versions pull their own method info."""
+    method_info = self.__GetService().GetMethodInfo('GetUser')
+    other_ns = NS.replace('v201211', 'v201208')
+    self.assertFalse(
+        self.__GetService(other_ns).GetMethodInfo('GetUser') is method_info)
+    self.assertEqual(_UserService.pulls,
+                     [(NS, 'getUser'), (other_ns, 'getUser')])
+
+  def testUnknownMethod(self):
+    """Tests that unknown methods raise AttributeError and are not cached."""
+    service = self.__GetService()
+    self.assertRaises(AttributeError, service.GetMethodInfo, 'DeleteUsers')
+    self.assertRaises(AttributeError, getattr, service, 'DeleteUsers')
+    self.assertEqual(_UserService.pulls, [])
+    self.assertEqual(GenericApiService._method_info_cache, {})
+
+  def testThreads(self):
+    """Tests that threads looking a method up at once get the same info."""
+    services = [self.__GetService() for _ in xrange(8)]
+    start = threading.Event()
+    method_infos = []
+
+    def Lookup(service):
+      start.wait()
+      method_infos.append(service.GetMethodInfo('GetUsersByStatement'))
+
+    threads = [threading.Thread(target=Lookup, args=(service,))
+               for service in services]
+    for thread in threads:
+      thread.start()
+    start.set()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(len(method_infos), 8)
+    for method_info in method_infos:
+      self.assertTrue(method_info is method_infos[0])
+
+  def testSetHeaders(self):
+    """Tests that _SetHeaders and _GetSoapHeaders each stand in for the other.
+    """
+    service = self.__GetService(service_class=_OldUserService)
+    self.assertTrue(service._GetSoapHeaders() is SOAPPY_HEADERS)
+    service = self.__GetService()
+    service._SetHeaders()
+    self.assertTrue(service._soappyservice.soapproxy.header is SOAPPY_HEADERS)
+
+  def testSetHeadersProxyNotShared(self):
+    """Tests that services setting headers on their proxy do not share it."""
+    try:
+      shared = self.__GetService(wsdl_cache='y')._soappyservice
+      self.assertTrue(
+          self.__GetService(wsdl_cache='y')._soappyservice is shared)
+      old_services = [self.__GetService(service_class=_OldUserService,
+                                        wsdl_cache='y') for _ in xrange(2)]
+      self.assertFalse(old_services[0]._soappyservice is shared)
+      self.assertFalse(old_services[0]._soappyservice is
+                       old_services[1]._soappyservice)
+      old_services[0]._GetSoapHeaders()
+      self.assertFalse(shared.soapproxy.header is SOAPPY_HEADERS)
+    finally:
+      WsdlCache.Clear()
+
+  def testLogOverrides(self):
+    """Tests that log overrides match both spellings of a method name."""
+    service = self.__GetService()
+    buf = _Buffer('getUsersByStatement')
+    service._config['xml_log'] = 'n'
+    self.assertEqual(service._GetLogConfigValue('xml_log', buf), 'n')
+    for method_name in ('getUsersByStatement', 'GetUsersByStatement'):
+      service._config['log_overrides'] = {
+          'UserService': {'xml_log': 'y', 'xml_log_max_size': 10},
+          'UserService.%s' % method_name: {'xml_log_max_size': 20}}
+      self.assertEqual(service._GetLogConfigValue('xml_log', buf), 'y')
+      self.assertEqual(service._GetLogConfigValue('xml_log_max_size', buf), 20)
+      self.assertEqual(service._GetLogConfigValue(
+          'xml_log_max_size', _Buffer('getUser')), 10)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,223 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover ResponseDecoder."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import gzip
+import os
+import StringIO
+import sys
+import unittest
+sys.path.insert(0, os.path.join('..', '..', '..'))
+
+from adspygoogle import SOAPpy
+from adspygoogle.common import MessageHandler
+from adspygoogle.common.Errors import Error
+from adspygoogle.common.soappy import HttpTransport
+from adspygoogle.common.soappy import ResponseDecoder
+from adspygoogle.common.soappy import SoappyUtils
+from adspygoogle.SOAPpy.Parser import parseSOAPRPC
+
+
+WSDL_PATH = os.path.join('data', 'UserService.wsdl')
+NS = 'https://www.google.com/apis/ads/publisher/v201211'
+USER = (NS, 'User', '1')
+USER_PAGE = (NS, 'UserPage', '1')
+ROLES = (NS, 'Role', 'unbounded')
+USER_XML = ('<id>5</id><email>a@example.com</email><name>Jos\xc3\xa9</name>'
+            '<UserRecord.Type>User</UserRecord.Type><isActive>true</isActive>')
+
+
+def _Envelope(body):
+  """Wraps a SOAP body in an envelope like the ones DFP sends."""
+  return ('<?xml version="1.0" encoding="UTF-8"?>'
+          '<soap:Envelope '
+          'xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" '
+          'xmlns:xsd="http://www.w3.org/2001/XMLSchema" '
+          'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+          '<soap:Header><ResponseHeader xmlns="%s"><requestId>1</requestId>'
+          '</ResponseHeader></soap:Header><soap:Body>%s</soap:Body>'
+          '</soap:Envelope>' % (NS, body))
+
+
+def _Types(value):
+  """Lists the types of every key and value in a decoded response."""
+  if isinstance(value, dict):
+    return sorted([(key, type(key), _Types(item))
+                   for key, item in value.items()])
+  elif isinstance(value, list):
+    return [_Types(item) for item in value]
+  return type(value)
+
+
+def _Gzip(data):
+  """Compresses data the way a server using gzip content encoding does."""
+  compressed = StringIO.StringIO()
+  gzip_file = gzip.GzipFile(fileobj=compressed, mode='wb')
+  gzip_file.write(data)
+  gzip_file.close()
+  return compressed.getvalue()
+
+
+class _Response(object):
+
+  """Stands in for an httplib.HTTPResponse whose body has not been read."""
+
+  def __init__(self, data, content_encoding=None):
+    self.body = StringIO.StringIO(data)
+    self.content_encoding = content_encoding
+
+  def read(self, amt=None):
+    return self.body.read(amt)
+
+  def getheader(self, name, default=None):
+    if name == 'content-encoding' and self.content_encoding:
+      return self.content_encoding
+    return default
+
+
+class ResponseDecoderTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.common.soappy.ResponseDecoder module."""
+
+  def setUp(self):
+    """Parses the test WSDL."""
+    self.service = SOAPpy.WSDL.Proxy(WSDL_PATH, noroot=1)
+    self.index = SoappyUtils.GetSchemaIndex(self.service)
+
+  def _ParseWithSoappy(self, soap_message, output_types):
+    """Parses a response the way GenericApiService does with SOAPpy."""
+    result = parseSOAPRPC(soap_message)
+    public_keys = [key for key in result.__dict__ if key[0] != '_']
+    if len(public_keys) == 1:
+      result = getattr(result, public_keys[0])
+    return MessageHandler.RestoreListTypeWithSoappy(
+        MessageHandler.UnpackResponseAsDict(result), self.service, output_types)
+
+  def assertDecodesLikeSoappy(self, body, output_types):
+    soap_message = _Envelope(body % NS)
+    expected = self._ParseWithSoappy(soap_message, output_types)
+    decoded = ResponseDecoder.Decode(soap_message, self.index, output_types)
+    self.assertEqual(decoded, expected)
+    self.assertEqual(_Types(decoded), _Types(expected))
+    return decoded
+
+  def testSingleObject(self):
+    """Tests a response holding one object, with a repeated field."""
+    decoded = self.assertDecodesLikeSoappy(
+        '<getUserResponse xmlns="%%s"><rval xsi:type="User">%s'
+        '<customFieldValues>a</customFieldValues></rval></getUserResponse>'
+        % USER_XML, [USER])
+    self.assertEqual(decoded['customFieldValues'], ['a'])
+    self.assertEqual(decoded['UserRecord_Type'], 'User')
+
+  def testPage(self):
+    """Tests pages holding none, one and several results."""
+    for count in (0, 1, 3):
+      self.assertDecodesLikeSoappy(
+          '<getUsersByStatementResponse xmlns="%%s"><rval>'
+          '<totalResultSetSize>%d</totalResultSetSize>%s</rval>'
+          '</getUsersByStatementResponse>'
+          % (count, '<results>%s</results>' % USER_XML * count), [USER_PAGE])
+
+  def testListResponse(self):
+    """Tests operations returning lists, including empty and nil values."""
+    self.assertDecodesLikeSoappy('<getAllRolesResponse xmlns="%s"/>', [ROLES])
+    self.assertDecodesLikeSoappy(
+        '<getAllRolesResponse xmlns="%s"><rval><id>1</id></rval>'
+        '</getAllRolesResponse>', [ROLES])
+    self.assertDecodesLikeSoappy(
+        '<getAllRolesResponse xmlns="%s"><rval><id>1</id></rval>'
+        '<rval><id>2</id><description xsi:nil="true"/></rval>'
+        '</getAllRolesResponse>', [ROLES])
+
+  def testTypedValues(self):
+    """Tests values carrying an XML schema type."""
+    self.assertDecodesLikeSoappy(
+        '<getUserResponse xmlns="%s"><rval><id xsi:type="xsd:long">0005</id>'
+        '<isActive xsi:type="xsd:boolean">true</isActive></rval>'
+        '</getUserResponse>', [USER])
+
+  def testNoOutput(self):
+    """Tests operations which return nothing."""
+    self.assertEqual(ResponseDecoder.Decode(
+        _Envelope('<deleteResponse xmlns="%s"/>' % NS), self.index, []), None)
+
+  def testHeaderValues(self):
+    """Tests that the fields of the SOAP header are kept by the decoder."""
+    decoder = ResponseDecoder.ResponseDecoder(self.index, [ROLES])
+    decoder.Feed(_Envelope('<getAllRolesResponse xmlns="%s"/>' % NS))
+    self.assertEqual(decoder.Close(), [])
+    self.assertEqual(decoder.GetHeaderValues(), {'requestId': '1'})
+
+  def testFaultIsUnsupported(self):
+    """Tests that faults are left to SOAPpy."""
+    self.assertRaises(
+        ResponseDecoder.UnsupportedResponseError, ResponseDecoder.Decode,
+        _Envelope('<soap:Fault><faultcode>soap:Server</faultcode>'
+                  '<faultstring>Error</faultstring></soap:Fault>'),
+        self.index, [USER])
+
+  def testChunkedInput(self):
+    """Tests that a response can be fed to the decoder in small chunks."""
+    soap_message = _Envelope(
+        '<getUserResponse xmlns="%s"><rval>%s</rval></getUserResponse>'
+        % (NS, USER_XML))
+    decoder = ResponseDecoder.ResponseDecoder(self.index, [USER])
+    for i in range(0, len(soap_message), 7):
+      decoder.Feed(soap_message[i:i + 7])
+    self.assertEqual(decoder.Close(),
+                     ResponseDecoder.Decode(soap_message, self.index, [USER]))
+
+  def testStreamedResponse(self):
+    """Tests that a gzipped response is decoded while it is being read."""
+    soap_message = _Envelope(
+        '<getUsersByStatementResponse xmlns="%s"><rval>%s</rval>'
+        '</getUsersByStatementResponse>'
+        % (NS, '<results>%s</results>' % USER_XML * 5000))
+    decoder = ResponseDecoder.ResponseDecoder(self.index, [USER_PAGE])
+    head, streamed = HttpTransport._StreamResponse(
+        _Response(_Gzip(soap_message), 'gzip'), decoder)
+    self.assertTrue(streamed)
+    self.assertEqual(head, soap_message[:soap_message.find('<soap:Body')] +
+                     '<soap:Body/></soap:Envelope>')
+    self.assertEqual(len(decoder.Close()['results']), 5000)
+
+  def testStreamedFaultIsReturned(self):
+    """Tests that responses left to SOAPpy are read and returned whole."""
+    soap_message = _Envelope('<soap:Fault><faultcode>soap:Server</faultcode>'
+                             '<faultstring>Error</faultstring></soap:Fault>')
+    decoder = ResponseDecoder.ResponseDecoder(self.index, [USER])
+    self.assertEqual(
+        HttpTransport._StreamResponse(_Response(soap_message), decoder),
+        (soap_message, False))
+
+  def testStreamedResponseFailsLate(self):
+    """Tests that a response the decoder gives up on midway raises Error."""
+    soap_message = _Envelope(
+        '<getUsersByStatementResponse xmlns="%s"><rval>%s<results href="#1"/>'
+        '</rval></getUsersByStatementResponse>'
+        % (NS, '<results>%s</results>' % USER_XML * 5000))
+    decoder = ResponseDecoder.ResponseDecoder(self.index, [USER_PAGE])
+    self.assertRaises(Error, HttpTransport._StreamResponse,
+                      _Response(soap_message), decoder)
+
+
+if __name__ == '__main__':
+  unittest.main()
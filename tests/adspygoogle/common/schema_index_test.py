@@ -0,0 +1,104 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover SchemaIndex."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import pickle
+import sys
+import unittest
+sys.path.insert(0, os.path.join('..', '..', '..'))
+
+from adspygoogle import SOAPpy
+from adspygoogle.common import MessageHandler
+from adspygoogle.common import SanityCheck
+from adspygoogle.common.Errors import ValidationError
+from adspygoogle.common.soappy import SchemaIndex
+from adspygoogle.common.soappy import SoappyUtils
+
+
+WSDL_PATH = os.path.join('data', 'UserService.wsdl')
+NS = 'https://www.google.com/apis/ads/publisher/v201211'
+
+
+class SchemaIndexTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.common.soappy.SchemaIndex module."""
+
+  def setUp(self):
+    """Parses the test WSDL."""
+    self.service = SOAPpy.WSDL.Proxy(WSDL_PATH, noroot=1)
+    self.index = SchemaIndex.Compile(self.service)
+
+  def testInheritedFields(self):
+    """Tests that fields of supertypes come first, with their namespace."""
+    self.assertEqual(
+        [field['name'] for field in self.index.GetType('User', NS).fields],
+        ['id', 'email', 'name', 'roleId', 'roleName', 'UserRecord.Type',
+         'isActive', 'customFieldValues'])
+    field = self.index.GetField('User', NS, 'customFieldValues')
+    self.assertEqual(field['maxOccurs'], 'unbounded')
+    self.assertEqual(field['type'].getName(), 'string')
+    self.assertEqual(self.index.GetField('User', NS, 'email')['ns'], NS)
+    self.assertRaises(TypeError, self.index.GetField, 'User', NS, 'missing')
+
+  def testTypeHierarchy(self):
+    """Tests supertype and array lookups."""
+    self.assertTrue(self.index.IsASuperType('User', NS, 'UserRecord'))
+    self.assertTrue(self.index.IsASuperType('User', NS, 'User'))
+    self.assertFalse(self.index.IsASuperType('UserRecord', NS, 'User'))
+    self.assertFalse(self.index.IsASuperType('Missing', NS, 'User'))
+    self.assertFalse(self.index.IsAnArrayType('User', NS))
+    self.assertTrue(self.index.IsAnArrayType('Array', NS))
+    self.assertEqual(self.index.GetArrayItemTypeName('User', NS), 'User')
+
+  def testElementFields(self):
+    """Tests that the fields of operation elements are indexed."""
+    fields = self.index.GetElementFields('getUsersByStatement', NS)
+    self.assertEqual([(field['name'], field['type'].getName())
+                      for field in fields], [('filterStatement', 'Statement')])
+
+  def testPickle(self):
+    """Tests that an unpickled index answers like the original one."""
+    index = pickle.loads(pickle.dumps(self.index, pickle.HIGHEST_PROTOCOL))
+    self.assertEqual(index.GetType('User', NS).fields,
+                     self.index.GetType('User', NS).fields)
+    self.assertEqual(
+        index.GetField('User', NS, 'customFieldValues')['type'].getName(),
+        'string')
+    self.assertTrue(index.IsASuperType('User', NS, 'UserRecord'))
+
+  def testPackAndValidate(self):
+    """Tests the message handler and sanity checks built on the index."""
+    user = {'email': 'a@example.com', 'isActive': 'true',
+            'customFieldValues': ['a', 'b'], 'xsi_type': 'User'}
+    SanityCheck.SoappySanityCheck(self.service, user, NS, 'UserRecord')
+    packed = MessageHandler.PackForSoappy(user, NS, 'UserRecord', self.service,
+                                          False, lambda ns: '')
+    self.assertEqual(packed._typename, 'User')
+    self.assertEqual(packed._keyord, ['email', 'isActive', 'customFieldValues'])
+    self.assertRaises(ValidationError, SanityCheck.SoappySanityCheck,
+                      self.service, {'bogus': '1'}, NS, 'User')
+    self.assertRaises(ValidationError, SanityCheck.SoappySanityCheck,
+                      self.service, {'customFieldValues': 'a'}, NS, 'User')
+    self.assertTrue(SoappyUtils.GetSchemaIndex(self.service) is
+                    SoappyUtils.GetSchemaIndex(self.service))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -23,6 +23,7 @@ import sys
 import unittest
 sys.path.insert(0, os.path.join('..', '..', '..'))
 
+from adspygoogle.common.Errors import MalformedBufferError
 from adspygoogle.common.SoapBuffer import SoapBuffer
 
 
@@ -122,6 +123,144 @@ class SoapBufferTest(unittest.TestCase):
     self.assertEqual(INCOMING_HTTP_HEADERS_BLOCK.strip(), buf.GetHeadersIn())
     self.assertEqual(INCOMING_SOAP_BLOCK.strip(), buf.GetSoapIn())
 
+  def testCapturedTraffic(self):
+    """Tests that captured traffic is dumped without writing any text."""
+    buf = SoapBuffer(pretty_xml=False)
+    buf.CaptureRequest('/v1.19/api/dfa-api/login',
+                       [('Host', 'advertisersapitest.doubleclick.net'),
+                        ('SOAPAction', '"authenticate"')],
+                       OUTGOING_SOAP_BLOCK.split('\n', 1)[1][:-73])
+    buf.CaptureResponse(200, 'OK',
+                        [('Content-Type', 'text/xml; charset=utf-8')],
+                        INCOMING_SOAP_BLOCK.split('\n', 1)[1][:-73])
+
+    self.assertEqual('', super(SoapBuffer, buf).GetBufferAsStr())
+    self.assertEqual(
+        '*** Outgoing HTTP headers **********************************************\n'
+        'POST /v1.19/api/dfa-api/login HTTP/1.1\n'
+        'Host:advertisersapitest.doubleclick.net\n'
+        'SOAPAction:"authenticate"\n'
+        '************************************************************************',
+        buf.GetHeadersOut())
+    self.assertEqual(
+        '*** Incoming HTTP headers **********************************************\n'
+        'HTTP/1.? 200 OK\n'
+        'Content-Type: text/xml; charset=utf-8\n'
+        '************************************************************************',
+        buf.GetHeadersIn())
+    self.assertEqual(INCOMING_SOAP_BLOCK.strip(), buf.GetSoapIn())
+    self.assertTrue(buf.IsHandshakeComplete())
+    self.assertTrue(buf.IsSoap())
+    self.assertEqual('50d50367-4d13-47a0-92ab-7748da032064',
+                     buf._GetXmlValueByName(buf._GetXmlIn(),
+                                            'Header/ResponseHeader/requestId'))
+    self.assertTrue(INCOMING_SOAP_BLOCK in buf.GetBufferAsStr())
+
+  def testCallInfoWithoutParsing(self):
+    """Tests that call information handed to the buffer is used as is."""
+    buf = SoapBuffer()
+    buf.CaptureRequest('/api', [], 'not XML')
+    buf.SetCallName('authenticate')
+    buf.SetResponseHeaderValues({'requestId': '1'})
+    self.assertEqual('authenticate', buf.GetCallName())
+    self.assertEqual('1', buf._GetResponseHeaderValue('requestId'))
+    self.assertEqual(None, buf._GetResponseHeaderValue('responseTime'))
+
+  def testXmlParsedOnce(self):
+    """Tests that each message is parsed once, until it is captured again."""
+    buf = SoapBuffer(xml_parser='2')
+    buf.CaptureResponse(200, 'OK', [],
+                        INCOMING_SOAP_BLOCK.split('\n', 1)[1][:-73])
+    xml_in = buf._GetXmlIn()
+    self.assertTrue(buf.IsSoap())
+    self.assertTrue(xml_in is buf._GetXmlIn())
+
+    buf.CaptureResponse(200, 'OK', [], 'not XML')
+    self.assertRaises(MalformedBufferError, buf._GetXmlIn)
+    error = None
+    try:
+      buf._GetXmlIn()
+    except MalformedBufferError, e:
+      error = e
+    try:
+      buf._GetXmlIn()
+    except MalformedBufferError, e:
+      self.assertTrue(e is error)
+
+  def testMaxSoapSize(self):
+    """Tests that large SOAP bodies are cut down, and their header kept."""
+    buf = SoapBuffer(xml_parser='2', pretty_xml=True)
+    soap_message = INCOMING_SOAP_BLOCK.split('\n', 1)[1][:-74]
+    buf.CaptureResponse(200, 'OK', [], soap_message)
+    buf.SetMaxSoapSize(len(soap_message))
+    self.assertTrue('elided' not in buf.GetSoapIn())
+
+    buf.SetMaxSoapSize(10)
+    soap_in = buf.GetSoapIn()
+    body = soap_message.index('<soapenv:Body>') + len('<soapenv:Body>')
+    elided = soap_message.index('</soapenv:Body>') - body - 10
+    self.assertEqual(
+        '%s\n%s<!-- %d bytes elided -->%s\n%s' % (
+            INCOMING_SOAP_BLOCK.split('\n', 1)[0], soap_message[:body + 10],
+            elided, soap_message[soap_message.index('</soapenv:Body>'):],
+            '*' * 72),
+        soap_in)
+    self.assertTrue('<ns1:requestId>' in soap_in)
+
+  def testCapturedHtmlResponse(self):
+    """Tests that an HTML error page is not mistaken for a SOAP response."""
+    buf = SoapBuffer()
+    buf.CaptureRequest('/api', [], '<a/>')
+    buf.CaptureResponse(502, 'Bad Gateway', [('Content-Type', 'text/html')],
+                        '<html><body><h1>Error 502</h1></body></html>')
+    self.assertFalse(buf.IsHandshakeComplete())
+    self.assertTrue('Error 502' in buf.GetBufferAsStr())
+
+  def testDumpsFormattedOnce(self):
+    """Tests that dumps are formatted once, even if some are missing."""
+    buf = SoapBuffer(xml_parser='2', pretty_xml=True)
+    formats = []
+    format_soap = buf._SoapBuffer__FormatSoap
+
+    def FormatSoap(title, soap_message):
+      formats.append(title)
+      return format_soap(title, soap_message)
+
+    buf._SoapBuffer__FormatSoap = FormatSoap
+    buf.CaptureRequest('/api', [], OUTGOING_SOAP_BLOCK.split('\n', 1)[1][:-73])
+    soap_out = buf.GetSoapOut()
+    for _ in xrange(3):
+      self.assertEqual('', buf.GetSoapIn())
+      self.assertEqual('', buf.GetHeadersIn())
+    self.assertTrue(buf.GetSoapOut() is soap_out)
+    self.assertTrue(soap_out in buf.GetBufferAsStr())
+    self.assertEqual(['Outgoing SOAP'], formats)
+
+    buf.CaptureResponse(200, 'OK', [],
+                        INCOMING_SOAP_BLOCK.split('\n', 1)[1][:-73])
+    self.assertTrue('<ns1:requestId>' in buf.GetSoapIn())
+    self.assertEqual(['Outgoing SOAP', 'Outgoing SOAP', 'Incoming SOAP'],
+                     formats)
+
+  def testIsSoapWithoutDumps(self):
+    """Tests that IsSoap reads the captured data rather than the dumps."""
+    buf = SoapBuffer(xml_parser='2')
+    self.assertFalse(buf.IsSoap())
+    buf.CaptureResponse(200, 'OK', [],
+                        INCOMING_SOAP_BLOCK.split('\n', 1)[1][:-73])
+    buf.GetBufferAsStr = None
+    self.assertTrue(buf.IsSoap())
+    buf.CaptureResponse(200, 'OK', [], 'not XML')
+    self.assertFalse(buf.IsSoap())
+
+  def testInjectXml(self):
+    """Tests that injected XML is dumped along with the written text."""
+    buf = SoapBuffer(xml_parser='2', pretty_xml=False)
+    buf.write(OUTGOING_HTTP_HEADERS_BLOCK)
+    buf.InjectXml(INCOMING_SOAP_BLOCK)
+    self.assertEqual(OUTGOING_HTTP_HEADERS_BLOCK.strip(), buf.GetHeadersOut())
+    self.assertTrue('<ns1:requestId>' in buf.GetSoapIn())
+
 
 if __name__ == '__main__':
   unittest.main()
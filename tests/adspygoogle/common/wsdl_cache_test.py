@@ -0,0 +1,160 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover WsdlCache."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import BaseHTTPServer
+import os
+import shutil
+import SocketServer
+import sys
+import tempfile
+import threading
+import unittest
+sys.path.insert(0, os.path.join('..', '..', '..'))
+
+from adspygoogle.common import WsdlCache
+from adspygoogle.common.Errors import Error
+from adspygoogle.common.soappy import SoappyUtils
+
+
+WSDL_PATH = os.path.join('data', 'UserService.wsdl')
+ETAG = '"v1"'
+NS = 'https://www.google.com/apis/ads/publisher/v201211'
+
+
+class _WsdlHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+  """Serves the test WSDL, honoring If-None-Match."""
+
+  requests = []
+  paths = []
+
+  def do_GET(self):
+    _WsdlHandler.requests.append(self.headers.getheader('If-None-Match'))
+    _WsdlHandler.paths.append(self.path)
+    if self.headers.getheader('If-None-Match') == ETAG:
+      self.send_response(304)
+      self.end_headers()
+      return
+    fh = open(WSDL_PATH)
+    try:
+      document = fh.read()
+    finally:
+      fh.close()
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/xml')
+    self.send_header('ETag', ETAG)
+    self.end_headers()
+    self.wfile.write(document)
+
+  def log_message(self, *args):
+    pass
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+  daemon_threads = True
+
+
+class WsdlCacheTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.common.WsdlCache module."""
+
+  def setUp(self):
+    """Starts a local server for the WSDL and empties the cache."""
+    _WsdlHandler.requests = []
+    _WsdlHandler.paths = []
+    self.server = _Server(('127.0.0.1', 0), _WsdlHandler)
+    thread = threading.Thread(target=self.server.serve_forever)
+    thread.setDaemon(True)
+    thread.start()
+    self.url = ('http://127.0.0.1:%d/apis/ads/publisher/v201211/UserService'
+                '?wsdl' % self.server.server_address[1])
+    self.cache_dir = tempfile.mkdtemp()
+    WsdlCache.Clear()
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+    shutil.rmtree(self.cache_dir)
+    WsdlCache.Clear()
+
+  def testMemoryTierSharesProxy(self):
+    """Tests that a WSDL is downloaded and parsed once per process."""
+    proxy = WsdlCache.GetProxy(self.url)
+    self.assertTrue('getUsersByStatement' in proxy.methods)
+    self.assertTrue(WsdlCache.GetProxy(self.url) is proxy)
+    self.assertEqual(len(_WsdlHandler.requests), 1)
+
+  def testDiskTierSkipsDownload(self):
+    """Tests that a new process can load a WSDL from the disk cache."""
+    proxy = WsdlCache.GetProxy(self.url, self.cache_dir)
+    WsdlCache.Clear()
+    other_proxy = WsdlCache.GetProxy(self.url, self.cache_dir)
+    self.assertFalse(other_proxy is proxy)
+    self.assertEqual(sorted(other_proxy.methods), sorted(proxy.methods))
+    self.assertEqual(len(_WsdlHandler.requests), 1)
+
+  def testDiskTierKeepsSchemaIndex(self):
+    """Tests that the compiled schema index is loaded from the disk cache."""
+    WsdlCache.GetProxy(self.url, self.cache_dir)
+    WsdlCache.Clear()
+    self.assertTrue([name for name in os.listdir(self.cache_dir)
+                     if name.endswith('.index.pkl')])
+    proxy = WsdlCache.GetProxy(self.url, self.cache_dir)
+    index = SoappyUtils.GetSchemaIndex(proxy)
+    self.assertTrue(index is proxy.__dict__['schema_index'])
+    self.assertTrue(index.HasType('UserPage', NS))
+
+  def testExpiredEntryIsRevalidated(self):
+    """Tests that an expired entry is revalidated using its ETag."""
+    proxy = WsdlCache.GetProxy(self.url, self.cache_dir, 0)
+    self.assertTrue(WsdlCache.GetProxy(self.url, self.cache_dir, 0) is proxy)
+    WsdlCache.Clear()
+    WsdlCache.GetProxy(self.url, self.cache_dir, 0)
+    self.assertEqual(_WsdlHandler.requests, [None, ETAG, ETAG])
+
+  def testStaleCopyIsUsedWhenServerIsDown(self):
+    """Tests that an expired cached WSDL is used if it can't be revalidated."""
+    WsdlCache.GetProxy(self.url, self.cache_dir, 0)
+    WsdlCache.Clear()
+    self.server.shutdown()
+    self.server.server_close()
+    proxy = WsdlCache.GetProxy(self.url, self.cache_dir, 0)
+    self.assertTrue('getUsersByStatement' in proxy.methods)
+
+  def testHttpProxyIsUsed(self):
+    """Tests that a WSDL is downloaded through the given HTTP proxy."""
+    # The local server stands in for the proxy of a host that doesn't resolve.
+    url = 'http://wsdl.invalid/apis/ads/publisher/v201211/UserService?wsdl'
+    proxy = WsdlCache.GetProxy(
+        url, self.cache_dir,
+        http_proxy='127.0.0.1:%d' % self.server.server_address[1])
+    self.assertTrue('getUsersByStatement' in proxy.methods)
+    self.assertEqual(_WsdlHandler.paths, [url])
+
+  def testMissingWsdl(self):
+    """Tests that an uncached WSDL that can't be downloaded raises an Error."""
+    self.server.shutdown()
+    self.server.server_close()
+    self.assertRaises(Error, WsdlCache.GetProxy, self.url, self.cache_dir)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,272 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks the path of an API call, stage by stage and end to end.
+
+Calls UserService.createUsers on a local FakeDfpServer, which sends the users
+back, so that both the request and the response grow with the payload. Every
+benchmark runs once per way of decoding responses, with strict mode on so that
+the arguments are validated:
+  soappy  SOAPpy parses the response, which is then unpacked into dicts.
+  sax     The SAX decoder parses and unpacks the response in one pass, so its
+          'unpack' stage is part of 'parse'.
+For each payload size, calls are first made one at a time, and the time spent
+in each of the CallMetrics.STAGES is taken from the CallMetrics the client
+hands to its metrics_callback. The 'log' stage is XML and request logging. The
+'other' stage is the rest of the call, such as preparing the headers. Whole
+calls through the service are then timed from several threads at once, for
+each concurrency level.
+
+The results are written as CSV, one row per decoding and stage or end to end
+run, with the mean and percentiles of the timings in milliseconds and the high-water mark of
+the process' memory use in kilobytes, where the platform reports it. Compare
+the rows of two runs to catch regressions.
+
+The WSDL of UserService has to be on disk, as for FakeDfpServer:
+  $ python call_path_benchmark.py --wsdl_dir=/path/to/wsdls --output=out.csv
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import csv
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+sys.path.insert(0, os.path.join('..', '..', '..'))
+
+from adspygoogle.common import CallMetrics
+from adspygoogle.dfp.DfpClient import DfpClient
+from fake_dfp_server import FakeDfpServer
+try:
+  import resource
+except ImportError:
+  resource = None
+
+
+DEFAULT_ENTITIES = '1,100,500'
+DEFAULT_CONCURRENCY = '1,4,16'
+DEFAULT_ITERATIONS = 20
+DEFAULT_VERSION = 'v201211'
+
+# The 'sax_decode' config value of each way of decoding responses, by name.
+DECODINGS = (('soappy', 'n'), ('sax', 'y'))
+STAGES = CallMetrics.STAGES + ('other',)
+FIELDS = ('benchmark', 'decoding', 'stage', 'entities', 'concurrency', 'calls', 'seconds',
+          'calls_per_second', 'mean_ms', 'p50_ms', 'p90_ms', 'p99_ms',
+          'max_ms', 'max_rss_kb')
+
+
+def MakeUsers(count):
+  """Returns synthetic users to create.
+
+  Args:
+    count: int Number of users.
+
+  Returns:
+    list The users.
+  """
+  return [{'name': 'Benchmark user %d' % i,
+           'email': 'benchmark.user.%d@example.com' % i,
+           'roleId': '-1'}
+          for i in xrange(count)]
+
+
+def Summarize(benchmark, stage, entities, concurrency, timings, seconds):
+  """Turns a list of timings into a row of results.
+
+  Args:
+    benchmark: str Either 'stage' or 'end_to_end'.
+    stage: str Name of the stage timed.
+    entities: int Number of entities per call.
+    concurrency: int Number of threads making calls.
+    timings: list The time each call took, in seconds.
+    seconds: float The time all of the calls took.
+
+  Returns:
+    dict The results, keyed by the names in FIELDS.
+  """
+  timings = sorted(timings)
+
+  def Percentile(percent):
+    """Returns a percentile of the timings, in milliseconds."""
+    index = min(len(timings) - 1, int(len(timings) * percent / 100.0))
+    return round(timings[index] * 1000, 3)
+
+  return {'benchmark': benchmark,
+          'stage': stage,
+          'entities': entities,
+          'concurrency': concurrency,
+          'calls': len(timings),
+          'seconds': round(seconds, 3),
+          'calls_per_second': round(len(timings) / max(seconds, 1e-9), 1),
+          'mean_ms': round(sum(timings) * 1000 / len(timings), 3),
+          'p50_ms': Percentile(50),
+          'p90_ms': Percentile(90),
+          'p99_ms': Percentile(99),
+          'max_ms': round(timings[-1] * 1000, 3),
+          'max_rss_kb': GetMaxRss()}
+
+
+def GetMaxRss():
+  """Returns the high-water mark of the process' memory use.
+
+  Returns:
+    int The maximum resident set size so far, in kilobytes, or None if the
+    platform does not report it.
+  """
+  if resource is None:
+    return None
+  max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  if sys.platform == 'darwin':
+    max_rss /= 1024
+  return max_rss
+
+
+def RunStages(service, users, iterations, metrics):
+  """Times each stage of createUsers calls made one at a time.
+
+  Args:
+    service: GenericDfpService The UserService to call. Its client must have
+             metrics.append as its 'metrics_callback' config value.
+    users: list The users to create.
+    iterations: int Number of calls to time.
+    metrics: list The CallMetrics of the calls made so far.
+
+  Returns:
+    list A row of results per stage.
+  """
+  del metrics[:]
+  start = time.time()
+  for _ in xrange(iterations):
+    service.CreateUsers(users)
+  seconds = time.time() - start
+
+  timings = dict([(stage, []) for stage in STAGES])
+  for call_metrics in metrics:
+    for stage in CallMetrics.STAGES:
+      timings[stage].append(call_metrics.timings[stage])
+    timings['other'].append(call_metrics.total_time -
+                            sum(call_metrics.timings.values()))
+  return [Summarize('stage', stage, len(users), 1, timings[stage], seconds)
+          for stage in STAGES]
+
+
+def RunEndToEnd(service, users, iterations, concurrency):
+  """Times whole createUsers calls made from several threads at once.
+
+  Args:
+    service: GenericDfpService The UserService to call. Its client must have
+             the 'concurrent' config value on.
+    users: list The users to create.
+    iterations: int Number of calls each thread makes.
+    concurrency: int Number of threads.
+
+  Returns:
+    dict The row of results.
+  """
+  timings = []
+  errors = []
+
+  def Work():
+    """Makes calls, recording how long each takes."""
+    try:
+      for _ in xrange(iterations):
+        start = time.time()
+        service.CreateUsers(users)
+        timings.append(time.time() - start)
+    except Exception, e:
+      errors.append(e)
+
+  threads = [threading.Thread(target=Work) for _ in xrange(concurrency)]
+  start = time.time()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  seconds = time.time() - start
+  if errors:
+    raise errors[0]
+  return Summarize('end_to_end', 'call', len(users), concurrency, timings,
+                   seconds)
+
+
+def main():
+  """Runs the benchmarks and writes their results."""
+  parser = optparse.OptionParser()
+  parser.add_option('--wsdl_dir', help='Directory of <version>/<Service>.wsdl')
+  parser.add_option('--version', default=DEFAULT_VERSION)
+  parser.add_option('--entities', default=DEFAULT_ENTITIES,
+                    help='Comma separated numbers of entities per call.')
+  parser.add_option('--concurrency', default=DEFAULT_CONCURRENCY,
+                    help='Comma separated numbers of threads making calls.')
+  parser.add_option('--iterations', type='int', default=DEFAULT_ITERATIONS,
+                    help='Calls per payload size and per thread.')
+  parser.add_option('--latency', type='float', default=0,
+                    help='Seconds the server waits before answering.')
+  parser.add_option('--xml_log', default='y',
+                    help='Whether to log the XML of calls, "y" or "n".')
+  parser.add_option('--output', help='File to write the CSV results to.')
+  options = parser.parse_args()[0]
+  if not options.wsdl_dir:
+    parser.error('--wsdl_dir is required.')
+
+  home = tempfile.mkdtemp()
+  server = FakeDfpServer(wsdl_dir=options.wsdl_dir, latency=options.latency)
+  server.Start()
+  out = sys.stdout
+  if options.output:
+    out = open(options.output, 'wb')
+  metrics = []
+  try:
+    writer = csv.DictWriter(out, FIELDS)
+    writer.writerow(dict(zip(FIELDS, FIELDS)))
+    for decoding, sax_decode in DECODINGS:
+      client = DfpClient(
+          headers={'authToken': 'benchmark', 'applicationName': 'benchmark',
+                   'networkCode': '1'},
+          config={'home': home, 'log_home': os.path.join(home, 'logs'),
+                  'strict': 'n', 'debug': 'n', 'xml_log': options.xml_log,
+                  'request_log': options.xml_log, 'xml_parser': '2',
+                  'sax_decode': sax_decode, 'concurrent': 'y',
+                  'wsdl_cache': 'n', 'metrics_callback': metrics.append})
+      service = client.GetUserService(server.GetUrl(), options.version)
+      # Strict mode would reject the local server's URL, so it is only turned
+      # on once the service is made.
+      client.strict = True
+      for entities in [int(value) for value in options.entities.split(',')]:
+        users = MakeUsers(entities)
+        rows = RunStages(service, users, options.iterations, metrics)
+        for concurrency in [int(value)
+                            for value in options.concurrency.split(',')]:
+          rows.append(RunEndToEnd(service, users, options.iterations,
+                                  concurrency))
+        for row in rows:
+          row['decoding'] = decoding
+          writer.writerow(row)
+        out.flush()
+  finally:
+    if out is not sys.stdout:
+      out.close()
+    server.Stop()
+    shutil.rmtree(home, True)
+
+
+if __name__ == '__main__':
+  main()
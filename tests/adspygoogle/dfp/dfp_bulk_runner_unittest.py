@@ -0,0 +1,122 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover DfpBulkRunner."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import shutil
+import sys
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import tempfile
+import unittest
+
+from adspygoogle.common.Errors import ValidationError
+from adspygoogle.dfp import DfpBulkRunner
+from adspygoogle.dfp.DfpErrors import DfpApiError
+from fake_dfp_server import FakeDfpServer
+from fake_dfp_server import GetTestClient
+from fake_dfp_server import TEST_VERSION
+from fake_dfp_server import TEST_WSDL_DIR
+
+
+USERS = [{'name': 'User %d' % i, 'email': 'user%d@example.com' % i}
+         for i in xrange(9)]
+
+
+class DfpBulkRunnerTest(unittest.TestCase):
+
+  """Unittest suite for DfpBulkRunner, run against a FakeDfpServer."""
+
+  def setUp(self):
+    """Prepare unittest."""
+    self.server = FakeDfpServer(wsdl_dir=TEST_WSDL_DIR, latency=0.01)
+    self.server.Start()
+    self.home = tempfile.mkdtemp()
+    self.client = GetTestClient(self.home)
+    self.service = self.client.GetUserService(self.server.GetUrl(),
+                                              TEST_VERSION)
+
+  def tearDown(self):
+    """Finalize unittest."""
+    self.server.Stop()
+    shutil.rmtree(self.home, True)
+
+  def __CheckUsers(self, results, failed=0, shard_size=3):
+    """Checks that users are returned in order, and failed shards as errors.
+
+    Args:
+      results: list The results of a bulk call over USERS.
+      [optional]
+      failed: int Number of shards expected to have failed.
+      shard_size: int Number of users in each shard.
+    """
+    self.assertEqual(len(results), len(USERS))
+    errors = [index for index, result in enumerate(results)
+              if isinstance(result, DfpApiError)]
+    self.assertEqual(len(errors), failed * shard_size)
+    if errors:
+      self.assertEqual(errors[0] % shard_size, 0)
+      self.assertEqual(errors, range(errors[0], errors[0] + len(errors)))
+    for user, result in zip(USERS, results):
+      if not isinstance(result, DfpApiError):
+        self.assertEqual(result['name'], user['name'])
+        self.assertTrue(result['id'])
+
+  def testMutateInChunks(self):
+    """Tests that entities come back in input order from concurrent calls."""
+    results = DfpBulkRunner.MutateInChunks(self.service, 'CreateUsers', USERS,
+                                           chunk_size=3, max_in_flight=3)
+    self.__CheckUsers(results)
+    self.assertEqual(self.server.GetCallCounts(), {'createUsers': 3})
+
+  def testMutateInChunksError(self):
+    """Tests that only the entities of a failed chunk are errors."""
+    self.server.InjectFaults(1)
+    results = DfpBulkRunner.MutateInChunks(self.service, 'createUsers', USERS,
+                                           chunk_size=3, max_in_flight=1)
+    self.__CheckUsers(results, failed=1)
+
+  def testMutateInChunksBadMethod(self):
+    """Tests that methods not taking a list of entities are rejected."""
+    self.assertRaises(ValidationError, DfpBulkRunner.MutateInChunks,
+                      self.service, 'GetUser', USERS)
+    self.assertRaises(ValidationError, DfpBulkRunner.MutateInChunks,
+                      self.service, 'DeleteUsers', USERS)
+    self.assertEqual(self.server.GetCallCounts(), {})
+
+  def testRunInProcesses(self):
+    """Tests that entities come back in input order from worker processes."""
+    self.server.InjectFaults(1)
+    results = DfpBulkRunner.RunInProcesses(
+        self.client, 'UserService', 'CreateUsers', USERS, shard_size=3,
+        processes=2, server=self.server.GetUrl(), version=TEST_VERSION)
+    self.__CheckUsers(results, failed=1)
+    self.assertEqual(self.server.GetCallCounts(), {'createUsers': 3})
+
+  def testMergeChecksCount(self):
+    """Tests that a shard whose call returned too few entities is failed."""
+    results = DfpBulkRunner._Merge([[1, 2], [3, 4]],
+                                   [([{'id': 1}, {'id': 2}], None),
+                                    ([{'id': 3}], None)])
+    self.assertEqual(results[:2], [{'id': 1}, {'id': 2}])
+    self.assertTrue(isinstance(results[2], DfpApiError))
+    self.assertTrue(results[2] is results[3])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,140 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover DfpClientPool."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import shutil
+import sys
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import tempfile
+import time
+import unittest
+
+from adspygoogle.common import Utils
+from adspygoogle.dfp import AUTH_TOKEN_EXPIRE
+from adspygoogle.dfp.DfpClientPool import DfpClientPool
+from fake_dfp_server import FakeDfpServer
+from fake_dfp_server import TEST_VERSION
+from fake_dfp_server import TEST_WSDL_DIR
+
+
+class DfpClientPoolTest(unittest.TestCase):
+
+  """Unittest suite for DfpClientPool, run against a FakeDfpServer."""
+
+  def setUp(self):
+    """Prepare unittest."""
+    self.server = FakeDfpServer(wsdl_dir=TEST_WSDL_DIR, total_results=1)
+    self.server.Start()
+    self.home = tempfile.mkdtemp()
+    self.metrics = []
+    self.config = {
+        'home': self.home,
+        'log_home': self.home,
+        'strict': 'n',
+        'xml_parser': '2',
+        'wsdl_cache': 'n',
+        'metrics_callback': self.metrics.append
+    }
+    self.logins = []
+    self.get_auth_token = Utils.GetAuthToken
+    Utils.GetAuthToken = self.__GetAuthToken
+
+  def tearDown(self):
+    """Finalize unittest."""
+    Utils.GetAuthToken = self.get_auth_token
+    self.server.Stop()
+    shutil.rmtree(self.home, True)
+
+  def __GetAuthToken(self, email, *unused_args):
+    """Stands in for a login to the Google account of an email address."""
+    self.logins.append(email)
+    return 'token %d' % len(self.logins)
+
+  def __GetPool(self):
+    """Returns a pool logging in with an email and password."""
+    return DfpClientPool({'email': 'user@example.com', 'password': 'secret',
+                          'applicationName': 'offline test'},
+                         self.config, self.home)
+
+  def testHeadersAndConfigPerNetwork(self):
+    """Tests that each network's client has headers and config of its own."""
+    pool = self.__GetPool()
+    first, second = pool.GetClient('1'), pool.GetClient('2')
+    self.assertTrue(pool.GetClient('1') is first)
+    self.assertEqual(sorted(pool.GetNetworkCodes()), ['1', '2'])
+    self.assertEqual(first.GetAuthCredentials()['networkCode'], '1')
+    self.assertEqual(second.GetAuthCredentials()['networkCode'], '2')
+    self.assertFalse(first.GetConfigValues() is second.GetConfigValues())
+
+    first.GetAuthCredentials()['networkCode'] = '3'
+    first.GetConfigValues()['debug'] = 'y'
+    self.assertEqual(second.GetAuthCredentials()['networkCode'], '2')
+    self.assertEqual(second.GetConfigValues()['debug'], 'n')
+    self.assertEqual(pool.GetClient('4').GetAuthCredentials()['networkCode'],
+                     '4')
+    self.assertFalse('debug' in self.config)
+
+  def testCallsUseOwnNetwork(self):
+    """Tests that calls carry their client's network code."""
+    pool = self.__GetPool()
+    for network_code in ('1', '2', '1'):
+      service = pool.GetClient(network_code).GetUserService(
+          self.server.GetUrl(), TEST_VERSION)
+      service.GetUsersByStatement({'query': 'LIMIT 1'})
+    self.assertEqual([metrics.tags['networkCode'] for metrics in self.metrics],
+                     ['1', '2', '1'])
+
+  def testConnectionPoolIsShared(self):
+    """Tests that every client makes its calls over the same connections."""
+    pool = self.__GetPool()
+    for network_code in ('1', '2', '3'):
+      client = pool.GetClient(network_code)
+      self.assertTrue(client.connection_pool is pool.connection_pool)
+      service = client.GetUserService(self.server.GetUrl(), TEST_VERSION)
+      service.GetUsersByStatement({'query': 'LIMIT 1'})
+    address = self.server.GetUrl()[len('http://'):]
+    self.assertEqual(pool.connection_pool.GetStats()[('http', address)],
+                     (1, 1))
+
+  def testAuthTokenIsReused(self):
+    """Tests that only the first client logs in."""
+    pool = self.__GetPool()
+    clients = [pool.GetClient(network_code)
+               for network_code in ('1', '2', '3')]
+    self.assertEqual(self.logins, ['user@example.com'])
+    for client in clients:
+      self.assertEqual(client.GetAuthCredentials()['authToken'], 'token 1')
+
+  def testAuthTokenKeepsEpoch(self):
+    """Tests that a reused auth token expires when it would have anyway."""
+    pool = self.__GetPool()
+    first = pool.GetClient('1')
+    epoch = time.time() - AUTH_TOKEN_EXPIRE
+    first._config['auth_token_epoch'] = epoch
+    second = pool.GetClient('2')
+    self.assertEqual(second.GetConfigValues()['auth_token_epoch'], epoch)
+    second.GetUserService(self.server.GetUrl(),
+                          TEST_VERSION).GetUsersByStatement({'query': 'LIMIT 1'})
+    self.assertEqual(self.logins, ['user@example.com'] * 2)
+    self.assertEqual(second.GetAuthCredentials()['authToken'], 'token 2')
+
+
+if __name__ == '__main__':
+  unittest.main()
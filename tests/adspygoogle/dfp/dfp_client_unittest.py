@@ -0,0 +1,91 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover DfpClient."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import shutil
+import sys
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import tempfile
+import unittest
+
+from adspygoogle.common.Errors import Error
+from adspygoogle.dfp.DfpErrors import DfpApiError
+from fake_dfp_server import FakeDfpServer
+from fake_dfp_server import GetTestClient
+from fake_dfp_server import TEST_VERSION
+from fake_dfp_server import TEST_WSDL_DIR
+
+
+class DfpClientTest(unittest.TestCase):
+
+  """Unittest suite for DfpClient, run against a FakeDfpServer."""
+
+  def setUp(self):
+    """Prepare unittest."""
+    self.server = FakeDfpServer(wsdl_dir=TEST_WSDL_DIR, total_results=2)
+    self.server.Start()
+    self.home = tempfile.mkdtemp()
+    self.client = GetTestClient(self.home)
+    self.service = self.client.GetUserService(self.server.GetUrl(),
+                                              TEST_VERSION)
+
+  def tearDown(self):
+    """Finalize unittest."""
+    self.server.Stop()
+    shutil.rmtree(self.home, True)
+
+  def testExecuteBatch(self):
+    """Tests that results and errors come back in the order of the calls."""
+    self.server.InjectFaults(1)
+    results = self.client.ExecuteBatch(
+        [(self.service, 'GetUsersByStatement', [{'query': 'LIMIT 2'}]),
+         (self.service, 'GetUsersByStatement', [{'query': 'LIMIT 1'}])],
+        max_workers=1)
+    self.assertTrue(isinstance(results[0], DfpApiError))
+    self.assertEqual(len(results[1][0]['results']), 1)
+
+  def testExecuteBatchReturnedError(self):
+    """Tests that an error returned rather than raised becomes a DfpApiError."""
+    # With raw_response on, a call to a server which can't be reached returns
+    # an Error.
+    other_server = FakeDfpServer(wsdl_dir=TEST_WSDL_DIR)
+    other_server.Start()
+    try:
+      unreachable_service = GetTestClient(
+          self.home, {'raw_response': 'y', 'request_log': 'n'}).GetUserService(
+              other_server.GetUrl(), TEST_VERSION)
+    finally:
+      other_server.Stop()
+    self.assertTrue(isinstance(unreachable_service.GetUsersByStatement(
+        {'query': 'LIMIT 1'}), Error))
+
+    results = self.client.ExecuteBatch(
+        [(unreachable_service, 'GetUsersByStatement', [{'query': 'LIMIT 1'}]),
+         (self.service, 'GetUsersByStatement', [{'query': 'LIMIT 1'}])])
+    self.assertTrue(isinstance(results[0], DfpApiError))
+    self.assertTrue(results[0].fault_string)
+    self.assertEqual(len(results[1][0]['results']), 1)
+    future = self.client.SubmitBatch(
+        [(unreachable_service, 'GetUsersByStatement', [{'query': 'LIMIT 1'}])])
+    self.assertTrue(isinstance(future[0].GetException(), DfpApiError))
+
+
+if __name__ == '__main__':
+  unittest.main()
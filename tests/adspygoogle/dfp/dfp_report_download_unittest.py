@@ -0,0 +1,208 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover the streaming report downloads of DfpUtils."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import BaseHTTPServer
+import gzip
+import httplib
+import os
+import random
+import re
+import StringIO
+import sys
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import threading
+import unittest
+
+from adspygoogle.dfp import DfpUtils
+
+
+def _MakeReport(rows):
+  """Returns a CSV report, and its gzipped bytes.
+
+  The values are random, so the gzipped report spans several download chunks.
+
+  Args:
+    rows: int Number of rows after the header row.
+
+  Returns:
+    tuple The report's text and its gzipped bytes.
+  """
+  generator = random.Random(0)
+  lines = ['Dimension.AD_UNIT_NAME,Column.AD_SERVER_IMPRESSIONS']
+  for i in xrange(rows):
+    lines.append('Ad unit %x,%d' % (generator.getrandbits(64),
+                                    generator.randint(0, 10 ** 9)))
+  text = '\r\n'.join(lines) + '\r\n'
+  buf = StringIO.StringIO()
+  fh = gzip.GzipFile(fileobj=buf, mode='wb')
+  fh.write(text)
+  fh.close()
+  return text, buf.getvalue()
+
+
+REPORT_TEXT, REPORT_GZIP = _MakeReport(20000)
+
+
+class _ReportHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+  """Serves REPORT_GZIP, as scripted by the server's attributes."""
+
+  def do_GET(self):
+    """Serves the report, or the range of it asked for."""
+    self.server.ranges.append(self.headers.get('Range'))
+    start = 0
+    match = re.match(r'bytes=(\d+)-$', self.headers.get('Range') or '')
+    if match and self.server.honor_range:
+      start = int(match.group(1))
+      self.send_response(206)
+      self.send_header('Content-Range', 'bytes %d-%d/%d'
+                       % (start, len(REPORT_GZIP) - 1, len(REPORT_GZIP)))
+    else:
+      self.send_response(200)
+    body = REPORT_GZIP[start:]
+    self.send_header('Content-Type', 'application/x-gzip')
+    if self.server.send_length:
+      self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    if self.server.drops:
+      # Drops the connection once part of the body is sent.
+      self.server.drops -= 1
+      body = body[:len(body) / 3]
+    self.wfile.write(body)
+    self.wfile.flush()
+
+  def log_message(self, format, *args):
+    """Keeps the server quiet."""
+    pass
+
+
+class _StubReportService(object):
+
+  """Reports every job as completed, with its report on a _ReportHandler."""
+
+  def __init__(self, report_url):
+    """Inits _StubReportService.
+
+    Args:
+      report_url: str URL every report is downloaded from.
+    """
+    self._report_url = report_url
+    self._config = {'debug': 'n'}
+
+  def GetReportJob(self, report_job_id):
+    return [{'id': report_job_id, 'reportJobStatus': 'COMPLETED'}]
+
+  def GetReportDownloadURL(self, unused_report_job_id, unused_export_format):
+    return [self._report_url]
+
+
+class DfpReportDownloadTest(unittest.TestCase):
+
+  """Unittest suite for report downloads, served by a local HTTP server."""
+
+  def setUp(self):
+    """Prepare unittest."""
+    self.server = BaseHTTPServer.HTTPServer(('localhost', 0), _ReportHandler)
+    self.server.ranges = []
+    self.server.honor_range = True
+    self.server.drops = 0
+    self.server.send_length = True
+    self.thread = threading.Thread(target=self.server.serve_forever)
+    self.thread.start()
+    self.service = _StubReportService(
+        'http://localhost:%d/report.csv.gz' % self.server.server_address[1])
+    self.progress = []
+
+  def tearDown(self):
+    """Finalize unittest."""
+    self.server.shutdown()
+    self.thread.join()
+    self.server.server_close()
+
+  def __Download(self, max_retries=DfpUtils.DEFAULT_REPORT_DOWNLOAD_RETRIES):
+    """Downloads the report into a file-like object and returns its text."""
+    outfile = StringIO.StringIO()
+    self.assertTrue(DfpUtils.DownloadReportToFile(
+        '1', 'CSV_DUMP', self.service, outfile,
+        lambda received, total: self.progress.append((received, total)),
+        max_retries))
+    return outfile.getvalue()
+
+  def testDownloadReportToFile(self):
+    """Tests that a report is written whole, reporting progress by chunk."""
+    self.assertEqual(self.__Download(), REPORT_TEXT)
+    self.assertEqual(self.server.ranges, [None])
+    self.assertTrue(len(self.progress) > 1)
+    self.assertEqual(self.progress[-1], (len(REPORT_GZIP), len(REPORT_GZIP)))
+
+  def testDroppedDownloadIsResumed(self):
+    """Tests that a dropped download resumes from the bytes received."""
+    self.server.drops = 1
+    self.assertEqual(self.__Download(), REPORT_TEXT)
+    received = len(REPORT_GZIP) / 3
+    self.assertEqual(self.server.ranges, [None, 'bytes=%d-' % received])
+    self.assertEqual(self.progress[-1], (len(REPORT_GZIP), len(REPORT_GZIP)))
+
+  def testRangeIgnored(self):
+    """Tests a resumed download from a server sending the whole report again."""
+    self.server.drops = 1
+    self.server.honor_range = False
+    self.assertEqual(self.__Download(), REPORT_TEXT)
+    self.assertEqual(len(self.server.ranges), 2)
+    # The bytes sent again are skipped rather than counted twice.
+    self.assertEqual([received for received, _ in self.progress],
+                     sorted(set(received for received, _ in self.progress)))
+    self.assertEqual(self.progress[-1], (len(REPORT_GZIP), len(REPORT_GZIP)))
+
+  def testRetriesExhausted(self):
+    """Tests that the error is raised once every retry has been dropped."""
+    self.server.drops = 2
+    self.assertRaises(httplib.IncompleteRead, self.__Download, 1)
+    self.assertEqual(len(self.server.ranges), 2)
+
+  def testDroppedDownloadWithoutLength(self):
+    """Tests that a dropped download is resumed without a Content-Length."""
+    self.server.drops = 1
+    self.server.send_length = False
+    self.assertEqual(self.__Download(), REPORT_TEXT)
+    received = len(REPORT_GZIP) / 3
+    self.assertEqual(self.server.ranges, [None, 'bytes=%d-' % received])
+    self.assertEqual(self.progress[-1], (len(REPORT_GZIP), None))
+
+  def testRetriesExhaustedWithoutLength(self):
+    """Tests that a report cut short without a Content-Length is an error."""
+    self.server.drops = 2
+    self.server.send_length = False
+    self.assertRaises(httplib.IncompleteRead, self.__Download, 1)
+    self.assertEqual(len(self.server.ranges), 2)
+
+  def testGetReportRows(self):
+    """Tests that the rows of a resumed download are parsed whole."""
+    self.server.drops = 1
+    rows = list(DfpUtils.GetReportRows('1', 'CSV_DUMP', self.service))
+    self.assertEqual(len(rows), 20001)
+    self.assertEqual(rows[0], ['Dimension.AD_UNIT_NAME',
+                               'Column.AD_SERVER_IMPRESSIONS'])
+    self.assertEqual(rows, [line.split(',')
+                            for line in REPORT_TEXT.splitlines()])
+
+
+if __name__ == '__main__':
+  unittest.main()
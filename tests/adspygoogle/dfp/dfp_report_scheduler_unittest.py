@@ -0,0 +1,175 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover DfpReportScheduler."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import functools
+import os
+import sys
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import time
+import unittest
+
+from adspygoogle.common.Errors import Error
+from adspygoogle.dfp import DfpUtils
+from adspygoogle.dfp.DfpReportScheduler import DfpReportScheduler
+
+
+class _StubReportService(object):
+
+  """Answers GetReportJob calls from a script of statuses and errors."""
+
+  def __init__(self, outcomes):
+    """Inits _StubReportService.
+
+    Args:
+      outcomes: dict List of the statuses to return, or errors to raise, for
+                each report job ID, in order.
+    """
+    self._outcomes = outcomes
+    self._config = {'debug': 'n'}
+    self.calls = []
+
+  def GetReportJob(self, report_job_id):
+    self.calls.append((report_job_id, time.time()))
+    outcome = self._outcomes[report_job_id].pop(0)
+    if isinstance(outcome, Exception):
+      raise outcome
+    return [{'id': report_job_id, 'reportJobStatus': outcome}]
+
+
+class DfpReportSchedulerTest(unittest.TestCase):
+
+  """Unittest suite for DfpReportScheduler, which needs no network access."""
+
+  def setUp(self):
+    self.finished = []
+
+  def Callback(self, report_job_id, status):
+    self.finished.append((report_job_id, status))
+
+  def testBackoff(self):
+    """Tests that a job is checked less and less often, up to max_interval."""
+    service = _StubReportService(
+        {'1': ['IN_PROGRESS'] * 4 + ['COMPLETED']})
+    scheduler = DfpReportScheduler(service, initial_interval=0.02,
+                                   max_interval=0.05, backoff=2)
+    scheduler.Add('1')
+    self.assertEqual(scheduler.Run(), {'1': 'COMPLETED'})
+    times = [call_time for _, call_time in service.calls]
+    gaps = [end - start for start, end in zip(times, times[1:])]
+    for gap, interval in zip(gaps, [0.02, 0.04, 0.05, 0.05]):
+      self.assertTrue(gap >= interval - 0.001, (gaps, interval))
+    self.assertTrue(gaps[-1] < 0.5, gaps)
+
+  def testOrdering(self):
+    """Tests that jobs are checked and finished in the order they are due."""
+    service = _StubReportService({
+        '1': ['IN_PROGRESS', 'IN_PROGRESS', 'COMPLETED'],
+        '2': ['FAILED'],
+        '3': ['IN_PROGRESS', 'COMPLETED']})
+    scheduler = DfpReportScheduler(service, initial_interval=0.01,
+                                   max_interval=0.01)
+    for report_job_id in ('1', '2', '3'):
+      scheduler.Add(report_job_id, self.Callback)
+    self.assertEqual(scheduler.Run(),
+                     {'1': 'COMPLETED', '2': 'FAILED', '3': 'COMPLETED'})
+    self.assertEqual([report_job_id for report_job_id, _ in service.calls],
+                     ['1', '2', '3', '1', '3', '1'])
+    self.assertEqual(self.finished,
+                     [('2', 'FAILED'), ('3', 'COMPLETED'), ('1', 'COMPLETED')])
+
+  def testTimeout(self):
+    """Tests that Run stops at the timeout and that jobs are still tracked."""
+    outcomes = {'1': ['IN_PROGRESS'] * 100}
+    service = _StubReportService(outcomes)
+    scheduler = DfpReportScheduler(service, initial_interval=0.01,
+                                   max_interval=0.01)
+    scheduler.Add('1', self.Callback)
+    start = time.time()
+    self.assertEqual(scheduler.Run(timeout=0.1), {})
+    self.assertTrue(time.time() - start < 0.5)
+    self.assertEqual(self.finished, [])
+
+    outcomes['1'] = ['COMPLETED']
+    self.assertEqual(scheduler.Run(), {'1': 'COMPLETED'})
+    self.assertEqual(self.finished, [('1', 'COMPLETED')])
+
+  def testErrorIsRetried(self):
+    """Tests that a failed status check is retried without affecting others."""
+    service = _StubReportService({
+        '1': [Error('Connection reset'), Error('Connection reset'),
+              'COMPLETED'],
+        '2': ['IN_PROGRESS', 'COMPLETED']})
+    scheduler = DfpReportScheduler(service, initial_interval=0.01,
+                                   max_interval=0.01)
+    scheduler.Add('1', self.Callback)
+    scheduler.Add('2', self.Callback)
+    self.assertEqual(scheduler.Run(), {'1': 'COMPLETED', '2': 'COMPLETED'})
+    self.assertEqual(scheduler.GetErrors(), {})
+    self.assertEqual(len(service.calls), 5)
+
+  def testJobIsDroppedAfterMaxErrors(self):
+    """Tests that a job failing max_errors checks in a row is dropped."""
+    error = Error('Connection reset')
+    service = _StubReportService({'1': [error] * 2 + ['COMPLETED'],
+                                  '2': ['COMPLETED']})
+    scheduler = DfpReportScheduler(service, initial_interval=0.01,
+                                   max_errors=2)
+    dropped = []
+    scheduler.Add('1', self.Callback,
+                  lambda report_job_id, e: dropped.append((report_job_id, e)))
+    scheduler.Add('2', self.Callback)
+    self.assertEqual(scheduler.Run(), {'2': 'COMPLETED'})
+    self.assertEqual(scheduler.GetErrors(), {'1': error})
+    self.assertEqual(dropped, [('1', error)])
+    self.assertEqual(self.finished, [('2', 'COMPLETED')])
+    self.assertEqual([call[0] for call in service.calls].count('1'), 2)
+
+  def testCallbackErrorKeepsDueJobs(self):
+    """Tests that jobs due with one whose callback raises are still checked."""
+    service = _StubReportService({'1': ['COMPLETED'], '2': ['COMPLETED']})
+    scheduler = DfpReportScheduler(service)
+
+    def Raise(unused_report_job_id, unused_status):
+      raise ValueError('Callback failed')
+
+    scheduler.Add('1', Raise)
+    scheduler.Add('2', self.Callback)
+    self.assertRaises(ValueError, scheduler.Run)
+    self.assertEqual(scheduler.Run(), {'1': 'COMPLETED', '2': 'COMPLETED'})
+    self.assertEqual(self.finished, [('2', 'COMPLETED')])
+
+  def testWaitForReportJobRaisesError(self):
+    """Tests that WaitForReportJob raises the error of a dropped job."""
+    error = Error('Connection reset')
+    service = _StubReportService({'1': [error] * 3 + ['COMPLETED']})
+    DfpUtils.DfpReportScheduler = functools.partial(DfpReportScheduler,
+                                                    initial_interval=0.01)
+    try:
+      DfpUtils.WaitForReportJob('1', service)
+    except Error, e:
+      self.assertTrue(e is error)
+    else:
+      self.fail('WaitForReportJob did not raise.')
+    finally:
+      DfpUtils.DfpReportScheduler = DfpReportScheduler
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover DfpReportTable."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import array
+import os
+import sys
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+
+from adspygoogle.dfp.DfpErrors import DfpError
+from adspygoogle.dfp.DfpReportTable import DfpReportTable
+
+
+class DfpReportTableTest(unittest.TestCase):
+
+  """Unittest suite for DfpReportTable, which needs no network access."""
+
+  HEADERS = ['Dimension.AD_UNIT_NAME', 'Dimension.ZIP',
+             'Column.AD_SERVER_IMPRESSIONS', 'Column.AD_SERVER_CTR']
+
+  def testColumnKinds(self):
+    """Tests that each column is stored in the most compact kind that fits."""
+    table = DfpReportTable([self.HEADERS,
+                            ['Top', '10001', '12', '0.5'],
+                            [],
+                            ['Side', '02134', '7', '1']])
+    self.assertEqual(len(table), 2)
+    self.assertEqual(table.GetHeaders(), self.HEADERS)
+    self.assertEqual(table.GetColumn('Dimension.AD_UNIT_NAME'), ['Top', 'Side'])
+    self.assertEqual(table.GetColumn('Dimension.ZIP'), ['10001', '02134'])
+    self.assertEqual(table.GetColumn('Column.AD_SERVER_IMPRESSIONS'),
+                     array.array('l', [12, 7]))
+    self.assertEqual(table.GetColumn('Column.AD_SERVER_CTR'),
+                     array.array('d', [0.5, 1.0]))
+    self.assertEqual(list(table), [('Top', '10001', 12, 0.5),
+                                   ('Side', '02134', 7, 1.0)])
+    self.assertEqual(table[1], ('Side', '02134', 7, 1.0))
+
+  def testWidenedColumnKeepsText(self):
+    """Tests that numbers read before a column became strings keep their text."""
+    table = DfpReportTable([['a', 'b'],
+                            ['5', '1e3'],
+                            ['3.5', 'nan'],
+                            ['N/A', 'abc']])
+    self.assertEqual(table.GetColumn('a'), ['5', '3.5', 'N/A'])
+    self.assertEqual(table.GetColumn('b'), ['1e3', 'nan', 'abc'])
+
+  def testOversizedInteger(self):
+    """Tests that an integer too large for a C long widens its column."""
+    table = DfpReportTable([['a', 'b'],
+                            ['1', 'x'],
+                            ['99999999999999999999', 'y'],
+                            ['N/A', 'z']])
+    self.assertEqual(len(table), 3)
+    self.assertEqual(table.GetColumn('a'), ['1', '99999999999999999999', 'N/A'])
+    table = DfpReportTable([['a'], ['1'], ['99999999999999999999']])
+    self.assertEqual(table.GetColumn('a'), array.array('d', [1.0, 1e20]))
+
+  def testNonFiniteValuesAreStrings(self):
+    """Tests that 'nan' and 'inf' are not read as numbers."""
+    table = DfpReportTable([['a', 'b', 'c'],
+                            ['nan', '1.5', '2'],
+                            ['1', 'inf', '-Infinity']])
+    self.assertEqual(table.GetColumn('a'), ['nan', '1'])
+    self.assertEqual(table.GetColumn('b'), ['1.5', 'inf'])
+    self.assertEqual(table.GetColumn('c'), ['2', '-Infinity'])
+
+  def testInternedStrings(self):
+    """Tests that repeated dimension values share one string object."""
+    table = DfpReportTable([['Dimension.AD_UNIT_NAME'],
+                            ['Top' + str(1)], ['Top' + str(1)]])
+    column = table.GetColumn('Dimension.AD_UNIT_NAME')
+    self.assertTrue(column[0] is column[1])
+
+  def testErrors(self):
+    """Tests that malformed reports and unknown columns raise DfpError."""
+    self.assertRaises(DfpError, DfpReportTable, [])
+    self.assertRaises(DfpError, DfpReportTable, [['a', 'b'], ['1']])
+    self.assertRaises(DfpError, DfpReportTable([['a']]).GetColumn, 'b')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,236 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover the paging functions of DfpUtils."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import shutil
+import sys
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import tempfile
+import threading
+import time
+import unittest
+
+from adspygoogle.common.Errors import ValidationError
+from adspygoogle.dfp import DfpUtils
+from adspygoogle.dfp.DfpErrors import DfpApiError
+from fake_dfp_server import FakeDfpServer
+from fake_dfp_server import GetTestClient
+from fake_dfp_server import TEST_VERSION
+from fake_dfp_server import TEST_WSDL_DIR
+
+
+class _StubUserService(object):
+
+  """Answers GetUsersByStatement calls, later pages first."""
+
+  _service_name = 'UserService'
+
+  def __init__(self, total_results, fail_offset=None):
+    """Inits _StubUserService.
+
+    Args:
+      total_results: int Number of users behind every query.
+      [optional]
+      fail_offset: int Offset of the page whose call raises a DfpApiError.
+    """
+    self._total_results = total_results
+    self._fail_offset = fail_offset
+    self._lock = threading.Lock()
+    self.offsets = []
+    self.in_flight = 0
+    self.max_in_flight = 0
+
+  def GetUsersByStatement(self, filter_statement):
+    limit, offset = [int(value) for value
+                     in filter_statement['query'].split()[-3::2]]
+    self._lock.acquire()
+    try:
+      self.offsets.append(offset)
+      self.in_flight += 1
+      self.max_in_flight = max(self.max_in_flight, self.in_flight)
+    finally:
+      self._lock.release()
+    try:
+      # Pages further in come back sooner, so that they finish out of order.
+      time.sleep(max(0, 0.05 - offset * 0.005))
+      if offset == self._fail_offset:
+        raise DfpApiError({'faultcode': 'Server',
+                           'faultstring': 'Page %d failed.' % offset})
+      end = min(self._total_results, offset + limit)
+      return [{'results': [{'id': str(i + 1)} for i in xrange(offset, end)]}]
+    finally:
+      self._lock.acquire()
+      self.in_flight -= 1
+      self._lock.release()
+
+
+class DfpUtilsPagingTest(unittest.TestCase):
+
+  """Unittest suite for DfpUtils paging, run against a FakeDfpServer."""
+
+  def setUp(self):
+    """Prepare unittest."""
+    self.server = FakeDfpServer(wsdl_dir=TEST_WSDL_DIR, total_results=7)
+    self.server.Start()
+    self.home = tempfile.mkdtemp()
+    self.service = GetTestClient(self.home).GetUserService(
+        self.server.GetUrl(), TEST_VERSION)
+
+  def tearDown(self):
+    """Finalize unittest."""
+    self.server.Stop()
+    shutil.rmtree(self.home, True)
+
+  def __GetIds(self, users):
+    """Returns the IDs of users, as ints."""
+    return [int(user['id']) for user in users]
+
+  def testGetAllEntitiesByStatementWithService(self):
+    """Tests that the entities of every page are returned, in order."""
+    users = DfpUtils.GetAllEntitiesByStatementWithService(
+        self.service, 'ORDER BY id', 3)
+    self.assertEqual(self.__GetIds(users), range(1, 8))
+
+  def testGetPagesByStatementWithService(self):
+    """Tests that pages come with their offsets and stop at a short page."""
+    pages = list(DfpUtils.GetPagesByStatementWithService(self.service,
+                                                         page_size=3))
+    self.assertEqual([offset for offset, _ in pages], [0, 3, 6])
+    self.assertEqual([self.__GetIds(users) for _, users in pages],
+                     [[1, 2, 3], [4, 5, 6], [7]])
+    self.assertEqual(self.server.GetCallCounts(), {'getUsersByStatement': 3})
+
+  def testStopsAtEmptyPage(self):
+    """Tests that a full last page is followed by one empty page only."""
+    self.server.total_results = 6
+    pages = list(DfpUtils.GetPagesByStatementWithService(self.service,
+                                                         page_size=3))
+    self.assertEqual([offset for offset, _ in pages], [0, 3])
+    self.assertEqual(self.server.GetCallCounts(), {'getUsersByStatement': 3})
+
+  def testGetEntitiesByStatementWithServiceIsLazy(self):
+    """Tests that each page is only requested once the last one is used."""
+    users = DfpUtils.GetEntitiesByStatementWithService(self.service,
+                                                       page_size=3)
+    self.assertEqual(self.server.GetCallCounts(), {})
+    for _ in xrange(3):
+      users.next()
+    self.assertEqual(self.server.GetCallCounts(), {'getUsersByStatement': 1})
+    users.next()
+    self.assertEqual(self.server.GetCallCounts(), {'getUsersByStatement': 2})
+
+  def testResumeFromOffset(self):
+    """Tests that iteration resumes at the offset of a page."""
+    pages = DfpUtils.GetPagesByStatementWithService(self.service, page_size=3)
+    pages.next()
+    offset, _ = pages.next()
+    pages.close()
+    users = DfpUtils.GetEntitiesByStatementWithService(self.service,
+                                                       page_size=3,
+                                                       offset=offset)
+    self.assertEqual(self.__GetIds(users), [4, 5, 6, 7])
+
+  def testBadArguments(self):
+    """Tests that queries with LIMIT or OFFSET, and negative offsets, fail."""
+    for query, offset in (('LIMIT 3', 0), ('ORDER BY id OFFSET 3', 0),
+                          ('', -1)):
+      users = DfpUtils.GetEntitiesByStatementWithService(self.service, query,
+                                                         offset=offset)
+      self.assertRaises(ValidationError, list, users)
+    self.assertEqual(self.server.GetCallCounts(), {})
+
+
+class DfpUtilsPrefetchTest(unittest.TestCase):
+
+  """Unittest suite for paging with several page requests in flight."""
+
+  def __GetIds(self, users):
+    """Returns the IDs of users, as ints."""
+    return [int(user['id']) for user in users]
+
+  def testOrder(self):
+    """Tests that pages finishing out of order are still yielded in order."""
+    service = _StubUserService(10)
+    pages = list(DfpUtils.GetPagesByStatementWithService(service, page_size=2,
+                                                         max_in_flight=3))
+    self.assertEqual([offset for offset, _ in pages], [0, 2, 4, 6, 8])
+    self.assertEqual(self.__GetIds(user for _, page in pages
+                                   for user in page), range(1, 11))
+    self.assertEqual(service.max_in_flight, 3)
+
+  def testStopsAtShortPage(self):
+    """Tests that no page is requested once a short page has come back."""
+    service = _StubUserService(9)
+    users = DfpUtils.GetAllEntitiesByStatementWithService(service, '', 2,
+                                                          max_in_flight=3)
+    self.assertEqual(self.__GetIds(users), range(1, 10))
+    # Up to max_in_flight - 1 requests past the short page were already sent.
+    self.assertEqual(sorted(service.offsets), range(0, 14, 2))
+    self.assertEqual(service.in_flight, 0)
+
+  def testResumeFromOffset(self):
+    """Tests that prefetching starts at the offset it resumes from."""
+    service = _StubUserService(10)
+    users = DfpUtils.GetEntitiesByStatementWithService(service, page_size=2,
+                                                       offset=4,
+                                                       max_in_flight=3)
+    self.assertEqual(self.__GetIds(users), range(5, 11))
+    self.assertEqual(min(service.offsets), 4)
+
+  def testError(self):
+    """Tests that the pages before a failed one are yielded, then its error."""
+    service = _StubUserService(10, fail_offset=4)
+    pages = DfpUtils.GetPagesByStatementWithService(service, page_size=2,
+                                                    max_in_flight=3)
+    self.assertEqual([offset for offset, _ in (pages.next(), pages.next())],
+                     [0, 2])
+    self.assertRaises(DfpApiError, pages.next)
+    self.assertEqual(service.in_flight, 0)
+
+  def testStopEarly(self):
+    """Tests that no request is left running once iteration is stopped."""
+    service = _StubUserService(100)
+    pages = DfpUtils.GetPagesByStatementWithService(service, page_size=2,
+                                                    max_in_flight=4)
+    pages.next()
+    pages.close()
+    self.assertEqual(service.in_flight, 0)
+    self.assertEqual(len(service.offsets), 4)
+
+  def testFakeServer(self):
+    """Tests prefetching over a concurrent client against a FakeDfpServer."""
+    server = FakeDfpServer(wsdl_dir=TEST_WSDL_DIR, total_results=25,
+                           latency=0.01)
+    server.Start()
+    home = tempfile.mkdtemp()
+    try:
+      service = GetTestClient(home, {'concurrent': 'y'}).GetUserService(
+          server.GetUrl(), TEST_VERSION)
+      users = DfpUtils.GetAllEntitiesByStatementWithService(
+          service, 'ORDER BY id', 3, max_in_flight=4)
+      self.assertEqual(self.__GetIds(users), range(1, 26))
+      self.assertTrue(server.GetCallCounts()['getUsersByStatement'] <= 12)
+    finally:
+      server.Stop()
+      shutil.rmtree(home, True)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,571 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Local stand-in for the DFP API, to test and benchmark the client offline.
+
+The server answers the common operations of any service with synthetic data:
+  - get*ByStatement returns a page of entities, honoring the LIMIT and OFFSET
+    of the statement's query, out of total_results entities.
+  - create* and update* return the entities they are sent, with an ID added
+    to the created ones.
+  - runReportJob, getReportJob and getReportDownloadURL run fake report jobs,
+    which complete report_latency seconds after they start. The download URL
+    points back at this server and serves a gzipped CSV or TSV report of
+    report_rows rows.
+Any other operation, and the next calls after InjectFaults(), get a SOAP fault
+shaped like the ones the API sends.
+
+WSDLs are served from wsdl_dir, laid out as <version>/<ServiceName>.wsdl, with
+the service addresses pointed at this server. Pass GetUrl() as the server
+argument of DfpClient.GetService, with the 'strict' config value off, and an
+authToken of any value in the headers.
+
+The offline tests serve the WSDLs in TEST_WSDL_DIR, and call the server with
+a client made by GetTestClient.
+
+Run this module to start a server from the command line:
+  $ python fake_dfp_server.py --port=8080 --wsdl_dir=/path/to/wsdls
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import gzip
+import optparse
+import os
+import re
+import StringIO
+import sys
+import threading
+import time
+from xml.sax import saxutils
+sys.path.insert(0, os.path.join('..', '..', '..'))
+
+from adspygoogle import SOAPpy
+from adspygoogle.dfp.DfpClient import DfpClient
+
+
+# Default number of entities behind every get*ByStatement query.
+DEFAULT_TOTAL_RESULTS = 1000
+# Default number of rows of every report.
+DEFAULT_REPORT_ROWS = 1000
+# Error string of the faults sent by InjectFaults, by default.
+DEFAULT_FAULT_ERROR = 'InternalApiError.UNEXPECTED_INTERNAL_API_ERROR'
+# Directory of the WSDLs the offline tests serve.
+TEST_WSDL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'data', 'wsdls')
+# API version of the WSDLs in TEST_WSDL_DIR.
+TEST_VERSION = 'v201211'
+
+_API_PATH = '/apis/ads/publisher/'
+_REPORT_PATH = '/reports/'
+_LIVE_LOCATION = 'location="https://www.google.com'
+_NAMESPACE = 'https://www.google.com/apis/ads/publisher/%s'
+
+_ENVELOPE = ('<?xml version="1.0" encoding="UTF-8"?>'
+             '<soap:Envelope xmlns:soap='
+             '"http://schemas.xmlsoap.org/soap/envelope/">'
+             '<soap:Header><ResponseHeader xmlns="%s"><requestId>%s</requestId>'
+             '<responseTime>%d</responseTime></ResponseHeader></soap:Header>'
+             '<soap:Body>%s</soap:Body></soap:Envelope>')
+_FAULT = ('<soap:Fault><faultcode>soap:Server</faultcode>'
+          '<faultstring>[%(error)s @ %(field)s]</faultstring><detail>'
+          '<ApiExceptionFault xmlns="%(namespace)s">'
+          '<message>[%(error)s @ %(field)s]</message>'
+          '<ApplicationException.Type>ApiException'
+          '</ApplicationException.Type><errors><fieldPath>%(field)s'
+          '</fieldPath><trigger></trigger><errorString>%(error)s</errorString>'
+          '<ApiError.Type>%(type)s</ApiError.Type></errors>'
+          '</ApiExceptionFault></detail></soap:Fault>')
+
+
+class FakeDfpServer(SOAPpy.ThreadingSOAPServer):
+
+  """Threaded SOAP server answering DFP API calls with synthetic data."""
+
+  daemon_threads = True
+
+  def __init__(self, addr=('localhost', 0), wsdl_dir=None, latency=0,
+               total_results=DEFAULT_TOTAL_RESULTS,
+               report_rows=DEFAULT_REPORT_ROWS, report_latency=0):
+    """Inits FakeDfpServer.
+
+    Args:
+      [optional]
+      addr: tuple The host and port to listen on. Port 0 picks a free port.
+      wsdl_dir: str Directory holding the WSDLs to serve, as
+                <version>/<ServiceName>.wsdl.
+      latency: float Seconds to wait before answering each SOAP call.
+      total_results: int Number of entities behind every get*ByStatement
+                     query.
+      report_rows: int Number of rows of every report.
+      report_latency: float Seconds a report job takes to complete.
+    """
+    SOAPpy.ThreadingSOAPServer.__init__(self, addr, _FakeDfpRequestHandler)
+    self.wsdl_dir = wsdl_dir
+    self.latency = latency
+    self.total_results = total_results
+    self.report_rows = report_rows
+    self.report_latency = report_latency
+    self._lock = threading.Lock()
+    self._next_id = 1
+    self._report_jobs = {}
+    self._faults = []
+    self._call_counts = {}
+    self._thread = None
+
+  def GetUrl(self):
+    """Returns the URL to pass as the server argument of GetService.
+
+    Returns:
+      str The scheme, host and port of this server.
+    """
+    return 'http://%s:%d' % self.server_address[:2]
+
+  def Start(self):
+    """Starts serving requests from a background thread."""
+    self._thread = threading.Thread(target=self.serve_forever)
+    self._thread.setDaemon(True)
+    self._thread.start()
+
+  def Stop(self):
+    """Stops serving requests and closes the listening socket."""
+    if self._thread is not None:
+      self.shutdown()
+      self._thread.join()
+      self._thread = None
+    self.server_close()
+
+  def InjectFaults(self, count=1, error=DEFAULT_FAULT_ERROR):
+    """Makes the next SOAP calls fail with a fault.
+
+    Args:
+      [optional]
+      count: int Number of calls to fail.
+      error: str Error string of the faults, such as
+             'QuotaError.EXCEEDED_QUOTA'.
+    """
+    self._lock.acquire()
+    try:
+      self._faults.extend([error] * count)
+    finally:
+      self._lock.release()
+
+  def GetCallCounts(self):
+    """Returns the number of SOAP calls answered so far, by operation.
+
+    Returns:
+      dict The number of calls of each operation, faults included.
+    """
+    self._lock.acquire()
+    try:
+      return dict(self._call_counts)
+    finally:
+      self._lock.release()
+
+  def Call(self, version, method, args):
+    """Answers a SOAP call.
+
+    Args:
+      version: str The API version called, such as 'v201211'.
+      method: str The name of the operation, such as 'getUsersByStatement'.
+      args: list (name, value) tuples of the arguments, in order.
+
+    Returns:
+      tuple (bool, str) Whether the call succeeded, and the XML of the
+      operation's response or of the fault.
+    """
+    namespace = _NAMESPACE % version
+    self._lock.acquire()
+    try:
+      self._call_counts[method] = self._call_counts.get(method, 0) + 1
+      fault = self._faults and self._faults.pop(0)
+    finally:
+      self._lock.release()
+    if fault:
+      return False, _Fault(namespace, fault)
+
+    if method.endswith('ByStatement') and method.startswith('get'):
+      rval = self._GetByStatement(method, dict(args))
+    elif method.startswith('create') or method.startswith('update'):
+      rval = self._Mutate(method, args)
+    elif method == 'runReportJob':
+      rval = self._RunReportJob(dict(args)['reportJob'])
+    elif method == 'getReportJob':
+      rval = self._GetReportJob(dict(args)['reportJobId'])
+    elif method == 'getReportDownloadURL':
+      rval = self._GetReportDownloadUrl(dict(args))
+    else:
+      return False, _Fault(namespace, 'NotImplementedError.NOT_IMPLEMENTED',
+                           method)
+    if rval is None:
+      return False, _Fault(namespace, 'NotFoundError.NOT_FOUND', 'id')
+    return True, '<%sResponse xmlns="%s">%s</%sResponse>' % (
+        method, namespace, _ToXml('rval', rval), method)
+
+  def _GetByStatement(self, method, args):
+    """Returns a page of synthetic entities.
+
+    Args:
+      method: str The name of the operation, such as 'getUsersByStatement'.
+      args: dict The arguments of the call.
+
+    Returns:
+      dict The page.
+    """
+    entity = method[len('get'):-len('sByStatement')]
+    query = (args.get('filterStatement') or {}).get('query') or ''
+    limit = re.search(r'LIMIT\s+(\d+)', query, re.I)
+    offset = re.search(r'OFFSET\s+(\d+)', query, re.I)
+    offset = offset and int(offset.group(1)) or 0
+    end = self.total_results
+    if limit:
+      end = min(end, offset + int(limit.group(1)))
+    results = [{'id': str(i + 1), 'name': '%s %d' % (entity, i + 1)}
+               for i in xrange(offset, end)]
+    page = {'totalResultSetSize': str(self.total_results),
+            'startIndex': str(offset)}
+    if results:
+      page['results'] = results
+    return page
+
+  def _Mutate(self, method, args):
+    """Returns the entities sent to a create* or update* call.
+
+    Args:
+      method: str The name of the operation, such as 'createUsers'.
+      args: list (name, value) tuples of the arguments, in order.
+
+    Returns:
+      dict|list The entity, or list of entities, sent, with an ID added to
+      created entities which have none.
+    """
+    if not args:
+      return []
+    entities = args[-1][1]
+    if isinstance(entities, list):
+      return [self._WithId(method, entity) for entity in entities]
+    return self._WithId(method, entities)
+
+  def _WithId(self, method, entity):
+    """Adds an ID to an entity sent to a create* call, if it has none.
+
+    Args:
+      method: str The name of the operation.
+      entity: dict The entity.
+
+    Returns:
+      dict The entity.
+    """
+    if (method.startswith('create') and isinstance(entity, dict) and
+        'id' not in entity):
+      entity = dict(entity)
+      entity['id'] = str(self._NewId())
+    return entity
+
+  def _NewId(self):
+    """Returns a new, unique ID.
+
+    Returns:
+      int The ID.
+    """
+    self._lock.acquire()
+    try:
+      self._next_id += 1
+      return self._next_id
+    finally:
+      self._lock.release()
+
+  def _RunReportJob(self, report_job):
+    """Starts a fake report job.
+
+    Args:
+      report_job: dict The report job sent.
+
+    Returns:
+      dict The report job, with its ID and status.
+    """
+    report_job = dict(report_job or {})
+    report_job['id'] = str(self._NewId())
+    self._lock.acquire()
+    try:
+      self._report_jobs[report_job['id']] = (time.time(), report_job)
+    finally:
+      self._lock.release()
+    report_job['reportJobStatus'] = 'IN_PROGRESS'
+    return report_job
+
+  def _GetReportJob(self, report_job_id):
+    """Returns a fake report job.
+
+    Args:
+      report_job_id: str The ID of the report job.
+
+    Returns:
+      dict The report job, with its current status, or None if unknown.
+    """
+    self._lock.acquire()
+    try:
+      if report_job_id not in self._report_jobs:
+        return None
+      started, report_job = self._report_jobs[report_job_id]
+    finally:
+      self._lock.release()
+    report_job = dict(report_job)
+    if time.time() - started >= self.report_latency:
+      report_job['reportJobStatus'] = 'COMPLETED'
+    else:
+      report_job['reportJobStatus'] = 'IN_PROGRESS'
+    return report_job
+
+  def _GetReportDownloadUrl(self, args):
+    """Returns the URL of a fake report, served by this server.
+
+    Args:
+      args: dict The arguments of the call.
+
+    Returns:
+      str The URL, or None if the report job is unknown.
+    """
+    report_job = self._GetReportJob(args.get('reportJobId'))
+    if report_job is None or report_job['reportJobStatus'] != 'COMPLETED':
+      return None
+    return '%s%s%s.%s.gz' % (self.GetUrl(), _REPORT_PATH, report_job['id'],
+                             args.get('exportFormat') or 'CSV_DUMP')
+
+  def GetReport(self, export_format):
+    """Returns a gzipped fake report.
+
+    Args:
+      export_format: str The export format, TSV or one of the CSV formats.
+
+    Returns:
+      str The gzipped report.
+    """
+    delimiter = export_format == 'TSV' and '\t' or ','
+    lines = [delimiter.join(['Dimension.DATE', 'Dimension.AD_UNIT_NAME',
+                             'Column.AD_SERVER_IMPRESSIONS',
+                             'Column.AD_SERVER_CTR'])]
+    for i in xrange(self.report_rows):
+      lines.append(delimiter.join(['2012-%02d-%02d' % (i / 28 % 12 + 1,
+                                                       i % 28 + 1),
+                                   'Ad unit %d' % (i % 50),
+                                   str(i * 7 % 1000), str(i % 100 / 100.0)]))
+    return _Gzip('\n'.join(lines) + '\n')
+
+  def GetWsdl(self, version, service_name):
+    """Returns a WSDL from disk, pointed at this server.
+
+    Args:
+      version: str The API version, such as 'v201211'.
+      service_name: str The name of the service, such as 'UserService'.
+
+    Returns:
+      str The WSDL, or None if there is no such file.
+    """
+    if not self.wsdl_dir:
+      return None
+    path = os.path.join(self.wsdl_dir, version, service_name + '.wsdl')
+    if not os.path.isfile(path):
+      return None
+    fh = open(path)
+    try:
+      return fh.read().replace(_LIVE_LOCATION,
+                               'location="%s' % self.GetUrl())
+    finally:
+      fh.close()
+
+
+class _FakeDfpRequestHandler(SOAPpy.SOAPRequestHandler):
+
+  """Handles the requests to a FakeDfpServer over keep-alive connections."""
+
+  protocol_version = 'HTTP/1.1'
+  # Buffers the status line, headers and body into a single write, which
+  # keeps Nagle's algorithm from holding back the response.
+  wbufsize = -1
+
+  def do_GET(self):
+    """Serves WSDLs and reports."""
+    path = self.path.split('?')[0]
+    body = None
+    if path.startswith(_API_PATH):
+      parts = path[len(_API_PATH):].split('/')
+      if len(parts) == 2:
+        body = self.server.GetWsdl(*parts)
+      content_type = 'text/xml; charset=utf-8'
+    elif path.startswith(_REPORT_PATH):
+      parts = path[len(_REPORT_PATH):].split('.')
+      if len(parts) == 3:
+        body = self.server.GetReport(parts[1])
+      content_type = 'application/x-gzip'
+    if body is None:
+      self._Reply(404, 'Not found.', 'text/plain')
+    else:
+      self._Reply(200, body, content_type, False)
+
+  def do_POST(self):
+    """Answers SOAP calls."""
+    start = time.time()
+    data = self.rfile.read(int(self.headers['Content-Length']))
+    if self.headers.get('Content-Encoding') == 'gzip':
+      data = gzip.GzipFile(fileobj=StringIO.StringIO(data)).read()
+    version = self.path.split('?')[0][len(_API_PATH):].split('/')[0]
+    request = SOAPpy.parseSOAPRPC(data)
+    values = request._asdict()
+    args = [(str(name), SOAPpy.simplify(values[name]))
+            for name in request._keys()]
+    if self.server.latency:
+      time.sleep(self.server.latency)
+    succeeded, body = self.server.Call(version, str(request._name), args)
+    envelope = _ENVELOPE % (_NAMESPACE % version, '%x' % self.server._NewId(),
+                            (time.time() - start) * 1000, body)
+    self._Reply(succeeded and 200 or 500, envelope, 'text/xml; charset=utf-8')
+
+  def _Reply(self, status, body, content_type, compress=True):
+    """Sends a response, gzipped if the client accepts it.
+
+    Args:
+      status: int The HTTP status code.
+      body: str The body of the response.
+      content_type: str The content type of the body.
+      [optional]
+      compress: bool Whether the body may be gzipped.
+    """
+    self.send_response(status)
+    self.send_header('Content-Type', content_type)
+    if compress and 'gzip' in self.headers.get('Accept-Encoding', ''):
+      body = _Gzip(body)
+      self.send_header('Content-Encoding', 'gzip')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+    self.wfile.flush()
+
+  def log_message(self, format, *args):
+    """Keeps the server quiet."""
+    pass
+
+
+def _Fault(namespace, error, field='id'):
+  """Returns the XML of a SOAP fault shaped like those the API sends.
+
+  Args:
+    namespace: str The namespace of the API version called.
+    error: str The error string, such as 'QuotaError.EXCEEDED_QUOTA'.
+    [optional]
+    field: str The field path of the error.
+
+  Returns:
+    str The XML of the fault.
+  """
+  return _FAULT % {'namespace': namespace, 'error': error,
+                   'field': saxutils.escape(field),
+                   'type': error.split('.')[0]}
+
+
+def _ToXml(name, value):
+  """Serializes a value as XML elements.
+
+  Args:
+    name: str The name of the element(s).
+    value: obj The value, a dict, list or scalar.
+
+  Returns:
+    str The XML.
+  """
+  if isinstance(value, list):
+    return ''.join([_ToXml(name, item) for item in value])
+  if isinstance(value, dict):
+    return '<%s>%s</%s>' % (name, ''.join([_ToXml(key, value[key])
+                                           for key in sorted(value)]), name)
+  if value is None:
+    return '<%s/>' % name
+  if isinstance(value, unicode):
+    value = value.encode('utf-8')
+  return '<%s>%s</%s>' % (name, saxutils.escape(str(value)), name)
+
+
+def _Gzip(data):
+  """Gzips a string.
+
+  Args:
+    data: str The string to compress.
+
+  Returns:
+    str The compressed string.
+  """
+  buf = StringIO.StringIO()
+  fh = gzip.GzipFile(fileobj=buf, mode='wb')
+  try:
+    fh.write(data)
+  finally:
+    fh.close()
+  return buf.getvalue()
+
+
+def GetTestClient(home, config=None, headers=None):
+  """Returns a DfpClient set up to call a FakeDfpServer.
+
+  Args:
+    home: str Directory to keep the client's files and logs in.
+    [optional]
+    config: dict Config values to set on top of the defaults.
+    headers: dict Headers to use instead of the defaults.
+
+  Returns:
+    DfpClient The client.
+  """
+  client_config = {
+      'home': home,
+      'log_home': home,
+      'strict': 'n',
+      'xml_parser': '2',
+      'wsdl_cache': 'n'
+  }
+  client_config.update(config or {})
+  if headers is None:
+    headers = {
+        'authToken': 'fake_token',
+        'applicationName': 'offline test',
+        'networkCode': '12345'
+    }
+  return DfpClient(headers, client_config, home)
+
+
+def main():
+  """Runs a server until interrupted."""
+  parser = optparse.OptionParser()
+  parser.add_option('--host', default='localhost')
+  parser.add_option('--port', type='int', default=8080)
+  parser.add_option('--wsdl_dir', help='Directory of <version>/<Service>.wsdl')
+  parser.add_option('--latency', type='float', default=0)
+  parser.add_option('--total_results', type='int',
+                    default=DEFAULT_TOTAL_RESULTS)
+  parser.add_option('--report_rows', type='int', default=DEFAULT_REPORT_ROWS)
+  parser.add_option('--report_latency', type='float', default=0)
+  options = parser.parse_args()[0]
+  server = FakeDfpServer((options.host, options.port), options.wsdl_dir,
+                         options.latency, options.total_results,
+                         options.report_rows, options.report_latency)
+  print 'Serving the DFP API at %s' % server.GetUrl()
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    server.server_close()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover the fake DFP server."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import gzip
+import os
+import StringIO
+import sys
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+import urllib2
+
+from adspygoogle.common import Utils
+from fake_dfp_server import FakeDfpServer
+
+
+class FakeDfpServerTest(unittest.TestCase):
+
+  """Unittest suite for FakeDfpServer, which needs no network access."""
+
+  def setUp(self):
+    """Prepare unittest."""
+    self.server = FakeDfpServer(total_results=3, report_rows=2)
+    self.server.Start()
+    self.url = self.server.GetUrl() + '/apis/ads/publisher/v201004/UserService'
+
+  def tearDown(self):
+    """Finalize unittest."""
+    self.server.Stop()
+
+  def __Post(self, body):
+    """Posts a SOAP request and returns the status and body of the response."""
+    request = urllib2.Request(self.url, body,
+                              {'Content-Type': 'text/xml; charset=utf-8'})
+    try:
+      response = urllib2.urlopen(request)
+      return response.code, response.read()
+    except urllib2.HTTPError, e:
+      return e.code, e.read()
+
+  def testGetByStatementAndFaults(self):
+    """Tests that statements are answered, and faults sent when injected."""
+    request = Utils.ReadFile(os.path.join('data',
+                                          'request_getusersbystatement.xml'))
+    status, body = self.__Post(request)
+    self.assertEqual(status, 200)
+    self.assertEqual(body.count('<results>'), 3)
+    self.assertTrue('<totalResultSetSize>3</totalResultSetSize>' in body)
+    self.assertTrue('<requestId>' in body)
+
+    self.server.InjectFaults(1, 'QuotaError.EXCEEDED_QUOTA')
+    status, body = self.__Post(request)
+    self.assertEqual(status, 500)
+    self.assertTrue('<errorString>QuotaError.EXCEEDED_QUOTA</errorString>'
+                    in body)
+    self.assertEqual(self.__Post(request)[0], 200)
+    self.assertEqual(self.server.GetCallCounts(), {'getUsersByStatement': 3})
+
+  def testReport(self):
+    """Tests that report jobs run and their reports can be downloaded."""
+    report_job_id = self.server.Call('v201211', 'runReportJob',
+                                     [('reportJob', {})])[1]
+    report_job_id = report_job_id.split('<id>')[1].split('</id>')[0]
+    succeeded, body = self.server.Call(
+        'v201211', 'getReportDownloadURL',
+        [('reportJobId', report_job_id), ('exportFormat', 'TSV')])
+    self.assertTrue(succeeded)
+    report_url = body.split('<rval>')[1].split('</rval>')[0]
+    report = gzip.GzipFile(fileobj=StringIO.StringIO(
+        urllib2.urlopen(report_url).read())).read()
+    self.assertEqual(len(report.splitlines()), 3)
+    self.assertEqual(report.splitlines()[0].count('\t'), 3)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,151 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover calls made by GenericDfpService."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import shutil
+import sys
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import tempfile
+import threading
+import time
+import unittest
+
+from adspygoogle.common import Utils
+from adspygoogle.dfp.DfpErrors import DfpApiError
+from fake_dfp_server import FakeDfpServer
+from fake_dfp_server import GetTestClient
+from fake_dfp_server import TEST_VERSION
+from fake_dfp_server import TEST_WSDL_DIR
+
+
+class GenericDfpServiceTest(unittest.TestCase):
+
+  """Unittest suite for GenericDfpService, run against a FakeDfpServer."""
+
+  def setUp(self):
+    """Prepare unittest."""
+    self.server = FakeDfpServer(wsdl_dir=TEST_WSDL_DIR, total_results=3)
+    self.server.Start()
+    self.home = tempfile.mkdtemp()
+    self.metrics = []
+
+  def tearDown(self):
+    """Finalize unittest."""
+    self.server.Stop()
+    shutil.rmtree(self.home, True)
+
+  def __GetService(self, metrics_callback):
+    """Returns a UserService whose calls are handed to a metrics callback."""
+    client = GetTestClient(self.home, {'metrics_callback': metrics_callback})
+    return client.GetUserService(self.server.GetUrl(), TEST_VERSION)
+
+  def testMetricsCallback(self):
+    """Tests that the metrics of calls, failed ones included, are handed out."""
+    service = self.__GetService(self.metrics.append)
+    service.GetUsersByStatement({'query': 'LIMIT 3'})
+    self.server.InjectFaults(1)
+    self.assertRaises(DfpApiError, service.GetUsersByStatement,
+                      {'query': 'LIMIT 3'})
+    self.assertEqual(len(self.metrics), 2)
+    self.assertEqual(self.metrics[0].method_name, 'getUsersByStatement')
+    self.assertEqual(self.metrics[0].tags, {'networkCode': '12345'})
+    self.assertEqual(self.metrics[0].error, None)
+    self.assertTrue(isinstance(self.metrics[1].error, DfpApiError))
+    self.assertTrue(self.metrics[1].request_id)
+
+  def testMetricsCallbackRunsWithoutLock(self):
+    """Tests that the callback runs once the service's lock is released."""
+
+    def TryLock(unused_metrics):
+      locked = service._lock.acquire(False)
+      if locked:
+        service._lock.release()
+      self.metrics.append(locked)
+
+    service = self.__GetService(TryLock)
+    service.GetUsersByStatement({'query': 'LIMIT 3'})
+    service.GetUsersByStatement({'query': 'LIMIT 3'})
+    self.assertEqual(self.metrics, [True, True])
+
+  def testMetricsCallbackError(self):
+    """Tests that an error raised by the callback does not fail the call."""
+
+    def Raise(metrics):
+      self.metrics.append(metrics)
+      raise ValueError('Callback failed')
+
+    service = self.__GetService(Raise)
+    response = service.GetUsersByStatement({'query': 'LIMIT 3'})
+    self.assertEqual(len(response[0]['results']), 3)
+    self.server.InjectFaults(1)
+    self.assertRaises(DfpApiError, service.GetUsersByStatement,
+                      {'query': 'LIMIT 3'})
+    self.assertEqual(len(self.metrics), 2)
+    fh = open(os.path.join(self.home, 'call_metrics.log'))
+    try:
+      self.assertTrue('ValueError: Callback failed' in fh.read())
+    finally:
+      fh.close()
+
+  def testAuthTokenRegeneratedOnce(self):
+    """Tests that concurrent calls finding the token expired log in once."""
+    logins = []
+
+    def GetAuthToken(email, *unused_args):
+      logins.append(email)
+      time.sleep(0.05)
+      return 'token %d' % len(logins)
+
+    get_auth_token = Utils.GetAuthToken
+    Utils.GetAuthToken = GetAuthToken
+    try:
+      client = GetTestClient(
+          self.home, {'concurrent': 'y'},
+          {'email': 'user@example.com', 'password': 'secret',
+           'applicationName': 'offline test', 'networkCode': '12345'})
+      service = client.GetUserService(self.server.GetUrl(), TEST_VERSION)
+      self.assertEqual(len(logins), 1)
+      client._config['auth_token_epoch'] = 0
+      start = threading.Event()
+      errors = []
+
+      def Call():
+        start.wait()
+        try:
+          service.GetUsersByStatement({'query': 'LIMIT 3'})
+        except Exception, e:
+          errors.append(e)
+
+      threads = [threading.Thread(target=Call) for _ in xrange(8)]
+      for thread in threads:
+        thread.start()
+      start.set()
+      for thread in threads:
+        thread.join()
+    finally:
+      Utils.GetAuthToken = get_auth_token
+    self.assertEqual(errors, [])
+    self.assertEqual(len(logins), 2)
+    self.assertEqual(client.GetAuthCredentials()['authToken'], 'token 2')
+    self.assertEqual(self.server.GetCallCounts(), {'getUsersByStatement': 8})
+
+
+if __name__ == '__main__':
+  unittest.main()